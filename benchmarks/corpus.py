@@ -0,0 +1,103 @@
+"""
+benchmarks/corpus.py
+
+Synthetic legal-document corpus for the benchmark harness.
+
+Three page kinds cover the pipeline's main code paths:
+- digital: born-digital text pages (Phase 3 fast path, text layer for Vision)
+- scanned: text rendered to an image with no text layer (full OCR)
+- underlined: scanned pages with an underlined caption/title (the PIL
+  underline-removal preprocessing path)
+
+Documents are deterministic for a given seed, so runs on different commits
+process identical input.
+"""
+
+import random
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import fitz
+
+KINDS = ('digital', 'scanned', 'underlined')
+DEFAULT_SIZES = (1, 5, 25)
+FULL_SIZES = (1, 5, 25, 100, 500)
+
+_TITLES = ['Motion to Compel Discovery', 'Answer and Counterclaim', 'Appraisal Demand',
+           'Hearing Transcript', 'Notice of Appearance', 'Order on Motion to Dismiss']
+_PARTIES = ['Reedy', 'Fremont Insurance Company', 'Clerk of Court']
+_WORDS = ('plaintiff defendant court motion order hearing discovery appraisal insurance policy '
+          'claim damages counsel exhibit pursuant section statute filed served respectfully '
+          'requests honorable judgment evidence record testimony witness agreement').split()
+
+_SCAN_DPI = 150
+
+
+def _paragraphs(rng: random.Random, count: int) -> str:
+    paras = []
+    for _ in range(count):
+        words = [rng.choice(_WORDS) for _ in range(rng.randint(40, 90))]
+        words[0] = words[0].capitalize()
+        paras.append(" ".join(words) + ".")
+    return "\n\n".join(paras)
+
+
+def _text_page(doc, rng: random.Random, title: str, page_num: int, underline: bool) -> None:
+    page = doc.new_page(width=612, height=792)  # US Letter
+    if page_num == 1:
+        page.insert_text((72, 72), f"IN THE CIRCUIT COURT - CASE NO. 9C1-{rng.randint(1000, 9999)}", fontsize=11)
+        page.insert_text((72, 100), title.upper(), fontsize=14)
+        if underline:
+            width = fitz.get_text_length(title.upper(), fontsize=14)
+            page.draw_line((72, 104), (72 + width, 104), width=1.5)
+        page.insert_text((72, 124), f"{rng.choice(_PARTIES)} v. {rng.choice(_PARTIES)}", fontsize=11)
+        top = 150
+    else:
+        top = 72
+    page.insert_textbox(fitz.Rect(72, top, 540, 720), _paragraphs(rng, 4), fontsize=10)
+    page.insert_text((300, 760), str(page_num), fontsize=9)
+
+
+def _rasterize(text_doc) -> "fitz.Document":
+    """Return an image-only copy of text_doc, like a scanner would produce."""
+    scanned = fitz.open()
+    for page in text_doc:
+        pix = page.get_pixmap(dpi=_SCAN_DPI, colorspace=fitz.csGRAY)
+        new_page = scanned.new_page(width=page.rect.width, height=page.rect.height)
+        new_page.insert_image(new_page.rect, stream=pix.tobytes("png"))
+    return scanned
+
+
+def make_document(path: Path, kind: str, pages: int, seed: int) -> None:
+    if kind not in KINDS:
+        raise ValueError(f"Unknown page kind: {kind}")
+    rng = random.Random(f"{seed}-{kind}-{pages}")
+    title = rng.choice(_TITLES)
+    doc = fitz.open()
+    for page_num in range(1, pages + 1):
+        _text_page(doc, rng, title, page_num, underline=(kind == 'underlined'))
+    if kind != 'digital':
+        scanned = _rasterize(doc)
+        doc.close()
+        doc = scanned
+    doc.save(str(path), garbage=3, deflate=True)
+    doc.close()
+
+
+def generate_corpus(out_dir: Path, sizes: Sequence[int] = DEFAULT_SIZES,
+                    kinds: Sequence[str] = KINDS, seed: int = 0) -> List[Dict]:
+    """Write one PDF per (kind, size) into out_dir; existing files are reused.
+
+    Filenames have no date prefix, so Phase 2 exercises its Gemini path.
+    Returns [{'file', 'kind', 'pages', 'bytes'}, ...].
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest = []
+    for kind in kinds:
+        for pages in sizes:
+            path = out_dir / f"Benchmark {kind.capitalize()} {pages:04d}p seed{seed}.pdf"
+            if not path.exists():
+                make_document(path, kind, pages, seed)
+            manifest.append({'file': path.name, 'kind': kind, 'pages': pages, 'bytes': path.stat().st_size})
+    return manifest
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+benchmarks/run_benchmarks.py
+
+End-to-end benchmark harness for doc-process-v31.
+
+Generates a synthetic corpus (benchmarks/corpus.py), runs the pipeline
+phases against the fake Vision, Gemini and GCS backends
+(docprocess_backends.py) and appends pages/sec, MB/sec and peak RSS per
+phase to a JSON history, so runs on different commits can be compared.
+
+Each phase runs in its own child process so peak RSS is per phase. Phase 3
+uses the real ocrmypdf/Ghostscript; if ocrmypdf is not installed it is
+skipped and 03_doc-clean is seeded with copies of the renamed PDFs.
+
+Usage:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --profile full --latency-ms 150 --error-rate 0.02
+    python benchmarks/run_benchmarks.py --sizes 1 25 --kinds scanned --phases clean convert
+    python benchmarks/run_benchmarks.py --sizes 1 --copies 3000 --latency-ms 200 --qps-limit 30 --pipeline
+"""
+
+import argparse
+import importlib.util
+import json
+import shutil
+import subprocess
+import sys
+import time
+import os
+from dataclasses import asdict
+from datetime import datetime
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+PHASES = ['directory', 'rename', 'clean', 'convert', 'format', 'gcs_upload']
+STREAMING_PHASES = ['clean', 'convert', 'format', 'gcs_upload']
+DEFAULT_HISTORY = BENCH_DIR / "history.json"
+DEFAULT_WORKDIR = BENCH_DIR / "_work"
+
+
+def _load_pipeline():
+    """Import doc-process-v31.py as a module (backend is chosen from the environment)."""
+    spec = importlib.util.spec_from_file_location("doc_process_v31", REPO_DIR / "doc-process-v31.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _peak_rss_mb():
+    """(self, children) peak resident set size in MB, or None where unavailable."""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / (1024 * 1024), None
+        except Exception:
+            return None, None
+    # ru_maxrss is bytes on macOS, KB elsewhere
+    scale = 1 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / (1024 * 1024)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale / (1024 * 1024)
+    return round(own, 1), round(children, 1)
+
+
+# === CHILD: run one phase ===
+def run_child(phase, root_dir, result_file):
+    # The parent put the fake backend settings in our environment
+    import docprocess_backends
+    pipeline = _load_pipeline()
+
+    phase_functions = {
+        'directory': pipeline.phase1_directory,
+        'rename': pipeline.phase2_rename,
+        'clean': pipeline.phase3_clean,
+        'convert': pipeline.phase4_convert,
+        'format': pipeline.phase5_format,
+        'gcs_upload': pipeline.phase6_gcs_upload,
+        'pipeline': lambda root: pipeline.run_pipeline(root, STREAMING_PHASES),
+    }
+    started = time.perf_counter()
+    with pipeline.metrics.phase(phase):
+        phase_functions[phase](Path(root_dir))
+    wall = time.perf_counter() - started
+    summary = pipeline.metrics.summary()
+    phase_summary = summary.get(phase, {})
+    if phase == 'pipeline':
+        # Files are counted per stage; a document is OK if it reached the last stage
+        phase_summary = dict(phase_summary, files_ok=summary.get('gcs_upload', {}).get('files_ok', 0),
+                             files_failed=sum(summary.get(s, {}).get('files_failed', 0) for s in STREAMING_PHASES))
+
+    own_rss, child_rss = _peak_rss_mb()
+    result = {
+        'wall_s': round(wall, 3),
+        'peak_rss_mb': own_rss,
+        'peak_child_rss_mb': child_rss,
+        'api_calls': dict(docprocess_backends.call_counts),
+        'api_errors': dict(docprocess_backends.error_counts),
+        'metrics': phase_summary,
+    }
+    with open(result_file, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+
+
+# === PARENT: orchestrate a run ===
+def _git_revision():
+    try:
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return rev + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def _seed_clean_dir(root_dir):
+    """Stand in for Phase 3 when ocrmypdf is unavailable: _r.pdf -> _o.pdf copies."""
+    clean_dir = root_dir / "03_doc-clean"
+    clean_dir.mkdir(parents=True, exist_ok=True)
+    for pdf in (root_dir / "02_doc-renamed").glob("*_r.pdf"):
+        shutil.copy2(pdf, clean_dir / f"{pdf.stem[:-2]}_o.pdf")
+
+
+def _load_history(path):
+    if path.exists():
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {'runs': []}
+
+
+def _print_comparison(run, previous):
+    print("\nBENCHMARK RESULTS" + (f" (vs {previous['commit']} {previous['timestamp']})" if previous else ""))
+    print("-" * 92)
+    print(f"{'Phase':<12} {'Wall s':>9} {'Pages/s':>10} {'MB/s':>9} {'RSS MB':>8} {'Child MB':>9} {'OK':>5} {'Fail':>5} {'Delta':>9}")
+    for name, p in run['phases'].items():
+        if 'skipped' in p:
+            print(f"{name:<12} {'skipped: ' + p['skipped']}")
+            continue
+        delta = ''
+        prev = previous['phases'].get(name) if previous else None
+        if prev and prev.get('pages_per_s'):
+            delta = f"{(p['pages_per_s'] / prev['pages_per_s'] - 1) * 100:+.1f}%"
+        print(f"{name:<12} {p['wall_s']:>9.2f} {p['pages_per_s']:>10.1f} {p['mb_per_s']:>9.2f} "
+              f"{p['peak_rss_mb'] or 0:>8.0f} {p['peak_child_rss_mb'] or 0:>9.0f} "
+              f"{p['files_ok']:>5} {p['files_failed']:>5} {delta:>9}")
+    print("-" * 92)
+
+
+def run_benchmark(args):
+    import corpus
+    from docprocess_backends import FakeConfig, FakeServiceConfig
+    from docprocess_workers import resolve_ocrmypdf
+
+    sizes = args.sizes or (corpus.FULL_SIZES if args.profile == 'full' else corpus.DEFAULT_SIZES)
+    workdir = Path(args.workdir)
+    corpus_dir = workdir / "corpus"
+    print(f"[INFO] Generating corpus: kinds={list(args.kinds)} sizes={list(sizes)} seed={args.seed}")
+    manifest = corpus.generate_corpus(corpus_dir, sizes=sizes, kinds=args.kinds, seed=args.seed)
+    if args.copies > 1:
+        # Load testing: the same documents under distinct names
+        manifest = [dict(doc, source=doc['file'], file=doc['file'].replace('.pdf', f" copy{i:05d}.pdf"))
+                    for doc in manifest for i in range(args.copies)]
+    total_pages = sum(d['pages'] for d in manifest)
+    total_mb = sum(d['bytes'] for d in manifest) / (1024 * 1024)
+    print(f"[OK] Corpus: {len(manifest)} documents, {total_pages} pages, {total_mb:.1f} MB")
+
+    # Fresh project directory per run
+    run_dir = workdir / f"run_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    root_dir = run_dir / "project"
+    root_dir.mkdir(parents=True)
+    for doc in manifest:
+        shutil.copy2(corpus_dir / doc.get('source', doc['file']), root_dir / doc['file'])
+
+    service = FakeServiceConfig(latency_ms=args.latency_ms, latency_per_kb_ms=args.latency_per_kb_ms,
+                                error_rate=args.error_rate, qps_limit=args.qps_limit)
+    config = FakeConfig(gemini=service, vision=service, gcs=service, seed=args.seed,
+                        gcs_root=str(run_dir / "gcs"))
+    child_env = dict(os.environ, **config.to_env(), DOCPROCESS_EXTRACT_MODE=args.extract_mode)
+    # Per-run cross-folder index, so earlier runs of the same corpus are not seen as duplicates
+    child_env['DOCPROCESS_INDEX_DB'] = str(run_dir / "document_index.sqlite3")
+    if args.copies > 1:
+        # Copies are byte-identical on purpose; Phase 1 dedup would move all but one
+        child_env['DOCPROCESS_DEDUP'] = '0'
+    phases = [p for p in PHASES if p in args.phases]
+    if args.pipeline:
+        # Streaming scheduler: Phases 3-6 as one measured step
+        phases = [p for p in phases if p not in STREAMING_PHASES] + ['pipeline']
+    ocr_available = Path(resolve_ocrmypdf()).exists() or shutil.which('ocrmypdf')
+
+    run = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_revision(),
+        'label': args.label,
+        'config': dict(asdict(config), gcs_root=None, extract_mode=args.extract_mode),
+        'corpus': {'seed': args.seed, 'kinds': list(args.kinds), 'sizes': list(sizes), 'copies': args.copies,
+                   'documents': len(manifest), 'pages': total_pages, 'mb': round(total_mb, 2)},
+        'phases': {},
+    }
+
+    for phase in phases:
+        if phase in ('clean', 'pipeline') and not ocr_available:
+            print("[WARN] ocrmypdf not found - skipping clean, seeding 03_doc-clean with renamed PDFs")
+            _seed_clean_dir(root_dir)
+            if phase == 'clean':
+                run['phases'][phase] = {'skipped': 'ocrmypdf not found'}
+                continue
+
+        print(f"[RUN] {phase}...")
+        result_file = run_dir / f"result_{phase}.json"
+        log_file = run_dir / f"{phase}.log"
+        with open(log_file, 'w', encoding='utf-8') as log:
+            proc = subprocess.run(
+                [sys.executable, str(Path(__file__).resolve()), '--child', phase, '--root', str(root_dir),
+                 '--result-file', str(result_file)],
+                stdout=log, stderr=subprocess.STDOUT, cwd=REPO_DIR, env=child_env)
+        if proc.returncode != 0 or not result_file.exists():
+            print(f"[FAIL] {phase} exited with code {proc.returncode} (see {log_file})")
+            run['phases'][phase] = {'skipped': f"failed (exit {proc.returncode})"}
+            continue
+
+        with open(result_file, 'r', encoding='utf-8') as f:
+            result = json.load(f)
+        wall = result['wall_s'] or 1e-9
+        phase_metrics = result['metrics']
+        run['phases'][phase] = {
+            'wall_s': result['wall_s'],
+            'pages_per_s': round(total_pages / wall, 2),
+            'mb_per_s': round(total_mb / wall, 3),
+            'peak_rss_mb': result['peak_rss_mb'],
+            'peak_child_rss_mb': result['peak_child_rss_mb'],
+            'files_ok': phase_metrics.get('files_ok', 0),
+            'files_failed': phase_metrics.get('files_failed', 0),
+            'api_calls': result['api_calls'],
+            'api_errors': result['api_errors'],
+            'totals': phase_metrics.get('totals', {}),
+        }
+        print(f"[OK] {phase}: {result['wall_s']:.2f}s")
+
+    history_path = Path(args.history)
+    history = _load_history(history_path)
+    comparable = [r for r in history['runs'] if r['corpus'] == run['corpus'] and r['config'] == run['config']]
+    _print_comparison(run, comparable[-1] if comparable else None)
+
+    history['runs'].append(run)
+    history_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(history_path, 'w', encoding='utf-8') as f:
+        json.dump(history, f, indent=2)
+    print(f"[OK] Appended to {history_path}")
+
+    if not args.keep:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+
+def main():
+    import corpus
+    parser = argparse.ArgumentParser(description='doc-process-v31 benchmark harness')
+    parser.add_argument('--profile', choices=['quick', 'full'], default='quick',
+                        help='quick: 1/5/25-page documents; full: adds 100 and 500 pages')
+    parser.add_argument('--sizes', type=int, nargs='+', help='Override document page counts')
+    parser.add_argument('--kinds', nargs='+', choices=corpus.KINDS, default=list(corpus.KINDS))
+    parser.add_argument('--phases', nargs='+', choices=PHASES, default=PHASES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Fake backend delay per API call')
+    parser.add_argument('--latency-per-kb-ms', type=float, default=0.0, help='Fake backend delay per KB of payload')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of fake API calls that fail with 429')
+    parser.add_argument('--qps-limit', type=float, default=0.0, help='Fake per-service requests/second quota (0 = none)')
+    parser.add_argument('--extract-mode', choices=['vision', 'local-textlayer', 'auto'], default='vision',
+                        help='Phase 4 page source passed to the pipeline (DOCPROCESS_EXTRACT_MODE)')
+    parser.add_argument('--copies', type=int, default=1, help='Replicate each corpus document N times (load testing)')
+    parser.add_argument('--pipeline', action='store_true', help='Run clean..gcs_upload through the streaming scheduler')
+    parser.add_argument('--label', type=str, default='', help='Free-form label stored with the run')
+    parser.add_argument('--workdir', type=str, default=str(DEFAULT_WORKDIR))
+    parser.add_argument('--history', type=str, default=str(DEFAULT_HISTORY))
+    parser.add_argument('--keep', action='store_true', help='Keep the run directory (outputs and phase logs)')
+    # Internal: run a single phase in a child process
+    parser.add_argument('--child', choices=PHASES + ['pipeline'], help=argparse.SUPPRESS)
+    parser.add_argument('--root', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.root, args.result_file)
+    else:
+        run_benchmark(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -24,45 +24,86 @@ import subprocess
 import sys
 import os
 import argparse
-import google.generativeai as genai
-from google.cloud import vision
-from google.cloud import storage
 import re
 import json
-import PyPDF2
 import time
 import csv
+import hashlib
 import concurrent.futures
 from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
-from dataclasses import dataclass
 from typing import Optional, Dict, List
 import threading
+from docprocess_workers import (OCR_SECONDS_PER_PAGE, ProcessingResult, compress_pdf, extract_first_page_text,
+                                init_worker, process_clean_pdf, resolve_ghostscript, run_subprocess)
+from docprocess_subprocess import timeout_for
+from docprocess_scheduler import PipelineScheduler, Stage
+from docprocess_journal import get_journal, atomic_output, atomic_write_text, text_sha256, STARTED, DONE, FAILED
+from docprocess_metrics import FileMetrics, attach_metrics, measure, metrics
+import docprocess_tracing
+from docprocess_tracing import span
+from docprocess_gemini import generate_with_resume
+from docprocess_cpubudget import CoreBudget, cpu_budget, ocr_workers, tool_env
+from docprocess_collect import (DROPPED as COLLECT_DROPPED, MOVED as COLLECT_MOVED, SUFFIXED as COLLECT_SUFFIXED,
+                                collect_files, collect_workers)
+from docprocess_dedup import DEDUP_ENV, dedup_enabled, document_signature, find_duplicates
+from docprocess_index import get_index
+from docprocess_materialize import materialize
+from docprocess_metadata import extract_metadata, min_confidence as min_metadata_confidence
+from docprocess_textlayer import EXTRACT_MODE_ENV, EXTRACT_MODES, plan_pages, resolve_extract_mode
 
-# === CONFIGURATION ===
-# Load only required secrets efficiently
-print("[INFO] Loading required secrets from local file")
+# Phase 3 workers started with the spawn method re-run this script as
+# __mp_main__ before unpickling their task. Their task lives in
+# docprocess_workers, so skip the Google SDKs and secrets loading there.
+_IS_SPAWNED_WORKER = __name__ == "__mp_main__"
+
+def _requested_backend(argv, default):
+    """--backend from the command line, read before argparse so a fake run never imports the Google SDKs"""
+    for i, arg in enumerate(argv):
+        value = arg.split('=', 1)[1] if arg.startswith('--backend=') else (
+            argv[i + 1] if arg == '--backend' and i + 1 < len(argv) else None)
+        if value in BACKENDS:
+            return value
+    return default
 
+if not _IS_SPAWNED_WORKER:
+    # genai/vision/storage are the real Google SDKs or in-process fakes (--backend / $DOCPROCESS_BACKEND)
+    from docprocess_backends import BACKEND_ENV, BACKENDS, load_backends
+    BACKEND = os.environ.get(BACKEND_ENV) or 'google'
+    if __name__ == "__main__":
+        BACKEND = _requested_backend(sys.argv[1:], BACKEND)
+    genai, vision, storage = load_backends(BACKEND)
+    import PyPDF2
+
+# === CONFIGURATION ===
 _SECRETS_FILE = Path("C:/DevWorkspace/01_secrets/secrets_global")
-if _SECRETS_FILE.exists():
-    # Only load the 3 secrets we actually need
-    required_secrets = {
-        'GOOGLEAISTUDIO_API_KEY': '',
-        'GOOGLE_APPLICATION_CREDENTIALS': '',
-        'GCS_BUCKET': 'fremont-1'  # Default value
-    }
-    
-    with open(_SECRETS_FILE, 'r') as f:
-        for line in f:
-            if '=' in line and not line.startswith('#'):
-                key, value = line.strip().split('=', 1)
-                key = key.strip()
-                if key in required_secrets:
-                    os.environ[key] = value.strip().strip('"')
-                    print(f"[OK] Loaded: {key}")
-    
-    print(f"[OK] Loaded {len(required_secrets)} required secrets")
-else:
-    print(f"[WARN] Secrets file not found: {_SECRETS_FILE}")
+
+def _load_required_secrets():
+    """Load only the 3 required secrets from the local secrets file"""
+    print("[INFO] Loading required secrets from local file")
+    
+    if _SECRETS_FILE.exists():
+        # Only load the 3 secrets we actually need
+        required_secrets = {
+            'GOOGLEAISTUDIO_API_KEY': '',
+            'GOOGLE_APPLICATION_CREDENTIALS': '',
+            'GCS_BUCKET': 'fremont-1'  # Default value
+        }
+        
+        with open(_SECRETS_FILE, 'r') as f:
+            for line in f:
+                if '=' in line and not line.startswith('#'):
+                    key, value = line.strip().split('=', 1)
+                    key = key.strip()
+                    if key in required_secrets:
+                        os.environ[key] = value.strip().strip('"')
+                        print(f"[OK] Loaded: {key}")
+        
+        print(f"[OK] Loaded {len(required_secrets)} required secrets")
+    else:
+        print(f"[WARN] Secrets file not found: {_SECRETS_FILE}")
+
+if not _IS_SPAWNED_WORKER:
+    _load_required_secrets()
 
 GEMINI_API_KEY = os.environ.get('GOOGLEAISTUDIO_API_KEY', '')
 GOOGLE_APPLICATION_CREDENTIALS = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS', '')
@@ -85,6 +126,12 @@ CASE_ACRONYMS = ["9c1", "9c2", "3c1", "3c2", "9c_powers"]
 MAX_WORKERS_IO = 5  # For API calls (Gemini, Google Vision)
 MAX_WORKERS_CPU = 5  # For OCR operations (optimized for 24-core system)
 
+# Largest Vision inline request; bigger page batches fall back to the PDF text layer
+VISION_MAX_PAYLOAD_BYTES = 35 * 1024 * 1024
+
+# Phase 4 page source: vision, local-textlayer or auto ($DOCPROCESS_EXTRACT_MODE or --extract-mode)
+EXTRACT_MODE = resolve_extract_mode()
+
 
 # === CUSTOM EXCEPTIONS ===
 class DocumentProcessingError(Exception):
@@ -108,18 +155,13 @@ class FormattingError(DocumentProcessingError):
     pass
 
 # === DATA CLASSES ===
-@dataclass
-class ProcessingResult:
-    """Result of processing a single file"""
-    file_name: str
-    status: str  # 'OK', 'FAILED', 'SKIPPED', 'WARNING'
-    error: Optional[str] = None
-    metadata: Optional[Dict] = None
+# ProcessingResult is defined in docprocess_workers so Phase 3 worker
+# processes can return it without importing this script.
 
 # === GLOBAL REPORT TRACKING ===
 report_data = {
     'preflight': {}, 'directory': {}, 'rename': [], 
-    'clean': [], 'convert': [], 'format': [], 'verify': []
+    'clean': [], 'convert': [], 'format': [], 'verify': [], 'reuse': []
 }
 
 # === TIMEOUT INPUT HELPER ===
@@ -155,8 +197,13 @@ def preflight_checks(skip_clean_check=False, root_dir=None):
     
     all_ok = True
     
+    # Fake backends need no credentials
+    if BACKEND == 'fake':
+        print("[OK] Gemini / Google Vision / GCS: fake backend (offline)")
+        report_data['preflight']['gemini_api'] = 'FAKE'
+        report_data['preflight']['google_vision'] = 'FAKE'
     # Check Gemini API Key
-    if GEMINI_API_KEY:
+    elif GEMINI_API_KEY:
         print("[OK] Gemini API Key: Present")
         report_data['preflight']['gemini_api'] = 'OK'
     else:
@@ -165,7 +212,9 @@ def preflight_checks(skip_clean_check=False, root_dir=None):
         all_ok = False
     
     # Check Google Cloud credentials
-    if GOOGLE_APPLICATION_CREDENTIALS and Path(GOOGLE_APPLICATION_CREDENTIALS).exists():
+    if BACKEND == 'fake':
+        pass
+    elif GOOGLE_APPLICATION_CREDENTIALS and Path(GOOGLE_APPLICATION_CREDENTIALS).exists():
         print("[OK] Google Cloud Vision: Configured")
         report_data['preflight']['google_vision'] = 'OK'
     else:
@@ -202,7 +251,7 @@ def preflight_checks(skip_clean_check=False, root_dir=None):
     
     # Check Ghostscript (skip for convert/format/verify phases)
     if not skip_clean_check:
-        if shutil.which('gswin64c') or shutil.which('gs'):
+        if resolve_ghostscript():
             print("[OK] Ghostscript: Installed")
             report_data['preflight']['ghostscript'] = 'OK'
         else:
@@ -305,7 +354,8 @@ def preflight_checks(skip_clean_check=False, root_dir=None):
     print("-" * 80)
     if all_ok:
         print("[OK] All requirements met - Ready to process")
-        print(f"[INFO] Parallel processing: {MAX_WORKERS_IO} workers (I/O), {MAX_WORKERS_CPU} workers (CPU)")
+        print(f"[INFO] Parallel processing: {MAX_WORKERS_IO} workers (I/O), {MAX_WORKERS_CPU} workers (PDF scans), "
+              f"OCR/Ghostscript: {ocr_workers()} workers sharing a {cpu_budget()}-core budget")
         return True
     else:
         print("[FAIL] Missing requirements - Cannot proceed")
@@ -349,7 +399,7 @@ def phase1_directory(root_dir):
     
     original_dir = root_dir / "01_doc-original"
     
-    pdf_files = list(root_dir.glob("*.pdf"))
+    pdf_files = sorted(root_dir.glob("*.pdf"))
     
     if not pdf_files:
         print("[SKIP] No PDF files found in root directory")
@@ -357,10 +407,7 @@ def phase1_directory(root_dir):
         # Continue to next phase - may have files already in 01_doc-original
         return
     
-    # Sort by file size (smallest to largest) for better progress visibility
-    pdf_files.sort(key=lambda x: x.stat().st_size)
-    
-    moved_count = 0
+    moves = []
     for pdf in pdf_files:
         # Always add _d suffix (remove any existing suffix first)
         base_name = pdf.stem
@@ -371,173 +418,221 @@ def phase1_directory(root_dir):
                 base_name = base_name[:-len(suffix)]
                 break
         
-        new_name = f"{base_name}_d.pdf"
-        
-        target_path = original_dir / new_name
-        
-        # Avoid overwriting if file already exists
-        if target_path.exists():
-            print(f"[SKIP] {new_name} - already exists")
-            continue
-        
-        try:
+        moves.append((pdf, original_dir / f"{base_name}_d.pdf"))
+    
+    # Concurrent moves (rename on the same filesystem); name clashes resolved by content hash
+    print(f"[INFO] Collecting {len(moves)} PDFs with {collect_workers()} workers...")
+    moved_count = 0
+    dropped_count = 0
+    
+    def report_move(result):
+        nonlocal moved_count, dropped_count
+        if result.status in (COLLECT_MOVED, COLLECT_SUFFIXED):
+            moved_count += 1
+            note = " (name taken by a different file)" if result.status == COLLECT_SUFFIXED else ""
+            print(f"[OK] Moved: {result.source.name} -> {result.target.name}{note}")
+        elif result.status == COLLECT_DROPPED:
+            dropped_count += 1
+            print(f"[SKIP] {result.source.name} - identical to {result.target.name}, removed")
+        else:
             # NOTE: Files with very long paths (>260 chars) or special characters like brackets
             # may fail to move on Windows. User should manually move these to 01_doc-original first.
-            
-            source_str = str(pdf)
-            target_str = str(target_path)
-            
-            # Try normal move first
-            shutil.move(source_str, target_str)
-            print(f"[OK] Moved: {pdf.name} -> {new_name}")
-            moved_count += 1
-            
-        except (OSError, FileNotFoundError) as e:
-            # Windows path length limit or special character issue
-            print(f"[WARN] Cannot auto-move (path too long or special chars): {pdf.name[:80]}")
+            print(f"[WARN] Cannot auto-move ({result.error}): {result.source.name[:80]}")
             print(f"       Please manually move to 01_doc-original\\ with _d suffix")
-            continue
+    
+    collect_files(moves, on_result=report_move)
     
     report_data['directory']['moved'] = moved_count
+    report_data['directory']['dropped'] = dropped_count
     report_data['directory']['total'] = len(pdf_files)
     print(f"\n[OK] Directoryd {moved_count} PDF files")
+    if dropped_count:
+        print(f"[INFO] Removed {dropped_count} PDFs already in 01_doc-original with identical content")
     
-    # ALWAYS run duplicate detection as standalone subprocess
-    # COMMENTED OUT - Too slow for now
-    # detect_duplicates(root_dir)
+    # Duplicate detection (exact hash + MinHash/LSH); $DOCPROCESS_DEDUP=0 or --no-dedup disables
+    if dedup_enabled():
+        detect_duplicates(root_dir)
 
 def detect_duplicates(root_dir):
-    """Standalone subprocess to detect and move duplicate PDFs using Gemini"""
+    """Detect and move duplicate PDFs: exact hash, MinHash/LSH text and perceptual page hashes,
+    within the folder and against the cross-folder index; Gemini only for ambiguous pairs"""
     print("\n[DUPLICATE DETECTION] Analyzing PDFs for duplicate content...")
     print("-" * 80)
     
     original_dir = root_dir / "01_doc-original"
-    all_pdfs = [f for f in original_dir.glob("*_d.pdf") if not f.parent.name.startswith('_')]
+    all_pdfs = sorted(f for f in original_dir.glob("*_d.pdf") if not f.parent.name.startswith('_'))
     
-    if len(all_pdfs) < 2:
-        print("[SKIP] Less than 2 PDFs - no duplicates possible")
+    if not all_pdfs:
+        print("[SKIP] No PDFs - no duplicates possible")
         return
     
-    # Configure Gemini for duplicate detection
-    genai.configure(api_key=GEMINI_API_KEY)
-    model = genai.GenerativeModel(MODEL_NAME)
-    
-    # Convert content fingerprints for all PDFs
-    pdf_fingerprints = {}
-    
-    for pdf in all_pdfs:
-        print(f"Analyzing: {pdf.name}...")
-        try:
-            # Convert first page text as fingerprint
-            doc = fitz.open(str(pdf))
-            first_page_text = doc[0].get_text()[:2000]  # First 2000 chars
-            doc.close()
-            
-            # Use Gemini to create content fingerprint
-            prompt = f"""Analyze this document excerpt and create a brief fingerprint (2-3 sentences) describing:
-1. Document type (complaint, motion, letter, etc.)
-2. Key parties or entities mentioned
-3. Main subject matter or date range
-
-Document excerpt:
-{first_page_text}
-
-Return ONLY the fingerprint, no other text."""
-            
-            response = model.generate_content(prompt)
-            fingerprint = response.text.strip()
-            pdf_fingerprints[pdf] = fingerprint
-            
-        except Exception as e:
-            print(f"  [WARN] Could not analyze {pdf.name}: {e}")
-            pdf_fingerprints[pdf] = f"ERROR: {str(e)}"
+    # Hash, MinHash and perceptual-hash signatures in parallel (each PDF is read once)
+    signatures = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(MAX_WORKERS_CPU, len(all_pdfs)),
+                                                initializer=init_worker) as executor:
+        for sig in executor.map(document_signature, all_pdfs):
+            if sig.error:
+                print(f"  [WARN] Could not analyze {Path(sig.path).name}: {sig.error}")
+            signatures.append(sig)
+    by_path = {sig.path: sig for sig in signatures}
+    
+    pairs = find_duplicates(signatures)
+    model = None
+    if any(pair.kind == 'ambiguous' for pair in pairs):
+        # Configure Gemini only when a pair needs confirming
+        genai.configure(api_key=GEMINI_API_KEY)
+        model = genai.GenerativeModel(MODEL_NAME)
     
-    # Compare fingerprints to find duplicates
     duplicate_dir = original_dir / "_duplicate"
+    duplicate_dir.mkdir(exist_ok=True)
     duplicates_found = []
-    processed = set()
+    visual_matches = []
+    moved = set()
     
-    for i, (pdf1, fp1) in enumerate(pdf_fingerprints.items()):
-        if pdf1 in processed:
+    for pair in pairs:
+        if pair.keep in moved or pair.duplicate in moved:
             continue
-            
-        for pdf2, fp2 in list(pdf_fingerprints.items())[i+1:]:
-            if pdf2 in processed:
+        keep, duplicate = Path(pair.keep), Path(pair.duplicate)
+        if pair.kind == 'visual':
+            # Thumbnails alone are not proof (no text to confirm): report, keep both
+            visual_matches.append({'file': duplicate.name, 'looks_like': keep.name,
+                                   'similarity': pair.similarity})
+            print(f"  [INFO] {duplicate.name} looks like {keep.name} (visual, similarity "
+                  f"{pair.similarity:.2f}) - not moved, review manually")
+            continue
+        if pair.kind == 'ambiguous' and not _confirm_duplicate_with_gemini(
+                model, by_path[pair.keep], by_path[pair.duplicate]):
+            continue
+        if not _move_duplicate(duplicate, duplicate_dir):
+            continue
+        moved.add(pair.duplicate)
+        duplicates_found.append({'file': duplicate.name, 'kept': keep.name, 'kind': pair.kind,
+                                 'similarity': pair.similarity})
+        print(f"  [DUPLICATE] Moved {duplicate.name} (keeping {keep.name}, {pair.kind}, "
+              f"similarity {pair.similarity:.2f})")
+    
+    # Cross-folder index: documents already kept in another folder (same bytes) stay in this
+    # folder, and Phases 3-6 reuse that folder's artifacts instead of recomputing
+    known_documents = []
+    index = get_index()
+    if index is not None:
+        for sig in signatures:
+            if sig.error or sig.path in moved:
                 continue
-            
-            # Ask Gemini if these are duplicates
-            comparison_prompt = f"""Compare these two document fingerprints and determine if they represent the SAME document (duplicate content).
+            match = index.find_duplicate(sig)
+            if match is not None and match.kind == 'visual':
+                # Same look, unconfirmed content: reusing that scan's OCR/Gemini output could be wrong
+                visual_matches.append({'file': Path(sig.path).name, 'looks_like': match.path,
+                                       'similarity': match.similarity})
+                print(f"  [INFO] {Path(sig.path).name} looks like {match.path} (visual, similarity "
+                      f"{match.similarity:.2f}) - processed normally, review manually")
+            elif match is not None:
+                index.add_alias(sig.sha256, match.sha256)
+                known_documents.append({'file': Path(sig.path).name, 'matches': match.path, 'kind': match.kind,
+                                        'similarity': match.similarity})
+                print(f"  [KNOWN] {Path(sig.path).name} matches {match.path} ({match.kind}, "
+                      f"similarity {match.similarity:.2f}) - processed artifacts will be reused")
+            index.add(sig)
+    
+    report_data['directory']['duplicates'] = duplicates_found
+    report_data['directory']['known'] = known_documents
+    report_data['directory']['visual_matches'] = visual_matches
+    if duplicates_found:
+        print(f"\n[OK] Found and moved {len(duplicates_found)} duplicate PDFs to _duplicate/")
+    else:
+        print(f"\n[OK] No duplicates found - all {len(all_pdfs)} PDFs are unique")
+
+def _move_duplicate(duplicate, duplicate_dir):
+    """Move a duplicate PDF into _duplicate/ (counter suffix on name clash); False on failure"""
+    target = duplicate_dir / duplicate.name
+    counter = 2
+    while target.exists():
+        target = duplicate_dir / f"{duplicate.stem}_{counter}{duplicate.suffix}"
+        counter += 1
+    try:
+        shutil.move(str(duplicate), str(target))
+    except OSError as e:
+        print(f"  [WARN] Could not move duplicate {duplicate.name}: {e}")
+        return False
+    return True
+
+def _confirm_duplicate_with_gemini(model, sig1, sig2):
+    """Ask Gemini whether two near-duplicate candidates are the same document"""
+    name1, name2 = Path(sig1.path).name, Path(sig2.path).name
+    comparison_prompt = f"""Compare the first pages of these two documents and determine if they are the SAME document (duplicate content).
 
-Document 1 ({pdf1.name}):
-{fp1}
+Document 1 ({name1}, {sig1.page_count} pages):
+{sig1.text}
 
-Document 2 ({pdf2.name}):
-{fp2}
+Document 2 ({name2}, {sig2.page_count} pages):
+{sig2.text}
 
 Answer ONLY with "DUPLICATE" if they are the same document, or "DIFFERENT" if they are different documents."""
-            
-            try:
-                response = model.generate_content(comparison_prompt)
-                result = response.text.strip().upper()
-                
-                if "DUPLICATE" in result:
-                    # Move the longer filename to _duplicate (likely has more metadata)
-                    if len(pdf2.name) > len(pdf1.name):
-                        duplicate = pdf2
-                        keep = pdf1
-                    else:
-                        duplicate = pdf1
-                        keep = pdf2
-                    
-                    # Move duplicate
-                    target = duplicate_dir / duplicate.name
-                    shutil.move(str(duplicate), str(target))
-                    duplicates_found.append(duplicate.name)
-                    processed.add(duplicate)
-                    print(f"  [DUPLICATE] Moved {duplicate.name} (keeping {keep.name})")
-                    
-            except Exception as e:
-                print(f"  [WARN] Could not compare {pdf1.name} and {pdf2.name}: {e}")
     
-    if duplicates_found:
-        print(f"\n[OK] Found and moved {len(duplicates_found)} duplicate PDFs to _duplicate/")
-    else:
-        print(f"\n[OK] No duplicates found - all {len(all_pdfs)} PDFs are unique")
+    try:
+        with span('gemini.generate_content', phase='directory', file=name2,
+                  bytes_in=len(comparison_prompt.encode('utf-8'))):
+            response = model.generate_content(comparison_prompt)
+        return "DUPLICATE" in response.text.strip().upper()
+    except Exception as e:
+        print(f"  [WARN] Could not compare {name1} and {name2}: {e}")
+        return False
 
 # === PHASE 2: RENAME - Intelligent file renaming ===
-def convert_metadata_with_gemini(pdf_path, model):
-    """Use Gemini to analyze PDF and convert date/party/description"""
+_METADATA_FIELDS = """  "date": "YYYYMMDD format - document date or filing date",
+  "party": "Party acronym (RR=Reedy, FIC=Fremont Insurance, Court, Clerk)",
+  "case": "Case number acronym (9c1, 9c2, 3c1, 3c2, etc.) if found",
+  "description": "Short hyphenated description (2-4 words, use hyphens not spaces)\""""
+
+_METADATA_EXAMPLES = """Examples of good descriptions:
+- "Motion-Venue-Change"
+- "Appraisal-Demand"
+- "Answer-Counterclaim"
+- "Hearing-Transcript\""""
+
+# Documents per batched Phase 2 metadata call (200 undated files -> ~10 calls)
+RENAME_BATCH_SIZE = 20
+
+def convert_metadata_with_gemini(pdf_path, model, m=None, first_page_text=None):
+    """Use Gemini to analyze PDF and convert date/party/description.
+    
+    If a FileMetrics is passed, API calls, retries and tokens are counted on it.
+    first_page_text skips re-reading the PDF when the excerpt is already known.
+    """
     import time
     
-    max_retries = 3
-    for attempt in range(max_retries):
+    if first_page_text is None:
         try:
-            # Convert first page text
-            doc = fitz.open(pdf_path)
-            first_page_text = doc[0].get_text()[:2000]  # First 2000 chars
-            doc.close()
-            
-            prompt = f"""Analyze this legal document first page and convert metadata in JSON format:
+            with fitz.open(pdf_path) as doc:
+                first_page_text = doc[0].get_text()
+        except Exception as e:
+            print(f"  [WARN] Could not read first page of {pdf_path.name}: {e}")
+            return None
+    first_page_text = first_page_text[:2000]  # First 2000 chars
+    
+    prompt = f"""Analyze this legal document first page and convert metadata in JSON format:
 
 {first_page_text}
 
 Convert and return ONLY a JSON object with these fields:
 {{
-  "date": "YYYYMMDD format - document date or filing date",
-  "party": "Party acronym (RR=Reedy, FIC=Fremont Insurance, Court, Clerk)",
-  "case": "Case number acronym (9c1, 9c2, 3c1, 3c2, etc.) if found",
-  "description": "Short hyphenated description (2-4 words, use hyphens not spaces)"
+{_METADATA_FIELDS}
 }}
 
-Examples of good descriptions:
-- "Motion-Venue-Change"
-- "Appraisal-Demand"
-- "Answer-Counterclaim"
-- "Hearing-Transcript"
+{_METADATA_EXAMPLES}
 
 Return ONLY valid JSON, no explanations."""
-
-            response = model.generate_content(prompt)
+    
+    max_retries = 3
+    for attempt in range(max_retries):
+        if m is not None and attempt > 0:
+            m.add(retries=1)
+        try:
+            with span('gemini.generate_content', phase='rename', file=pdf_path.name,
+                      attempt=attempt + 1, bytes_in=len(prompt.encode('utf-8'))):
+                response = model.generate_content(prompt)
+            if m is not None:
+                _count_gemini_usage(m, response)
             result_text = response.text.strip()
             
             # Convert JSON from response
@@ -545,11 +640,7 @@ Return ONLY valid JSON, no explanations."""
                 json_start = result_text.find('{')
                 json_end = result_text.rfind('}') + 1
                 json_str = result_text[json_start:json_end]
-                metadata = json.loads(json_str)
-                
-                # Small delay between API calls
-                time.sleep(0.5)
-                return metadata
+                return json.loads(json_str)
             else:
                 return None
                 
@@ -563,6 +654,178 @@ Return ONLY valid JSON, no explanations."""
     
     return None
 
+def convert_metadata_batch_with_gemini(excerpts, model, m=None):
+    """Convert metadata for several documents in one Gemini call.
+    
+    excerpts is a list of (pdf_path, first_page_text). Returns
+    {pdf_path: metadata} for the documents the model answered; callers fall
+    back to convert_metadata_with_gemini for the rest.
+    """
+    import time
+    
+    sections = []
+    for i, (pdf_path, text) in enumerate(excerpts, 1):
+        sections.append(f"=== DOCUMENT {i} ===\n{text[:2000]}")
+    documents = "\n\n".join(sections)
+    
+    prompt = f"""Analyze the first pages of these {len(excerpts)} legal documents and convert metadata in JSON format:
+
+{documents}
+
+Convert and return ONLY a JSON array with one object per document, in any order:
+[
+  {{
+  "document": "Document number from its === DOCUMENT N === heading",
+{_METADATA_FIELDS}
+  }}
+]
+
+{_METADATA_EXAMPLES}
+
+Return ONLY valid JSON, no explanations."""
+    
+    max_retries = 3
+    for attempt in range(max_retries):
+        if m is not None and attempt > 0:
+            m.add(retries=1)
+        try:
+            with span('gemini.generate_content', phase='rename', documents=len(excerpts),
+                      attempt=attempt + 1, bytes_in=len(prompt.encode('utf-8'))):
+                response = model.generate_content(prompt)
+            if m is not None:
+                _count_gemini_usage(m, response)
+            result_text = response.text.strip()
+            
+            if '[' not in result_text:
+                return {}
+            entries = json.loads(result_text[result_text.find('['):result_text.rfind(']') + 1])
+            results = {}
+            for entry in entries:
+                if not isinstance(entry, dict):
+                    continue
+                try:
+                    index = int(entry.get('document'))
+                except (TypeError, ValueError):
+                    continue
+                if 1 <= index <= len(excerpts):
+                    results[excerpts[index - 1][0]] = entry
+            return results
+        
+        except Exception as e:
+            if attempt < max_retries - 1:
+                print(f"  [WARN] Batch attempt {attempt + 1} failed, retrying in 3 seconds...")
+                time.sleep(3)
+            else:
+                print(f"  [WARN] Gemini batch convertion failed after {max_retries} attempts: {e}")
+                return {}
+    
+    return {}
+
+def _extract_first_pages(pdf_files):
+    """First-page text for each PDF, read in a process pool. Returns {pdf: text}."""
+    excerpts = {}
+    if not pdf_files:
+        return excerpts
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(MAX_WORKERS_CPU, len(pdf_files)),
+                                                initializer=init_worker) as executor:
+        futures = {executor.submit(extract_first_page_text, pdf): pdf for pdf in pdf_files}
+        for future in concurrent.futures.as_completed(futures):
+            pdf = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = ProcessingResult(file_name=pdf.name, status='FAILED', error=str(e))
+            if result.status == 'OK':
+                excerpts[pdf] = result.metadata['text']
+            else:
+                print(f"  [WARN] Could not read first page of {pdf.name}: {result.error}")
+    return excerpts
+
+def convert_metadata_for_files(pdf_files, model):
+    """Convert rename metadata for many PDFs, locally where possible, else with Gemini.
+    
+    First pages are read in parallel and run through the local rule-based
+    extractor; documents whose date confidence reaches the threshold need no
+    API call. The rest are sent RENAME_BATCH_SIZE documents per call on
+    MAX_WORKERS_IO threads, and any document a batch did not answer is
+    retried alone on the same pool. Returns {pdf: (metadata, metrics_dict)};
+    a batch's metrics are counted on its first document.
+    """
+    excerpts = _extract_first_pages(pdf_files)
+    results = {pdf: (None, {}) for pdf in pdf_files}
+    threshold = min_metadata_confidence()
+    readable = []
+    local_count = 0
+    for pdf in pdf_files:
+        if pdf not in excerpts:
+            continue
+        local = extract_metadata(excerpts[pdf], PARTY_ACRONYMS, CASE_ACRONYMS)
+        if local.date and local.date_confidence >= threshold:
+            results[pdf] = (local.as_metadata(), {})
+            local_count += 1
+        else:
+            readable.append(pdf)
+    if local_count:
+        print(f"[INFO] Local extractor dated {local_count} files from first-page text "
+              f"(confidence >= {threshold:.2f})")
+    batches = [readable[i:i + RENAME_BATCH_SIZE] for i in range(0, len(readable), RENAME_BATCH_SIZE)]
+    if not batches:
+        return results
+    print(f"[INFO] Converting metadata for {len(readable)} files in {len(batches)} batched Gemini calls "
+          f"({MAX_WORKERS_IO} concurrent)...")
+    
+    def run_batch(batch):
+        with measure() as m:
+            answered = convert_metadata_batch_with_gemini([(pdf, excerpts[pdf]) for pdf in batch], model, m)
+        return answered, m.as_dict()
+    
+    def run_single(pdf):
+        with measure() as m:
+            metadata = convert_metadata_with_gemini(pdf, model, m, first_page_text=excerpts[pdf])
+        return metadata, m.as_dict()
+    
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS_IO) as executor:
+        pending = {executor.submit(run_batch, batch): ('batch', batch) for batch in batches}
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                kind, item = pending.pop(future)
+                if kind == 'single':
+                    metadata, file_metrics = future.result()
+                    previous = results[item][1]
+                    results[item] = (metadata, _merged_metrics(previous, file_metrics))
+                    continue
+                answered, batch_metrics = future.result()
+                results[item[0]] = (None, batch_metrics)
+                missing = []
+                for pdf in item:
+                    metadata = answered.get(pdf)
+                    if metadata is None:
+                        missing.append(pdf)
+                    else:
+                        results[pdf] = (metadata, results[pdf][1])
+                if missing:
+                    print(f"  [WARN] Batch did not cover {len(missing)} of {len(item)} files, "
+                          f"converting them individually")
+                    for pdf in missing:
+                        pending[executor.submit(run_single, pdf)] = ('single', pdf)
+    return results
+
+def _merged_metrics(a, b):
+    """Sum two FileMetrics dicts."""
+    combined = FileMetrics()
+    combined.merge(a)
+    combined.merge(b)
+    return combined.as_dict()
+
+def _count_gemini_usage(m, response):
+    """Add one API call and the response's token usage (if reported) to m"""
+    m.add(api_calls=1)
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is not None:
+        m.add(tokens_in=getattr(usage, 'prompt_token_count', 0) or 0,
+              tokens_out=getattr(usage, 'candidates_token_count', 0) or 0)
+
 def check_existing_naming(filename):
     """Check if filename already matches v30 naming convention"""
     # Pattern: YYYYMMDD_PARTY_Description_*.pdf
@@ -627,6 +890,10 @@ def clean_filename(filename):
     
     return filename
 
+def _is_compilation_name(original_base):
+    """Compilations (exhibit bundles) are named with an RR_ prefix, not a date"""
+    return bool(re.search(r'\bEx\.\s*P\d+|\bExhibit\b', original_base, re.IGNORECASE))
+
 def phase2_rename(root_dir):
     """Copy files to 02_doc-renamed with date prefix + original name"""
     print("\nPHASE 2: RENAME - ADD DATE PREFIX, PRESERVE ORIGINAL NAME")
@@ -651,11 +918,23 @@ def phase2_rename(root_dir):
     genai.configure(api_key=GEMINI_API_KEY)
     model = genai.GenerativeModel(MODEL_NAME)
     
+    # Files with no date prefix and no date in the filename need Gemini metadata;
+    # convert them all up front in batched, concurrent calls
+    needs_metadata = []
+    for pdf in pdf_files:
+        original_base = pdf.stem[:-2]
+        if (not _is_compilation_name(original_base) and not re.match(r'^\d{8}_', original_base)
+                and not convert_date_from_filename(original_base)):
+            needs_metadata.append(pdf)
+    metadata_results = convert_metadata_for_files(needs_metadata, model)
+    
     # Track used names for deduplication
     used_names = set()
+    materialized = {}  # method -> count
     
     for pdf in pdf_files:
         print(f"Processing: {pdf.name}...")
+        file_metrics = FileMetrics(bytes_in=pdf.stat().st_size, pages=0)
         
         # Get original filename without _d suffix
         original_base = pdf.stem[:-2]  # Remove "_d"
@@ -664,7 +943,7 @@ def phase2_rename(root_dir):
         already_has_date = bool(re.match(r'^\d{8}_', original_base))
         
         # Check if compilation (contains "Ex." or "Exhibit")
-        is_compilation = bool(re.search(r'\bEx\.\s*P\d+|\bExhibit\b', original_base, re.IGNORECASE))
+        is_compilation = _is_compilation_name(original_base)
         
         if is_compilation:
             # Compilation: Clean and use RR_ prefix
@@ -680,9 +959,13 @@ def phase2_rename(root_dir):
             # Try to convert date from filename first
             date = convert_date_from_filename(original_base)
             
-            # If no date in filename, use Gemini
+            # If no date in filename, use the Gemini metadata converted above
             if not date:
-                metadata = convert_metadata_with_gemini(pdf, model)
+                metadata, gemini_metrics = metadata_results.get(pdf, (None, {}))
+                file_metrics.merge(gemini_metrics)
+                if metadata and isinstance(metadata, dict) and metadata.get('source') == 'local':
+                    print(f"  [LOCAL] Date {metadata['date']} from first page "
+                          f"(confidence {metadata['confidence']:.2f})")
                 if metadata and isinstance(metadata, dict):
                     date = (metadata.get('date', '') or '').replace('-', '')
             
@@ -706,21 +989,189 @@ def phase2_rename(root_dir):
         
         used_names.add(new_name)
         target_path = renamed_dir / new_name
-        shutil.copy2(str(pdf), str(target_path))
+        method = materialize(pdf, target_path)  # Hardlink/reflink where the filesystem allows
+        materialized[method] = materialized.get(method, 0) + 1
         print(f"  [OK] Renamed: {pdf.name} -> {new_name}")
         report_data['rename'].append({'original': pdf.name, 'renamed': new_name})
+        metrics.add_file('rename', pdf.name, 'OK', file_metrics.as_dict())
     
     print(f"\n[OK] Renamed {len(pdf_files)} files")
+    if materialized:
+        print(f"[INFO] Materialized: " + ", ".join(f"{count} by {method}" for method, count in sorted(materialized.items())))
 
-# === PHASE 3: OCR - PDF Enhancement ===
-def run_subprocess(command):
-    """Run subprocess without timeout"""
+# === ARTIFACT REUSE - Cross-folder document index ===
+# Stage outputs recorded in the index: stage -> (artifact kind, output directory, suffix)
+_REUSABLE_STAGES = {
+    'clean': ('clean_pdf', "03_doc-clean", "_o.pdf"),
+    'convert': ('converted_txt', "04_doc-convert", "_c.txt"),
+    'format': ('formatted_txt', "05_doc-format", "_v31.txt"),
+}
+
+def _document_key(root_dir, base_name):
+    """Cross-folder content key of a document: sha256 of its 02_doc-renamed PDF"""
+    renamed = root_dir / "02_doc-renamed" / f"{base_name}_r.pdf"
+    if renamed.exists():
+        return get_journal(root_dir).input_hash(renamed)
+    index = get_index()
+    return index.artifact_key(root_dir, base_name) if index is not None else None
+
+def _register_artifact(root_dir, base_name, **artifacts):
+    """Record this folder's artifacts for a document in the cross-folder index (never fails a phase)"""
+    index = get_index()
+    if index is None:
+        return
+    try:
+        key = _document_key(root_dir, base_name)
+        if key:
+            index.record_artifact(key, root_dir, base_name, **artifacts)
+    except Exception as e:
+        print(f"  [WARN] Document index: could not record {base_name}: {e}")
+
+def _register_stage_output(root_dir, base_name, stage):
+    """Record a finished clean/convert/format output in the cross-folder index"""
+    kind, dir_name, suffix = _REUSABLE_STAGES[stage]
+    output_path = root_dir / dir_name / f"{base_name}{suffix}"
+    if output_path.exists():
+        _register_artifact(root_dir, base_name, **{kind: output_path})
+
+def _copy_with_folder_header(source, output_path, root_dir, base_name):
+    """Copy another folder's _c.txt/_v31.txt, rewriting only the per-folder header lines"""
+    pdf_name = f"{base_name}_o.pdf"
+    full_path_str = str(root_dir).replace('\\', '/')
+    if full_path_str.startswith('E:/') or full_path_str.startswith('e:/'):
+        pdf_directory = full_path_str[3:]
+    else:
+        pdf_directory = root_dir.name
+    fields = {
+        'DOCUMENT NAME:': base_name,
+        'ORIGINAL PDF NAME:': pdf_name,
+        'PDF DIRECTORY:': pdf_directory,
+        'PDF PUBLIC LINK:': get_public_url_for_pdf(root_dir, pdf_name),
+        'PDF PUBLIC URL:': get_public_url_for_pdf(root_dir, pdf_name),
+    }
+    with atomic_output(output_path) as temp_path:
+        with open(source, 'r', encoding='utf-8') as src, open(temp_path, 'w', encoding='utf-8') as out:
+            for line in src:
+                if line.startswith(_TEMPLATE_SEPARATOR):
+                    # End of the header: the body is copied unchanged
+                    out.write(line)
+                    break
+                for prefix, value in fields.items():
+                    if line.startswith(prefix):
+                        line = f"{prefix} {value}\n"
+                        break
+                out.write(line)
+            shutil.copyfileobj(src, out, 1024 * 1024)
+
+def _reuse_artifact(root_dir, base_name, stage):
+    """Materialize another folder's output of the same document for one stage.
+    
+    Returns the source ArtifactRecord, or None if the index has nothing to reuse.
+    """
+    index = get_index()
+    if index is None:
+        return None
+    kind, dir_name, suffix = _REUSABLE_STAGES[stage]
+    output_path = root_dir / dir_name / f"{base_name}{suffix}"
     try:
-        process = subprocess.run(command, check=True, capture_output=True, 
-                               text=True, encoding='utf-8')
-        return True, process.stdout
-    except subprocess.CalledProcessError as e:
-        return False, e.stderr
+        key = _document_key(root_dir, base_name)
+        record = index.find_artifact(key, kind, exclude=(root_dir, base_name)) if key else None
+    except Exception as e:
+        print(f"  [WARN] Document index lookup failed for {base_name}: {e}")
+        return None
+    if record is None:
+        return None
+    source = Path(getattr(record, kind))
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if stage == 'clean':
+        materialize(source, output_path)
+    else:
+        _copy_with_folder_header(source, output_path, root_dir, base_name)
+    _register_artifact(root_dir, base_name, **{kind: output_path})
+    return record
+
+def _reuse_prior_artifacts(root_dir, base_names, stages):
+    """Reuse other folders' clean/convert/format outputs for documents seen before.
+    
+    For each document, stages are tried in pipeline order and stop at the
+    first one with nothing to reuse. A reused output is journaled as done,
+    so the phase (or pipeline stage) then skips it: no OCR, Vision or Gemini
+    work. Outputs already done here are recorded in the index on the way.
+    Returns the number of outputs reused.
+    """
+    if get_index() is None:
+        return 0
+    journal = get_journal(root_dir)
+    renamed_dir = root_dir / "02_doc-renamed"
+    clean_dir = root_dir / "03_doc-clean"
+    convert_dir = root_dir / "04_doc-convert"
+    format_dir = root_dir / "05_doc-format"
+    reused = 0
+    for base_name in base_names:
+        for stage in ('clean', 'convert', 'format'):
+            if stage not in stages:
+                continue
+            if stage == 'clean':
+                input_path, output_path = renamed_dir / f"{base_name}_r.pdf", clean_dir / f"{base_name}_o.pdf"
+                journal_input = lambda: {'input_path': input_path}
+            elif stage == 'convert':
+                input_path, output_path = clean_dir / f"{base_name}_o.pdf", convert_dir / f"{base_name}_c.txt"
+                journal_input = lambda: {'input_path': input_path}
+            else:
+                input_path, output_path = convert_dir / f"{base_name}_c.txt", format_dir / f"{base_name}_v31.txt"
+                journal_input = lambda: {'input_hash': _format_input_hash(input_path, FORMAT_PROMPT)}
+            if journal.should_skip(base_name, stage, output_path, **journal_input()):
+                _register_stage_output(root_dir, base_name, stage)
+                continue
+            if not input_path.exists():
+                break
+            record = _reuse_artifact(root_dir, base_name, stage)
+            if record is None:
+                break
+            journal.record(base_name, stage, DONE, reused_from=record.root_dir, **journal_input())
+            report_data['reuse'].append({'stage': stage, 'file': output_path.name, 'from': record.root_dir})
+            print(f"[REUSE] {stage}: {output_path.name} from {Path(record.root_dir).name}/{record.base_name}")
+            reused += 1
+    return reused
+
+# === PHASE 3: OCR - PDF Enhancement ===
+def _compress_clean_output(clean_dir, base_name, budget=None):
+    """Deferred Ghostscript pass over a finished _o.pdf (runs on a thread; gs is its own process
+    and holds one core of the OCR pool's budget)"""
+    output_path = clean_dir / f"{base_name}_o.pdf"
+    print(f"[COMPRESS] {output_path.name}...")
+    with measure() as m:
+        result = compress_pdf(output_path, clean_dir / f"{base_name}_compressed_temp.pdf", budget=budget)
+    return attach_metrics(result, m)
+
+def _with_compression(result, compressed, output_path):
+    """Fold a deferred compression result into the file's clean result"""
+    metadata = dict(result.metadata or {})
+    metadata.pop('compress', None)
+    compressed_metadata = compressed.metadata or {}
+    if 'compression' in compressed_metadata:
+        metadata['compression'] = compressed_metadata['compression']
+    if 'metrics' in metadata:
+        merged = _merged_metrics(metadata['metrics'], compressed_metadata.get('metrics', {}))
+        merged['bytes_out'] = output_path.stat().st_size  # After the pass, not before
+        metadata['metrics'] = merged
+    result.metadata = metadata
+    if compressed.status == 'PARTIAL':
+        result.status, result.error = 'PARTIAL', compressed.error
+    return result
+
+def _record_clean_result(root_dir, journal, pdf, result):
+    """Metrics, report, journal and document index for one Phase 3 result"""
+    metrics.add_result('clean', pdf.name, result)
+    if result.status in ['OK', 'PARTIAL', 'COPIED']:
+        print(f"[OK] {result.file_name}")
+        report_data['clean'].append({'file': pdf.name, 'status': result.status})
+        journal.record(pdf.stem[:-2], 'clean', DONE, input_path=pdf)
+        _register_stage_output(root_dir, pdf.stem[:-2], 'clean')
+    else:
+        print(f"[FAIL] {result.file_name}: {result.error or 'Unknown error'}")
+        report_data['clean'].append({'file': pdf.name, 'status': 'FAILED'})
+        journal.record(pdf.stem[:-2], 'clean', FAILED, input_path=pdf, error=result.error)
 
 def phase3_clean(root_dir):
     """Copy to 03_doc-clean, remove metadata, convert to PDF/A, OCR at 600 DPI"""
@@ -742,374 +1193,111 @@ def phase3_clean(root_dir):
     # Sort by file size (smallest to largest)
     pdf_files.sort(key=lambda x: x.stat().st_size)
     
-    # Filter out already processed files
+    # Documents already cleaned in another folder: reuse that _o.pdf
+    _reuse_prior_artifacts(root_dir, [pdf.stem[:-2] for pdf in pdf_files], ['clean'])
+    
+    # Filter out already processed files (journal-checked: a crash mid-file is redone)
+    journal = get_journal(root_dir)
     files_to_process = []
-    large_files = []  # Files > 5MB process sequentially to avoid hanging
     skipped_count = 0
     for pdf in pdf_files:
         base_name = pdf.stem[:-2]  # Remove _r
         output_path = clean_dir / f"{base_name}_o.pdf"
-        if output_path.exists():
+        if journal.should_skip(base_name, 'clean', output_path, input_path=pdf):
+            metrics.add_file('clean', pdf.name, 'SKIPPED')
             print(f"[SKIP] Already processed: {pdf.name}")
             skipped_count += 1
         else:
-            file_size_mb = pdf.stat().st_size / (1024 * 1024)
-            if file_size_mb > 5:
-                large_files.append(pdf)
-            else:
-                files_to_process.append(pdf)
+            files_to_process.append(pdf)
     
-    if not files_to_process and not large_files:
+    if not files_to_process:
         print("[SKIP] All files already processed")
         return
     
-    # Process smaller files in parallel first (progress visibility)
+    # All files share the pool: every ocrmypdf/Ghostscript call has a page-scaled timeout
     if files_to_process:
-        print(f"[INFO] Processing {len(files_to_process)} PDFs with {MAX_WORKERS_CPU} workers...")
-        
-        # Process files in parallel
-        with concurrent.futures.ProcessPoolExecutor(max_workers=MAX_WORKERS_CPU) as executor:
-            futures = {
-                executor.submit(_process_clean_pdf, pdf, clean_dir): pdf 
-                for pdf in files_to_process
-            }
+        # One core budget for all workers: each ocrmypdf call gets --jobs from it (one per page, as free)
+        # and each Ghostscript pass one core, in the workers and on the compressor threads alike
+        workers = min(ocr_workers(), len(files_to_process))
+        budget = CoreBudget(cpu_budget(), slots=workers)
+        print(f"[INFO] Processing {len(files_to_process)} PDFs with {workers} workers "
+              f"sharing {budget.cores} cores (up to {budget.max_grant} OCR jobs per file)...")
+        
+        # Process files in parallel (workers import only docprocess_workers). Ghostscript passes the
+        # compression planner asks for run on a thread pool, so OCR workers move on to the next file
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                                    initargs=(budget,)) as executor, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS_CPU) as compressor:
+            futures = {}
+            for pdf in files_to_process:
+                journal.record(pdf.stem[:-2], 'clean', STARTED, input_path=pdf)
+                futures[executor.submit(process_clean_pdf, pdf, clean_dir, False)] = pdf
             
+            compress_futures = {}
             for future in concurrent.futures.as_completed(futures):
                 pdf = futures[future]
                 try:
                     result = future.result()
-                    if result.status in ['OK', 'PARTIAL', 'COPIED']:
-                        print(f"[OK] {result.file_name}")
-                        report_data['clean'].append({'file': pdf.name, 'status': result.status})
-                    else:
-                        print(f"[FAIL] {result.file_name}: {result.error or 'Unknown error'}")
-                        report_data['clean'].append({'file': pdf.name, 'status': 'FAILED'})
+                    if result.status == 'OK' and (result.metadata or {}).get('compress'):
+                        compress_futures[compressor.submit(_compress_clean_output, clean_dir, pdf.stem[:-2], budget)] = (pdf, result)
+                        continue
+                    _record_clean_result(root_dir, journal, pdf, result)
                 except Exception as e:
                     print(f"[FAIL] {pdf.name}: {e}")
                     report_data['clean'].append({'file': pdf.name, 'status': 'FAILED'})
+                    metrics.add_file('clean', pdf.name, 'FAILED')
+                    journal.record(pdf.stem[:-2], 'clean', FAILED, input_path=pdf, error=str(e))
+            
+            for future in concurrent.futures.as_completed(compress_futures):
+                pdf, result = compress_futures[future]
+                _record_clean_result(root_dir, journal, pdf,
+                                     _with_compression(result, future.result(), clean_dir / f"{pdf.stem[:-2]}_o.pdf"))
     
-    # Process large files sequentially last (prevents hanging and provides progress visibility)
-    if large_files:
-        print(f"[INFO] Processing {len(large_files)} large files (>5MB) sequentially...")
-        for pdf in large_files:
-            file_size_mb = pdf.stat().st_size / (1024 * 1024)
-            print(f"Processing: {pdf.name} ({file_size_mb:.1f} MB)...")
-            result = _process_clean_pdf(pdf, clean_dir)
-            if result.status in ['OK', 'PARTIAL', 'COPIED']:
-                print(f"[OK] {result.file_name}")
-                report_data['clean'].append({'file': pdf.name, 'status': result.status})
-            else:
-                print(f"[FAIL] {result.file_name}: {result.error or 'Unknown error'}")
-                report_data['clean'].append({'file': pdf.name, 'status': 'FAILED'})
-    
-    print(f"\n[OK] Processed {len(files_to_process) + len(large_files)} PDFs")
+    print(f"\n[OK] Processed {len(files_to_process)} PDFs")
     success_count = len([r for r in report_data['clean'] if r.get('status') in ['OK', 'PARTIAL', 'COPIED']])
     if skipped_count > 0:
         print(f"[INFO] Skipped {skipped_count} already processed files")
-    print(f"[OK] Successfully processed: {success_count}/{len(files_to_process) + len(large_files)} files")
+    print(f"[OK] Successfully processed: {success_count}/{len(files_to_process)} files")
 
-def _enhance_page1_header(pdf_path, output_path):
-    """
-    Replace page 1 with high-res image version for better OCR.
-    This fixes the issue where legal document titles (underlined, centered) are missed by OCR.
-    """
-    import fitz
+def test_pdf_text_extraction(pdf_path):
+    """Test if PDF has selectable/extractable text (OCR text layer).
     
+    Returns: (has_text: bool, text_sample: str, page_count: int)
+    """
     try:
-        # Create temp enhanced PDF
-        temp_enhanced = output_path.parent / f"temp_enhanced_{pdf_path.name}"
-        
-        doc = fitz.open(str(pdf_path))
-        page = doc[0]
-        
-        # Render page 1 at very high DPI
-        mat = fitz.Matrix(4.0, 4.0)  # 4x zoom = effective 1152 DPI
-        pix = page.get_pixmap(matrix=mat, alpha=False)
-        
-        # Get page dimensions
-        rect = page.rect
-        
-        # Create new PDF with enhanced page 1
-        new_doc = fitz.open()
-        new_page = new_doc.new_page(width=rect.width, height=rect.height)
-        
-        # Insert high-res image of original page 1
-        img_bytes = pix.tobytes("png")
-        new_page.insert_image(rect, stream=img_bytes)
-        
-        # Copy remaining pages as-is
-        new_doc.insert_pdf(doc, from_page=1, to_page=doc.page_count-1)
-        
-        # Save enhanced PDF
-        new_doc.save(str(temp_enhanced))
-        new_doc.close()
-        doc.close()
-        
-        print(f"  -> Enhanced page 1 at 1152 DPI for header OCR")
-        return str(temp_enhanced)
-        
+        with open(pdf_path, 'rb') as f:
+            reader = PyPDF2.PdfReader(f)
+            page_count = len(reader.pages)
+            
+            # Extract text from first 3 pages
+            text_samples = []
+            for i in range(min(3, page_count)):
+                page_text = reader.pages[i].extract_text()
+                if page_text and page_text.strip():
+                    text_samples.append(page_text.strip()[:200])  # First 200 chars
+            
+            full_sample = "\n".join(text_samples)
+            has_text = len(full_sample.strip()) > 50  # At least 50 characters
+            
+            return has_text, full_sample[:500], page_count
     except Exception as e:
-        print(f"  [WARN] Page 1 enhancement failed: {e}")
-        return None
+        return False, f"Error: {str(e)}", 0
 
-def _process_clean_pdf(pdf_path, clean_dir):
-    """Process a single PDF for Phase 3 (Clean). Runs in parallel worker process."""
-    from PIL import Image, ImageEnhance
-    import io
-    
-    base_name = pdf_path.stem[:-2]  # Remove _r
-    output_path = clean_dir / f"{base_name}_o.pdf"
-    temp_preprocessed = None
-    compressed_path = None
-    
+# === GCS HELPER FUNCTIONS ===
+def sync_directory_to_gcs(local_dir, gcs_prefix, make_public=False, mirror=False):
+    """Sync local directory to GCS bucket.
+
+    - Always uploads and overwrites existing remote objects for matching files
+    - When mirror=True, deletes remote objects that do not exist locally
+    - Optionally makes uploaded objects public (make_public=True)
+    """
     try:
-        # STEP 1: Try fast OCR first (without preprocessing)
-        print(f"[STEP 1] Attempting fast OCR (no preprocessing)...")
-        
-        ocrmypdf_cmd = shutil.which('ocrmypdf') or 'C:\\DevWorkspace\\.venv\\Scripts\\ocrmypdf.exe'
-        
-        # Try basic OCR first with skip-text to ignore existing text
-        cmd = [ocrmypdf_cmd, '--skip-text', '--output-type', 'pdfa',
-               '--oversample', '600', '--optimize', '3',
-               str(pdf_path), str(output_path)]
+        storage_client = storage.Client()
+        bucket = storage_client.bucket(GCS_BUCKET)
         
-        success, out = run_subprocess(cmd)
-        
-        if not success:
-            print(f"  [WARN] Fast OCR failed, will try preprocessing")
-        else:
-            # Verify OCR quality based on text extraction only
-            try:
-                doc = fitz.open(str(output_path))
-                page1_text = doc[0].get_text()
-                doc.close()
-                
-                # Quality check: page 1 should have meaningful text
-                good_quality = len(page1_text) > 100
-                
-                if good_quality:
-                    print(f"  -> Fast OCR successful ({len(page1_text)} chars on page 1)")
-                    success = True
-                else:
-                    print(f"  [WARN] Fast OCR produced little text ({len(page1_text)} chars), trying preprocessing")
-                    success = False
-                    output_path.unlink()  # Remove poor quality output
-            except Exception as e:
-                print(f"  [WARN] Could not verify OCR quality: {e}")
-                success = False
-        
-        # STEP 2: If fast OCR failed, try PIL preprocessing
-        if not success:
-            print(f"[STEP 2] Preprocessing PDF (remove underlines, enhance contrast)...")
-            temp_preprocessed = clean_dir / f"{base_name}_preprocessed.pdf"
-            
-            doc = fitz.open(str(pdf_path))
-            temp_images = []
-            
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                
-                # Render at high DPI for OCR
-                mat = fitz.Matrix(3.0, 3.0)  # ~864 DPI
-                pix = page.get_pixmap(matrix=mat, alpha=False)
-                
-                # Convert to PIL Image
-                img_data = pix.tobytes("png")
-                img = Image.open(io.BytesIO(img_data))
-                
-                # Enhance for OCR: grayscale + contrast + remove horizontal lines
-                img_gray = img.convert('L')
-                enhancer = ImageEnhance.Contrast(img_gray)
-                img_enhanced = enhancer.enhance(2.0)
-                
-                # Remove horizontal lines (underlines)
-                width, height = img_enhanced.size
-                pixel_data = img_enhanced.load()
-                
-                if pixel_data is not None:
-                    for y in range(height):
-                        line_length = 0
-                        for x in range(width):
-                            pixel_val = pixel_data[x, y]
-                            if isinstance(pixel_val, (int, float)) and pixel_val < 128:
-                                line_length += 1
-                            else:
-                                if line_length > width * 0.3:  # Long horizontal line
-                                    for xx in range(x - line_length, x):
-                                        if 0 <= xx < width:
-                                            pixel_data[xx, y] = 255
-                                line_length = 0
-                
-                # Save temp image
-                temp_img = clean_dir / f"{base_name}_temp_page_{page_num + 1}.png"
-                img_enhanced.save(str(temp_img), dpi=(600, 600))
-                temp_images.append(temp_img)
-            
-            doc.close()
-            
-            # Create PDF from preprocessed images with correct page dimensions
-            new_doc = fitz.open()
-            
-            for img_path in temp_images:
-                # Open image to get dimensions
-                img = Image.open(str(img_path))
-                img_width, img_height = img.size
-                img.close()
-                
-                # Images rendered at 3x zoom, convert to PDF points
-                page_width = img_width / 3.0
-                page_height = img_height / 3.0
-                
-                # Create new page with correct dimensions
-                page = new_doc.new_page(width=page_width, height=page_height)
-                
-                # Insert image to fill the page
-                page_rect = page.rect
-                page.insert_image(page_rect, filename=str(img_path))
-            
-            new_doc.save(str(temp_preprocessed))
-            new_doc.close()
-            
-            print(f"  -> Preprocessed {len(temp_images)} pages")
-            
-            # Clean up temp images
-            for img_path in temp_images:
-                if img_path.exists():
-                    img_path.unlink()
-            
-            # STEP 3: OCR preprocessed PDF
-            print(f"[STEP 3] Running OCR on preprocessed file...")
-            
-            cmd = [ocrmypdf_cmd, '--force-ocr', '--output-type', 'pdfa',
-                   '--oversample', '600',
-                   str(temp_preprocessed), str(output_path)]
-            
-            success, out = run_subprocess(cmd)
-            
-            if not success:
-                print(f"  [ERROR] Preprocessed OCR failed: {out[:200] if out else 'No error output'}")
-                # Fallback: copy preprocessed file
-                shutil.copy2(str(temp_preprocessed), str(output_path))
-                success = True
-        
-        # STEP FINAL: Clean up temp preprocessed file
-        if temp_preprocessed and temp_preprocessed.exists():
-            try:
-                temp_preprocessed.unlink()
-            except Exception:
-                pass  # Ignore cleanup errors
-        
-        # STEP COMPRESSION: Compress PDF to reduce file size
-        step_num = 2 if success else 4  # Adjust step number based on path taken
-        print(f"[STEP {step_num}] Compressing OCR'd PDF for online access...")
-        if success or output_path.exists():
-            try:
-                original_size = output_path.stat().st_size
-                compressed_path = clean_dir / f"{base_name}_compressed_temp.pdf"
-                
-                compress_cmd = [
-                    'gswin64c', '-sDEVICE=pdfwrite', '-dCompatibilityLevel=1.4',
-                    '-dPDFSETTINGS=/ebook', '-dNOPAUSE', '-dQUIET', '-dBATCH',
-                    f'-sOutputFile={compressed_path}', str(output_path)
-                ]
-                
-                compress_success, _ = run_subprocess(compress_cmd)
-                if compress_success and compressed_path.exists():
-                    compressed_size = compressed_path.stat().st_size
-                    reduction = ((original_size - compressed_size) / original_size) * 100
-                    
-                    # Only use compressed version if it's significantly smaller (>10% reduction)
-                    if reduction > 10:
-                        print(f"  -> Compressed {original_size:,} -> {compressed_size:,} bytes ({reduction:.1f}% reduction)")
-                        compressed_path.replace(output_path)
-                        return ProcessingResult(
-                            file_name=output_path.name,
-                            status='OK',
-                            metadata={'compression': f"{original_size:,} -> {compressed_size:,} bytes ({reduction:.1f}% reduction)"}
-                        )
-                    else:
-                        print(f"  -> Compression only {reduction:.1f}%, keeping original size")
-                        if compressed_path.exists():
-                            compressed_path.unlink()
-                        return ProcessingResult(file_name=output_path.name, status='OK')
-                else:
-                    print(f"  -> Compression failed, keeping original")
-                    return ProcessingResult(file_name=output_path.name, status='OK')
-                
-            except Exception as e:
-                if output_path.exists():
-                    return ProcessingResult(file_name=output_path.name, status='PARTIAL', error=f"Compression failed: {e}")
-                else:
-                    return ProcessingResult(file_name=pdf_path.name, status='FAILED', error=f"No output file created: {e}")
-        else:
-            # OCR failed, try direct copy
-            try:
-                shutil.copy2(str(pdf_path), str(output_path))
-                return ProcessingResult(file_name=output_path.name, status='COPIED')
-            except Exception as e:
-                return ProcessingResult(file_name=pdf_path.name, status='FAILED', error=str(e))
-    
-    except Exception as e:
-        return ProcessingResult(file_name=pdf_path.name, status='FAILED', error=str(e))
-    finally:
-        # Always cleanup ALL temp files
-        if temp_preprocessed and temp_preprocessed.exists():
-            try:
-                temp_preprocessed.unlink()
-            except Exception:
-                pass
-        if compressed_path and compressed_path.exists():
-            try:
-                compressed_path.unlink()
-            except Exception:
-                pass
-        # Also cleanup temp images
-        try:
-            for temp_img in clean_dir.glob(f"{base_name}_temp_page_*.png"):
-                if temp_img.exists():
-                    temp_img.unlink()
-        except Exception:
-            pass
-
-def test_pdf_text_extraction(pdf_path):
-    """Test if PDF has selectable/extractable text (OCR text layer).
-    
-    Returns: (has_text: bool, text_sample: str, page_count: int)
-    """
-    try:
-        with open(pdf_path, 'rb') as f:
-            reader = PyPDF2.PdfReader(f)
-            page_count = len(reader.pages)
-            
-            # Extract text from first 3 pages
-            text_samples = []
-            for i in range(min(3, page_count)):
-                page_text = reader.pages[i].extract_text()
-                if page_text and page_text.strip():
-                    text_samples.append(page_text.strip()[:200])  # First 200 chars
-            
-            full_sample = "\n".join(text_samples)
-            has_text = len(full_sample.strip()) > 50  # At least 50 characters
-            
-            return has_text, full_sample[:500], page_count
-    except Exception as e:
-        return False, f"Error: {str(e)}", 0
-
-# === GCS HELPER FUNCTIONS ===
-def sync_directory_to_gcs(local_dir, gcs_prefix, make_public=False, mirror=False):
-    """Sync local directory to GCS bucket.
-
-    - Always uploads and overwrites existing remote objects for matching files
-    - When mirror=True, deletes remote objects that do not exist locally
-    - Optionally makes uploaded objects public (make_public=True)
-    """
-    try:
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(GCS_BUCKET)
-        
-        local_path = Path(local_dir)
-        uploaded_files = []
-        local_files_set = set()
+        local_path = Path(local_dir)
+        uploaded_files = []
+        local_files_set = set()
         
         for file_path in local_path.rglob('*'):
             if file_path.is_file() and not file_path.name.startswith('.') and not file_path.name.startswith('_'):
@@ -1241,6 +1429,10 @@ def phase4_convert(root_dir):
         print(f"[FAIL] Could not initialize Google Vision: {e}")
         return
     
+    # Documents already converted in another folder: reuse that _c.txt (no Vision calls)
+    _reuse_prior_artifacts(root_dir, [pdf.stem[:-2] for pdf in pdf_files if pdf.stem.endswith('_o')], ['convert'])
+    
+    journal = get_journal(root_dir)
     skipped_count = 0
     for pdf in pdf_files:
         # Extract base name by removing known suffixes
@@ -1252,226 +1444,340 @@ def phase4_convert(root_dir):
         
         output_path = txt_dir / f"{base_name}_c.txt"
         
-        # Skip if output already exists
-        if output_path.exists():
+        # Skip if output already exists (and the journal agrees it finished)
+        if journal.should_skip(base_name, 'convert', output_path, input_path=pdf):
             print(f"[SKIP] Already converted: {pdf.name}")
+            metrics.add_file('convert', pdf.name, 'SKIPPED')
             skipped_count += 1
             continue
         
         print(f"Processing: {pdf.name}...")
-        
+        journal.record(base_name, 'convert', STARTED, input_path=pdf)
+        result = _process_convert_pdf(pdf, root_dir, output_path, client)
+        journal.record(base_name, 'convert', DONE if result.status == 'OK' else FAILED,
+                       input_path=pdf, error=result.error)
+        metrics.add_result('convert', pdf.name, result)
+        
+        if result.status == 'OK':
+            _register_stage_output(root_dir, base_name, 'convert')
+            print(f"  [OK] {result.file_name} ({result.metadata['pages']} pages)")
+            report_data['convert'].append({
+                'file': pdf.name,
+                'pages': result.metadata['pages'],
+                'chars': result.metadata['chars'],
+                'status': 'OK'
+            })
+        else:
+            print(f"  [FAIL] {result.error}")
+            report_data['convert'].append({'file': pdf.name, 'status': 'FAILED', 'error': result.error})
+    
+    success_count = len([r for r in report_data['convert'] if r.get('status') == 'OK'])
+    print(f"\n[OK] Converted {success_count}/{len(pdf_files)} files")
+    if skipped_count > 0:
+        print(f"[INFO] Skipped {skipped_count} already converted files")
+
+def _process_convert_pdf(pdf, root_dir, output_path, client):
+    """Extract text from one cleaned PDF with Google Vision and write the _c.txt template.
+    
+    EXTRACT_MODE decides which pages are read from the Phase 3 text layer
+    and which go to Vision (see docprocess_textlayer.py). Each Vision page
+    batch is cached under 04_doc-convert/_log/<base>/ and journaled, so a
+    restart after a crash only re-requests unfinished batches.
+    """
+    with measure() as m, span('convert', document=output_path.stem[:-2], phase='convert', file=pdf.name) as sp:
+        result = _convert_pdf(pdf, root_dir, output_path, client, m)
+        sp.set_attributes(status=result.status, bytes_in=m.bytes_in, bytes_out=m.bytes_out,
+                          pages=m.pages, api_calls=m.api_calls, extract_mode=EXTRACT_MODE,
+                          local_pages=(result.metadata or {}).get('local_pages'))
+    return attach_metrics(result, m)
+
+class _ConvertedTextWriter:
+    """Stream "[BEGIN PDF Page N]" blocks to a body file as pages arrive.
+    
+    TOTAL PAGES in the header is only known at the end, so pages go to a
+    scratch body file first; finish() then writes header + body + footer to
+    the _c.txt through a temp file and rename. Memory stays at one page
+    plus the copy buffer, whatever the document length.
+    """
+    
+    def __init__(self, body_path):
+        self.body_path = Path(body_path)
+        self.body_path.parent.mkdir(parents=True, exist_ok=True)
+        self._body = open(self.body_path, 'w', encoding='utf-8')
+        self.pages = 0
+        self.chars = 0
+    
+    def write_page(self, page_text):
+        self.pages += 1
+        self.chars += len(page_text)
+        # Blank line before every marker except the first page's
+        prefix = "\n" if self.pages > 1 else ""
+        self._body.write(f"{prefix}[BEGIN PDF Page {self.pages}]\n\n{page_text}\n")
+    
+    def finish(self, output_path, header, footer):
+        """Assemble header + body + footer into output_path atomically; return bytes written."""
+        self.close()
+        with atomic_output(output_path) as temp_path:
+            with open(temp_path, 'w', encoding='utf-8') as out:
+                out.write(header)
+                with open(self.body_path, 'r', encoding='utf-8') as body:
+                    shutil.copyfileobj(body, out, 1024 * 1024)
+                out.write(footer)
+                out.flush()
+                os.fsync(out.fileno())
+        return Path(output_path).stat().st_size
+    
+    def close(self):
+        if not self._body.closed:
+            self._body.close()
+
+def _pdf_pages_payload(doc, pages):
+    """Return a standalone PDF holding only `pages` (1-based) of an open document.
+    
+    Vision requests carry just the pages they ask for, so payload size and
+    memory follow the batch, not the whole file.
+    """
+    subset = fitz.open()
+    try:
+        for page_no in pages:
+            subset.insert_pdf(doc, from_page=page_no - 1, to_page=page_no - 1)
+        return subset.tobytes(garbage=1, deflate=True)
+    finally:
+        subset.close()
+
+def _convert_pdf(pdf, root_dir, output_path, client, m):
+    """Body of _process_convert_pdf; counts bytes, pages and Vision calls on m"""
+    journal = get_journal(root_dir)
+    doc_key = output_path.stem[:-2]  # Remove _c
+    batch_dir = output_path.parent / "_log" / doc_key
+    writer = None
+    doc = None
+    try:
+        input_hash = journal.input_hash(pdf)
+        m.add(bytes_in=pdf.stat().st_size)
+        
+        # PyMuPDF reads pages from the file on demand; the PDF is never held
+        # in memory whole, and each Vision request gets a per-batch sub-PDF
+        doc = fitz.open(pdf)
+        page_count = doc.page_count
+        
+        # Pages are written as they arrive, in batches of 5 pages (API limit)
+        writer = _ConvertedTextWriter(batch_dir / "body.txt")
+        local_pages, vision_page_nums = plan_pages(doc, EXTRACT_MODE)
+        batch_size = 5
+        if EXTRACT_MODE != 'vision':
+            print(f"  [INFO] {EXTRACT_MODE}: {len(local_pages)}/{page_count} pages from text layer, "
+                  f"{len(vision_page_nums)} to Google Vision")
+        
+        image_ctx = None
         try:
-            # Read PDF
-            with open(pdf, 'rb') as f:
-                content = f.read()
+            image_ctx = vision.ImageContext(language_hints=['en'])
+        except Exception:
+            image_ctx = None
             
-            # Check file size - Google Vision API has 40MB limit for inline requests
-            file_size_mb = len(content) / (1024 * 1024)
-            use_pymupdf_fallback = file_size_mb > 35  # Use PyMuPDF for files >35MB
+        # Prefer latest OCR model with English hint; fall back if needed
+        clean_feature_primary = None
+        try:
+            clean_feature_primary = vision.Feature(
+                type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION,
+                model="builtin/latest"
+            )
+        except Exception:
+            clean_feature_primary = vision.Feature(
+                type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION
+            )
+        
+        def vision_batch(batch):
+            """Return {page: text} for up to 5 pages, reusing a batch cached by a previous run"""
+            page_range = f"{batch[0]}-{batch[-1]}"
+            unit = f"pages:{page_range}:{len(batch)}"
+            cache_path = batch_dir / f"pages_{batch[0]:05d}.json"
+            if journal.is_done(doc_key, 'convert', unit, input_hash) and cache_path.exists():
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    print(f"  Reused pages {page_range} from previous run...")
+                    return {int(n): t for n, t in json.load(f).items()}
             
-            # Process in batches of 5 pages (API limit)
-            text_pages = []
-            page_num = 1
-            batch_size = 5
+            # Google Vision API has a 40MB limit for inline requests; pages
+            # too heavy to send even as a 5-page sub-PDF use the text layer
+            payload = _pdf_pages_payload(doc, batch)
+            if len(payload) > VISION_MAX_PAYLOAD_BYTES:
+                print(f"  [WARN] Pages {page_range} are {len(payload) / (1024 * 1024):.1f}MB - "
+                      f"using PyMuPDF extraction (Google Vision payload limit)")
+                texts = {page_no: doc[page_no - 1].get_text() for page_no in batch}
+                return {page_no: text for page_no, text in texts.items() if text.strip()}
             
-            if use_pymupdf_fallback:
-                print(f"  [INFO] File size {file_size_mb:.1f}MB - using PyMuPDF extraction (Google Vision payload limit)")
-                
-                # Use PyMuPDF to extract text from large PDFs
-                try:
-                    import fitz  # PyMuPDF
-                    doc = fitz.open(pdf)
-                    
-                    for page_idx in range(len(doc)):
-                        page = doc.load_page(page_idx)
-                        page_text = page.get_text()
-                        if page_text.strip():
-                            text_pages.append(page_text)
-                        if (page_idx + 1) % 10 == 0:
-                            print(f"  Processed {len(text_pages)} pages...")
-                    
-                    doc.close()
-                    print(f"  Processed {len(text_pages)} pages...")
-                    
-                except Exception as e:
-                    print(f"  [WARN] PyMuPDF extraction failed: {e}")
-                    # Continue to Google Vision fallback below
-                    
-            else:
-                # Standard processing for smaller files
-                image_ctx = None
-                try:
-                    image_ctx = vision.ImageContext(language_hints=['en'])
-                except Exception:
-                    image_ctx = None
-                    
-                # Prefer latest OCR model with English hint; fall back if needed
-                clean_feature_primary = None
+            # Weak pages in auto mode need not be contiguous; the sub-PDF
+            # numbers them 1..len(batch)
+            request = vision.AnnotateFileRequest(
+                input_config=vision.InputConfig(
+                    content=payload,
+                    mime_type='application/pdf'
+                ),
+                features=[clean_feature_primary],
+                pages=list(range(1, len(batch) + 1)),
+                image_context=image_ctx
+            )
+            
+            m.add(api_calls=1)
+            with span('vision.batch_annotate_files', page_range=page_range, pages=len(batch),
+                      bytes_in=len(payload)):
+                response = client.batch_annotate_files(requests=[request])
+            
+            # Responses come back in the order the pages were requested
+            batch_texts = {}
+            for file_response in response.responses:
+                for page_no, page_response in zip(batch, file_response.responses):
+                    if page_response.full_text_annotation.text:
+                        batch_texts[page_no] = page_response.full_text_annotation.text
+            
+            atomic_write_text(cache_path, json.dumps(batch_texts))
+            journal.record(doc_key, 'convert', DONE, unit=unit, input_hash=input_hash)
+            return batch_texts
+        
+        # Walk pages in order: local pages are re-read from the text layer,
+        # Vision pages come from the (at most one) open batch
+        local_set = set(local_pages)
+        batch_of = {page_no: idx // batch_size for idx, page_no in enumerate(vision_page_nums)}
+        current_batch, batch_texts = None, {}
+        for page_no in range(1, page_count + 1):
+            if page_no in local_set:
+                writer.write_page(doc[page_no - 1].get_text())
+            elif page_no in batch_of:
+                if batch_of[page_no] != current_batch:
+                    current_batch = batch_of[page_no]
+                    start = current_batch * batch_size
+                    batch_texts = vision_batch(vision_page_nums[start:start + batch_size])
+                    print(f"  Processed {writer.pages + len(batch_texts)}/{page_count} pages...")
+                page_text = batch_texts.pop(page_no, None)
+                if page_text:
+                    writer.write_page(page_text)
+        
+        # Fallback: if nothing converted, try simpler TEXT_DETECTION once
+        if writer.pages == 0 and EXTRACT_MODE == 'local-textlayer':
+            print("  [WARN] No text layer found (local-textlayer mode skips Google Vision)")
+        elif writer.pages == 0:
+            try:
+                # Initialize context for fallback
+                fallback_ctx = None
                 try:
-                    clean_feature_primary = vision.Feature(
-                        type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION,
-                        model="builtin/latest"
-                    )
+                    fallback_ctx = vision.ImageContext(language_hints=['en'])
                 except Exception:
-                    clean_feature_primary = vision.Feature(
-                        type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION
-                    )
+                    fallback_ctx = None
+                
+                fallback_batch_size = 5  # Use smaller batches for fallback
+                for page_num in range(1, page_count + 1, fallback_batch_size):
+                    clean_feature_fallback = None
+                    try:
+                        clean_feature_fallback = vision.Feature(
+                            type_=vision.Feature.Type.TEXT_DETECTION,
+                            model="builtin/latest"
+                        )
+                    except Exception:
+                        clean_feature_fallback = vision.Feature(
+                            type_=vision.Feature.Type.TEXT_DETECTION
+                        )
 
-                while True:
-                    # Create request for next 5 pages
-                    request = vision.AnnotateFileRequest(
+                    batch = list(range(page_num, min(page_num + fallback_batch_size, page_count + 1)))
+                    payload = _pdf_pages_payload(doc, batch)
+                    request_fb = vision.AnnotateFileRequest(
                         input_config=vision.InputConfig(
-                            content=content,
+                            content=payload,
                             mime_type='application/pdf'
                         ),
-                        features=[clean_feature_primary],
-                        pages=list(range(page_num, page_num + batch_size)),
-                        image_context=image_ctx
+                        features=[clean_feature_fallback],
+                        pages=list(range(1, len(batch) + 1)),
+                        image_context=fallback_ctx
                     )
-                    
-                    # Process batch
-                    try:
-                        response = client.batch_annotate_files(requests=[request])
-                        
-                        # Convert text from this batch
-                        batch_pages = []
-                        for file_response in response.responses:
-                            for page_response in file_response.responses:
-                                if page_response.full_text_annotation.text:
-                                    batch_pages.append(page_response.full_text_annotation.text)
-                        
-                        if not batch_pages:
-                            # No more pages
-                            break
-                            
-                        text_pages.extend(batch_pages)
-                        page_num += batch_size
-                        print(f"  Processed {len(text_pages)} pages...")
-                        
-                    except Exception as e:
-                        if "400" in str(e):
-                            # Reached end of document
-                            break
-                        raise
-            
-            # Fallback: if nothing converted, try simpler TEXT_DETECTION once
-            if len(text_pages) == 0:
-                try:
-                    # Initialize context for fallback
-                    fallback_ctx = None
-                    try:
-                        fallback_ctx = vision.ImageContext(language_hints=['en'])
-                    except Exception:
-                        fallback_ctx = None
-                    
-                    page_num = 1
-                    fallback_batch_size = 5  # Use smaller batches for fallback
-                    while True:
-                        clean_feature_fallback = None
-                        try:
-                            clean_feature_fallback = vision.Feature(
-                                type_=vision.Feature.Type.TEXT_DETECTION,
-                                model="builtin/latest"
-                            )
-                        except Exception:
-                            clean_feature_fallback = vision.Feature(
-                                type_=vision.Feature.Type.TEXT_DETECTION
-                            )
-
-                        request_fb = vision.AnnotateFileRequest(
-                            input_config=vision.InputConfig(
-                                content=content,
-                                mime_type='application/pdf'
-                            ),
-                            features=[clean_feature_fallback],
-                            pages=list(range(page_num, page_num + fallback_batch_size)),
-                            image_context=fallback_ctx
-                        )
+                    m.add(api_calls=1)
+                    with span('vision.batch_annotate_files', page_range=f"{batch[0]}-{batch[-1]}",
+                              bytes_in=len(payload), feature='TEXT_DETECTION'):
                         response_fb = client.batch_annotate_files(requests=[request_fb])
-                        batch_pages_fb = []
-                        for file_response in response_fb.responses:
-                            for page_response in file_response.responses:
-                                if page_response.full_text_annotation.text:
-                                    batch_pages_fb.append(page_response.full_text_annotation.text)
-                        if not batch_pages_fb:
-                            break
-                        text_pages.extend(batch_pages_fb)
-                        page_num += fallback_batch_size
-                        print(f"  [FB] Processed {len(text_pages)} pages...")
-                except Exception as e_fb:
-                    print(f"  [WARN] Fallback TEXT_DETECTION failed: {e_fb}")
-
-            # Build document with header, content, and footer
-            base_name = pdf.stem[:-2]  # Remove _o suffix from PDF name
-            
-            # Get public URL for this PDF
-            public_url = get_public_url_for_pdf(root_dir, pdf.name)
-            
-            # Get simplified directory path (folder name for non-E: drives, full path for E: drive)
-            folder_name = root_dir.name
-            full_path_str = str(root_dir).replace('\\', '/')
-            if full_path_str.startswith('E:/') or full_path_str.startswith('e:/'):
-                pdf_directory = full_path_str[3:]
-            else:
-                pdf_directory = folder_name
-            
-            # Document header
-            header = f"""§§ DOCUMENT INFORMATION §§
+                    for file_response in response_fb.responses:
+                        for page_response in file_response.responses:
+                            if page_response.full_text_annotation.text:
+                                writer.write_page(page_response.full_text_annotation.text)
+                    print(f"  [FB] Processed {writer.pages} pages...")
+            except Exception as e_fb:
+                print(f"  [WARN] Fallback TEXT_DETECTION failed: {e_fb}")
+
+        # Build document with header, content, and footer
+        base_name = pdf.stem[:-2]  # Remove _o suffix from PDF name
+        
+        # Get public URL for this PDF
+        public_url = get_public_url_for_pdf(root_dir, pdf.name)
+        
+        # Get simplified directory path (folder name for non-E: drives, full path for E: drive)
+        folder_name = root_dir.name
+        full_path_str = str(root_dir).replace('\\', '/')
+        if full_path_str.startswith('E:/') or full_path_str.startswith('e:/'):
+            pdf_directory = full_path_str[3:]
+        else:
+            pdf_directory = folder_name
+        
+        # Document header
+        header = f"""§§ DOCUMENT INFORMATION §§
 
 DOCUMENT NUMBER: TBD
 DOCUMENT NAME: {base_name}
 ORIGINAL PDF NAME: {pdf.name}
 PDF DIRECTORY: {pdf_directory}
 PDF PUBLIC LINK: {public_url}
-TOTAL PAGES: {len(text_pages)}
+TOTAL PAGES: {writer.pages}
 
 =====================================================================
 BEGINNING OF PROCESSED DOCUMENT
 =====================================================================
 
 """
-            
-            # Document content with page markers
-            content_parts = []
-            for idx, page_text in enumerate(text_pages, 1):
-                # Add blank line before marker (except first page)
-                if idx > 1:
-                    content_parts.append(f"\n[BEGIN PDF Page {idx}]\n\n{page_text}\n")
-                else:
-                    content_parts.append(f"[BEGIN PDF Page {idx}]\n\n{page_text}\n")
-            
-            content = "".join(content_parts)
-            
-            # Document footer
-            footer = f"""
+        
+        # Document footer
+        footer = f"""
 =====================================================================
 END OF PROCESSED DOCUMENT
 =====================================================================
 """
-            
-            # Combine all parts
-            final_text = header + content + footer
-            
-            # Save converted text with template
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(final_text)
-            
-            print(f"  [OK] {output_path.name} ({len(text_pages)} pages)")
-            report_data['convert'].append({
-                'file': pdf.name,
-                'pages': len(text_pages),
-                'chars': sum(len(p) for p in text_pages),
-                'status': 'OK'
-            })
-            
-        except Exception as e:
-            print(f"  [FAIL] Google Vision error: {e}")
-            report_data['convert'].append({'file': pdf.name, 'status': 'FAILED', 'error': str(e)})
-    
-    success_count = len([r for r in report_data['convert'] if r.get('status') == 'OK'])
-    print(f"\n[OK] Converted {success_count}/{len(pdf_files)} files")
-    if skipped_count > 0:
-        print(f"[INFO] Skipped {skipped_count} already converted files")
+        
+        # Save converted text with template (temp + rename), then drop the batch cache
+        bytes_out = writer.finish(output_path, header, footer)
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        m.add(pages=writer.pages, bytes_out=bytes_out)
+        
+        return ProcessingResult(
+            file_name=output_path.name,
+            status='OK',
+            metadata={'pages': writer.pages, 'chars': writer.chars, 'local_pages': len(local_pages)}
+        )
+        
+    except Exception as e:
+        return ProcessingResult(file_name=pdf.name, status='FAILED', error=f"Google Vision error: {e}")
+    finally:
+        if writer is not None:
+            writer.close()
+        if doc is not None:
+            doc.close()
+
+# v31 Phase 5 prompt with v20 formatting attributes (shared with repair reformatting)
+FORMAT_PROMPT = """You are correcting OCR output for a legal document. Your task is to:
+1. Fix OCR errors and preserve legal terminology
+2. CRITICAL: Preserve ALL page markers EXACTLY as they appear: '[BEGIN PDF Page N]' with blank lines before and after
+3. NEVER remove or modify page markers, especially [BEGIN PDF Page 1] - it MUST be preserved
+4. NEVER move page markers - they must stay at the START of each page's content
+5. Format with lines under 65 characters and proper paragraph breaks
+6. Render logo/header text on SINGLE lines (e.g., "MERRY FARNEN & RYAN" not multi-line)
+7. Use standard bullet points (•) not filled circles (⚫)
+8. Use full forwarded message marker: "---------- Forwarded message ---------"
+9. Return only the corrected text with ALL page markers in their ORIGINAL positions
+
+CRITICAL STRUCTURE:
+[BEGIN PDF Page 1]
+
+<content for page 1>
+
+[BEGIN PDF Page 2]
+
+<content for page 2>
+
+DO NOT move markers to the end of content. Keep them at the START."""
 
 def _chunk_body_by_pages(body_text, pages_per_chunk=80):
     """Split body text into chunks by page markers for large documents"""
@@ -1509,90 +1815,209 @@ def _chunk_body_by_pages(body_text, pages_per_chunk=80):
     return chunks
 
 
+_TEMPLATE_SEPARATOR = "====================================================================="
+_PAGE_MARKER_RE = re.compile(r'\[BEGIN PDF Page \d+\]')
+
+class _ProcessedTemplate:
+    """Line-by-line reader for a Phase 4 _c.txt: header, stripped body, footer.
+    
+    body_lines() yields the same text as the stripped body of the whole
+    file, without holding the file in memory; header and footer are set
+    while it runs.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.header = None
+        self.footer = None
+    
+    def body_lines(self):
+        """Yield body lines (without newlines) of the stripped document body"""
+        with open(self.path, 'r', encoding='utf-8') as f:
+            # Header runs through the === line after BEGINNING OF PROCESSED DOCUMENT
+            header_lines = []
+            for line in f:
+                header_lines.append(line)
+                if "BEGINNING OF PROCESSED DOCUMENT" in line:
+                    header_lines.append(f.readline())
+                    break
+            else:
+                raise ValueError("Template markers not found - file may not be from Phase 4")
+            self.header = "".join(header_lines)
+            
+            pending = None   # Last content line, held back so the final one can be rstripped
+            blanks = []      # Whitespace-only lines since the last content line
+            started = False
+            raw = f.readline()
+            while raw:
+                next_raw = f.readline()
+                line = raw.rstrip('\n')
+                if line == _TEMPLATE_SEPARATOR and next_raw.startswith("END OF PROCESSED DOCUMENT"):
+                    # Footer includes the === line before END
+                    self.footer = raw + next_raw + f.read()
+                    break
+                raw = next_raw
+                if not line.strip():
+                    if started:
+                        blanks.append(line)
+                    continue
+                if pending is not None:
+                    yield pending
+                yield from blanks
+                blanks = []
+                pending = line if started else line.lstrip()
+                started = True
+            else:
+                raise ValueError("Template markers not found - file may not be from Phase 4")
+            if pending is not None:
+                yield pending.rstrip()
+    
+    def chunks(self, pages_per_chunk=80):
+        """Yield the body in chunks of pages, split like _chunk_body_by_pages"""
+        # A split point is a marker line with a blank line before and after it
+        lines = []
+        split_points = 0
+        prev_line = None
+        held = None          # Marker line waiting to see if the next line is blank
+        for line in self.body_lines():
+            if held is not None:
+                if line == "" and prev_line == "":
+                    if split_points and split_points % pages_per_chunk == 0:
+                        yield "\n".join(lines[:-1]).strip()
+                        lines = [lines[-1]]
+                    split_points += 1
+                held = None
+            if _PAGE_MARKER_RE.fullmatch(line):
+                held = line
+                prev_line = lines[-1] if lines else None
+            lines.append(line)
+        yield "\n".join(lines).strip()
+    
+    def page_count(self):
+        return sum(len(_PAGE_MARKER_RE.findall(line)) for line in self.body_lines())
+
+def _format_input_hash(txt_file, prompt):
+    """Journal hash for Phase 5: prompt + document body only (None if unreadable).
+    
+    Phase 6 rewrites the PDF DIRECTORY / PUBLIC LINK header lines of _c.txt,
+    which must not invalidate an already formatted _v31.txt.
+    """
+    digest = hashlib.sha256((prompt + "\n\n").encode('utf-8'))
+    try:
+        for idx, line in enumerate(_ProcessedTemplate(txt_file).body_lines()):
+            digest.update((("\n" if idx else "") + line).encode('utf-8'))
+    except (OSError, ValueError):
+        return None
+    return digest.hexdigest()
+
 def _process_format_file(txt_file, formatted_dir, prompt):
-    """Worker function for parallel text formatting - matches v21 architecture with chunking"""
+    """Worker function for parallel text formatting - matches v21 architecture with chunking.
+    
+    Chunk responses are cached under 05_doc-format/_log/<base>/ and journaled,
+    so a crash part-way through a large document only re-sends the unfinished chunks.
+    """
+    with measure() as m, span('format', document=txt_file.stem[:-2], phase='format', file=txt_file.name) as sp:
+        result = _format_file(txt_file, formatted_dir, prompt, m)
+        sp.set_attributes(status=result.status, bytes_in=m.bytes_in, bytes_out=m.bytes_out,
+                          pages=m.pages, tokens_in=m.tokens_in, tokens_out=m.tokens_out)
+    return attach_metrics(result, m)
+
+def _format_file(txt_file, formatted_dir, prompt, m):
+    """Body of _process_format_file; counts bytes, pages, Gemini calls and tokens on m"""
     base_name = txt_file.stem[:-2]  # Remove _c suffix
     output_path = formatted_dir / f"{base_name}_v31.txt"
+    journal = get_journal(formatted_dir.parent)
+    chunk_dir = formatted_dir / "_log" / base_name
     
     try:
         # Initialize model for this worker
         genai.configure(api_key=GEMINI_API_KEY)
         model = genai.GenerativeModel(MODEL_NAME)
         
-        # Read input text (has template from Phase 4)
-        with open(txt_file, 'r', encoding='utf-8') as f:
-            full_text = f.read()
+        # Input is read line by line (has template from Phase 4)
+        m.add(bytes_in=txt_file.stat().st_size)
         
         # CRITICAL: Extract header, body, footer separately (like v21 does)
         # Gemini should ONLY see the document body, not the template
-        body_start = full_text.find("BEGINNING OF PROCESSED DOCUMENT")
-        footer_start = full_text.find("=====================================================================\nEND OF PROCESSED DOCUMENT")
-        
-        if body_start < 0 or footer_start < 0:
-            raise ValueError("Template markers not found - file may not be from Phase 4")
-        
-        # Skip past the BEGINNING marker and separator line to get to content
-        body_start_line = full_text.find("\n", body_start + len("BEGINNING OF PROCESSED DOCUMENT"))
-        body_start_line = full_text.find("\n", body_start_line + 1)  # Skip the === line
-        body_start_content = body_start_line + 1
-        
-        # Extract the three parts
-        header = full_text[:body_start_content]
-        raw_body = full_text[body_start_content:footer_start].strip()
-        footer = full_text[footer_start:]  # Includes the === line before END
+        template = _ProcessedTemplate(txt_file)
         
         # Check if document needs chunking (count pages)
-        page_count = len(re.findall(r'\[BEGIN PDF Page \d+\]', raw_body))
-        
-        if page_count > 80:
+        page_count = template.page_count()
+        chunked = page_count > 80
+        if chunked:
             # Large document - process in chunks
             print(f"  [CHUNK] Document has {page_count} pages - processing in 80-page chunks...")
-            chunks = _chunk_body_by_pages(raw_body, pages_per_chunk=80)
-            cleaned_chunks = []
-            
-            for idx, chunk in enumerate(chunks, 1):
-                print(f"    Processing chunk {idx}/{len(chunks)}...")
-                response = model.generate_content(
-                    prompt + "\n\n" + chunk,
-                    generation_config=genai.types.GenerationConfig(
-                        temperature=0.1,
-                        max_output_tokens=MAX_OUTPUT_TOKENS
-                    ),
-                    request_options={'timeout': 300}
-                )
-                cleaned_chunks.append(response.text.strip())
-            
-            # Consolidate chunks
-            cleaned_body = "\n\n".join(cleaned_chunks)
-            print(f"  [OK] Consolidated {len(chunks)} chunks into complete document")
-            
-        else:
-            # Small document - process in single call
-            response = model.generate_content(
-                prompt + "\n\n" + raw_body,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.1,
-                    max_output_tokens=MAX_OUTPUT_TOKENS
-                )
-            )
-            cleaned_body = response.text.strip()
         
-        # Reassemble: header + cleaned_body + footer (like v21)
-        # CRITICAL: Ensure blank lines between sections
-        if not header.endswith("\n\n"):
-            header = header.rstrip() + "\n\n"
+        # Stream: header, then each cleaned chunk as it arrives, then footer,
+        # into a temp file that is renamed over the _v31.txt at the end
+        chars_in = chars_out = chunk_count = 0
+        with atomic_output(output_path) as temp_path:
+            with open(temp_path, 'w', encoding='utf-8') as out:
+                for idx, chunk in enumerate(template.chunks(pages_per_chunk=80), 1):
+                    if idx == 1:
+                        # Reassemble: header + cleaned body + footer (like v21)
+                        # CRITICAL: Ensure blank lines between sections
+                        header = template.header
+                        if not header.endswith("\n\n"):
+                            header = header.rstrip() + "\n\n"
+                        out.write(header)
+                    else:
+                        out.write("\n\n")
+                    chars_in += len(chunk)
+                    chunk_count = idx
+                    
+                    # Every chunk (a small document is one chunk) is cached and
+                    # journaled, so a crash only re-sends unfinished chunks
+                    unit = f"chunk:{idx}"
+                    chunk_hash = text_sha256(prompt + "\n\n" + chunk)
+                    cache_path = chunk_dir / f"chunk_{idx:03d}.txt"
+                    if journal.is_done(base_name, 'format', unit, chunk_hash) and cache_path.exists():
+                        print(f"    Reusing chunk {idx} from previous run")
+                        with open(cache_path, 'r', encoding='utf-8') as f:
+                            cleaned_chunk = f.read()
+                    else:
+                        if chunked:
+                            print(f"    Processing chunk {idx}...")
+                        # Streamed: output so far is kept in a .partial file, a stalled
+                        # stream resumes from its last complete page marker
+                        chunk_dir.mkdir(parents=True, exist_ok=True)
+                        with span('gemini.generate_content', chunk=idx, bytes_in=len(chunk.encode('utf-8'))) as gsp:
+                            cleaned_chunk, responses = generate_with_resume(
+                                model, prompt, chunk,
+                                genai.types.GenerationConfig(
+                                    temperature=0.1,
+                                    max_output_tokens=MAX_OUTPUT_TOKENS
+                                ),
+                                partial_path=chunk_dir / f"chunk_{idx:03d}_{chunk_hash[:12]}.partial",
+                                label=f"{base_name} chunk {idx}"
+                            )
+                            gsp.set_attributes(calls=len(responses), finish_reason=responses[-1].finish_reason)
+                        for response in responses:
+                            _count_gemini_usage(m, response)
+                        m.add(retries=len(responses) - 1)
+                        cleaned_chunk = cleaned_chunk.strip()
+                        atomic_write_text(cache_path, cleaned_chunk)
+                        journal.record(base_name, 'format', DONE, unit=unit, input_hash=chunk_hash)
+                    
+                    out.write(cleaned_chunk)
+                    chars_out += len(cleaned_chunk)
+                
+                # Footer should have blank lines before it
+                out.write("\n\n" + template.footer)
+                out.flush()
+                os.fsync(out.fileno())
         
-        # Footer should have blank lines before it
-        final_text = header + cleaned_body + "\n\n" + footer
+        if chunked:
+            print(f"  [OK] Consolidated {chunk_count} chunks into complete document")
         
-        # Save formatted text
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(final_text)
+        # Drop the chunk cache once the output is in place
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+        m.add(pages=page_count, bytes_out=output_path.stat().st_size)
         
         return ProcessingResult(
             file_name=output_path.name,
             status='OK',
-            metadata={'chars_in': len(raw_body), 'chars_out': len(cleaned_body), 'pages': page_count}
+            metadata={'chars_in': chars_in, 'chars_out': chars_out, 'pages': page_count}
         )
         
     except Exception as e:
@@ -1683,6 +2108,16 @@ END OF PROCESSED DOCUMENT
         print(f"[INFO] Skipped {skipped_count} already imported file(s)")
 
 # === PHASE 5: FORMAT - AI Text Cleaning ===
+def _format_is_done(journal, txt_file, output_path, prompt):
+    """Journal-checked resume test for one _c.txt -> _v31.txt"""
+    return journal.should_skip(txt_file.stem[:-2], 'format', output_path,
+                               input_hash=_format_input_hash(txt_file, prompt))
+
+def _record_format_result(journal, txt_file, prompt, result):
+    """Journal the outcome of _process_format_file"""
+    journal.record(txt_file.stem[:-2], 'format', DONE if result.status == 'OK' else FAILED,
+                   input_hash=_format_input_hash(txt_file, prompt), error=result.error)
+
 def phase5_format(root_dir):
     """Clean and format text files using Gemini (exact v21 prompt)"""
     print("\nPHASE 5: FORMAT - AI TEXT CLEANING")
@@ -1703,7 +2138,12 @@ def phase5_format(root_dir):
     # Sort by file size (smallest to largest)
     txt_files.sort(key=lambda x: x.stat().st_size)
     
+    # Documents already formatted in another folder: reuse that _v31.txt (no Gemini calls)
+    _reuse_prior_artifacts(root_dir, [f.stem[:-2] for f in txt_files], ['format'])
+    
     # Check which files need processing FIRST
+    journal = get_journal(root_dir)
+    prompt = FORMAT_PROMPT
     files_to_process = []
     skipped_count = 0
     
@@ -1711,8 +2151,9 @@ def phase5_format(root_dir):
         base_name = txt_file.stem[:-2]  # Remove _c
         output_path = formatted_dir / f"{base_name}_v31.txt"
         
-        if output_path.exists():
+        if _format_is_done(journal, txt_file, output_path, prompt):
             print(f"[SKIP] Already formatted: {txt_file.name}")
+            metrics.add_file('format', txt_file.name, 'SKIPPED')
             skipped_count += 1
         else:
             files_to_process.append(txt_file)
@@ -1725,41 +2166,22 @@ def phase5_format(root_dir):
     
     genai.configure(api_key=GEMINI_API_KEY)
     
-    # v31 prompt with v20 formatting attributes
-    prompt = """You are correcting OCR output for a legal document. Your task is to:
-1. Fix OCR errors and preserve legal terminology
-2. CRITICAL: Preserve ALL page markers EXACTLY as they appear: '[BEGIN PDF Page N]' with blank lines before and after
-3. NEVER remove or modify page markers, especially [BEGIN PDF Page 1] - it MUST be preserved
-4. NEVER move page markers - they must stay at the START of each page's content
-5. Format with lines under 65 characters and proper paragraph breaks
-6. Render logo/header text on SINGLE lines (e.g., "MERRY FARNEN & RYAN" not multi-line)
-7. Use standard bullet points (•) not filled circles (⚫)
-8. Use full forwarded message marker: "---------- Forwarded message ---------"
-9. Return only the corrected text with ALL page markers in their ORIGINAL positions
-
-CRITICAL STRUCTURE:
-[BEGIN PDF Page 1]
-
-<content for page 1>
-
-[BEGIN PDF Page 2]
-
-<content for page 2>
-
-DO NOT move markers to the end of content. Keep them at the START."""
-    
     with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS_IO) as executor:
-        futures = {
-            executor.submit(_process_format_file, txt_file, formatted_dir, prompt): txt_file
-            for txt_file in files_to_process
-        }
+        futures = {}
+        for txt_file in files_to_process:
+            journal.record(txt_file.stem[:-2], 'format', STARTED,
+                           input_hash=_format_input_hash(txt_file, prompt))
+            futures[executor.submit(_process_format_file, txt_file, formatted_dir, prompt)] = txt_file
         
         for future in concurrent.futures.as_completed(futures):
             txt_file = futures[future]
             try:
                 result = future.result()
+                _record_format_result(journal, txt_file, prompt, result)
+                metrics.add_result('format', txt_file.name, result)
                 if result.status == 'OK':
                     print(f"[OK] {result.file_name}")
+                    _register_stage_output(root_dir, txt_file.stem[:-2], 'format')
                     metadata = result.metadata if result.metadata else {}
                     report_data['format'].append({
                         'file': txt_file.name,
@@ -1773,13 +2195,374 @@ DO NOT move markers to the end of content. Keep them at the START."""
             except Exception as e:
                 print(f"[FAIL] {txt_file.name}: {e}")
                 report_data['format'].append({'file': txt_file.name, 'status': 'FAILED', 'error': str(e)})
+                journal.record(txt_file.stem[:-2], 'format', FAILED, error=str(e))
+                metrics.add_file('format', txt_file.name, 'FAILED')
+    
+    success_count = len([r for r in report_data['format'] if r.get('status') == 'OK'])
+    print(f"\n[OK] Formatted {success_count}/{len(txt_files)} files")
+    if skipped_count > 0:
+        print(f"[INFO] Skipped {skipped_count} already formatted files")
+
+# === PHASE 6: GCS UPLOAD - COMPREHENSIVE STRUCTURE MANAGEMENT ===
+def _reusable_gcs_blob(root_dir, base_name, pdf_path, blob_name, bucket):
+    """Blob another folder uploaded for the same _o.pdf bytes, or None.
+    
+    Only a blob whose recorded clean PDF is identical to pdf_path (same file
+    or same size and sha256) is reused, and only if it still exists.
+    """
+    index = get_index()
+    if index is None:
+        return None
+    try:
+        key = _document_key(root_dir, base_name)
+        record = index.find_artifact(key, 'gcs_blob', exclude=(root_dir, base_name)) if key else None
+        if record is None or record.gcs_blob == blob_name or not record.clean_pdf:
+            return None
+        source_pdf = Path(record.clean_pdf)
+        if not source_pdf.exists():
+            return None
+        if not os.path.samefile(source_pdf, pdf_path):
+            if source_pdf.stat().st_size != pdf_path.stat().st_size:
+                return None
+            journal = get_journal(root_dir)
+            if journal.input_hash(source_pdf) != journal.input_hash(pdf_path):
+                return None
+        if not bucket.blob(record.gcs_blob).exists():
+            return None
+        return record.gcs_blob
+    except Exception as e:
+        print(f"  [WARN] Document index lookup failed for {pdf_path.name}: {e}")
+        return None
+
+def _upload_pdf_and_update_headers(pdf_path, bucket, gcs_prefix, pdf_directory, convert_dir, format_dir, force_reupload=False):
+    """Upload one cleaned PDF to GCS and point its 04/05 text headers at it.
+    
+    Returns a dict with 'uploaded', 'log' (upload log entry or None),
+    'convert_updated', 'format_updated' and 'api_calls'. Exceptions propagate
+    to the caller.
+    """
+    # Upload to GCS with full directory path
+    blob_name = f"{gcs_prefix}/{pdf_path.name}"
+    blob = bucket.blob(blob_name)
+    
+    outcome = {'uploaded': False, 'log': None, 'convert_updated': False, 'format_updated': False, 'api_calls': 0}
+    
+    # CRITICAL: Delete existing file first to ensure fresh upload
+    # (one exists() round trip; after the delete the upload always runs)
+    outcome['api_calls'] += 1
+    if blob.exists():
+        blob.delete()
+        outcome['api_calls'] += 1
+    
+    # Same PDF already in the bucket for another folder: server-side copy instead of an upload
+    root_dir = convert_dir.parent
+    source_blob = _reusable_gcs_blob(root_dir, pdf_path.stem[:-2], pdf_path, blob_name, bucket)
+    outcome['api_calls'] += 1 if source_blob else 0
+    if source_blob:
+        print(f"\n[REUSE] {pdf_path.name}: gs://{GCS_BUCKET}/{source_blob} -> {blob_name}")
+        with span('gcs.copy', document=pdf_path.stem[:-2], phase='gcs_upload', file=pdf_path.name,
+                  gcs_path=blob_name):
+            blob = bucket.copy_blob(bucket.blob(source_blob), bucket, blob_name)
+            blob.make_public()
+        outcome['api_calls'] += 2
+        outcome['reused_from'] = source_blob
+        print(f"[OK] Copied")
+    else:
+        # Upload new file
+        print(f"\n[UPLOAD] {pdf_path.name} -> gs://{GCS_BUCKET}/{blob_name}")
+        with span('gcs.upload', document=pdf_path.stem[:-2], phase='gcs_upload', file=pdf_path.name,
+                  gcs_path=blob_name, bytes_in=pdf_path.stat().st_size):
+            blob.upload_from_filename(str(pdf_path))
+            blob.make_public()
+        outcome['api_calls'] += 2
+        outcome['uploaded'] = True
+        print(f"[OK] Uploaded")
+    _register_artifact(root_dir, pdf_path.stem[:-2], gcs_blob=blob_name)
+    
+    # Log upload
+    gcs_url = f"https://storage.cloud.google.com/{GCS_BUCKET}/{blob_name}"
+    outcome['log'] = {
+        'file': pdf_path.name,
+        'gcs_path': blob_name,
+        'url': gcs_url,
+        'size': pdf_path.stat().st_size
+    }
+
+    # Generate GCS URL (always do this for header updates)
+    gcs_url = f"https://storage.cloud.google.com/{GCS_BUCKET}/{blob_name}"
+    
+    # Find corresponding files - extract base name by removing known suffixes
+    base_name = pdf_path.stem
+    for suffix in ['_o', '_d', '_r', '_a', '_t', '_c', '_v22', '_v31', '_gp']:
+        if base_name.endswith(suffix):
+            base_name = base_name[:-len(suffix)]
+            break
+    
+    # Find convert file (look for any _c.txt file)
+    convert_file = None
+    if convert_dir.exists():
+        candidate = convert_dir / f"{base_name}_c.txt"
+        if candidate.exists():
+            convert_file = candidate
+    
+    # Find format file (look for any format suffix)
+    format_file = None
+    if format_dir.exists():
+        for suffix in ['_v31', '_gp', '_v22']:
+            candidate = format_dir / f"{base_name}{suffix}.txt"
+            if candidate.exists():
+                format_file = candidate
+                break
+    
+    # Update 04_doc-convert/*_c.txt header
+    if convert_file and convert_file.exists():
+        with open(convert_file, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+        
+        # Update PDF DIRECTORY and PDF PUBLIC LINK lines in template
+        updated = False
+        for i, line in enumerate(lines):
+            if line.startswith("PDF DIRECTORY:"):
+                lines[i] = f"PDF DIRECTORY: {pdf_directory}\n"
+                updated = True
+            elif line.startswith("PDF PUBLIC LINK:") or line.startswith("PDF PUBLIC URL:"):
+                lines[i] = f"PDF PUBLIC LINK: {gcs_url}\n"
+                updated = True
+        
+        if updated:
+            atomic_write_text(convert_file, ''.join(lines))
+            outcome['convert_updated'] = True
+            print(f"[OK] Updated header in: {convert_file.name}")
+        else:
+            print(f"[WARN] No header lines found to update in: {convert_file.name}")
+    
+    # Update 05_doc-format/*_v31.txt header
+    if format_file and format_file.exists():
+        with open(format_file, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+        
+        # Update PDF DIRECTORY and PDF PUBLIC LINK lines in template
+        updated = False
+        for i, line in enumerate(lines):
+            if line.startswith("PDF DIRECTORY:"):
+                lines[i] = f"PDF DIRECTORY: {pdf_directory}\n"
+                updated = True
+            elif line.startswith("PDF PUBLIC LINK:") or line.startswith("PDF PUBLIC URL:"):
+                lines[i] = f"PDF PUBLIC LINK: {gcs_url}\n"
+                updated = True
+        
+        if updated:
+            atomic_write_text(format_file, ''.join(lines))
+            outcome['format_updated'] = True
+            print(f"[OK] Updated header in: {format_file.name}")
+        else:
+            print(f"[WARN] No header lines found to update in: {format_file.name}")
+    
+    if not convert_file or not convert_file.exists():
+        print(f"[WARN] No convert file found: {base_name}_c.txt")
+    if not format_file or not format_file.exists():
+        # List possible format file suffixes that were checked
+        checked = ', '.join([f"{base_name}{s}.txt" for s in ['_v31', '_gp', '_v22']])
+        print(f"[WARN] No format file found (checked: {checked})")
+    
+    return outcome
+
+def _write_upload_log(logs_dir, upload_log, uploaded_count, force_reupload):
+    """Write y_logs/UPLOAD_LOG_<ts>.txt and return its path"""
+    upload_log_path = logs_dir / f"UPLOAD_LOG_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+    with open(upload_log_path, 'w', encoding='utf-8') as f:
+        f.write("="*80 + "\n")
+        f.write("GCS UPLOAD LOG\n")
+        f.write("="*80 + "\n\n")
+        f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write(f"Force Reupload: {force_reupload}\n")
+        f.write(f"Total Files: {len(upload_log)}\n")
+        f.write(f"Successful: {uploaded_count}\n")
+        f.write(f"Failed: {len([x for x in upload_log if 'error' in x])}\n")
+        f.write("\n" + "-"*80 + "\n\n")
+        
+        for item in upload_log:
+            if 'error' in item:
+                f.write(f"[FAIL] {item['file']}\n")
+                f.write(f"  Error: {item['error']}\n\n")
+            else:
+                f.write(f"[OK] {item['file']}\n")
+                f.write(f"  GCS: {item['gcs_path']}\n")
+                f.write(f"  URL: {item['url']}\n")
+                f.write(f"  Size: {item['size']:,} bytes\n\n")
+    
+    return upload_log_path
+
+def _gcs_layout(root_dir):
+    """(folder_name, pdf_directory, gcs_prefix) for a case folder's GCS upload"""
+    folder_name = root_dir.name
+    full_path_str = str(root_dir).replace('\\', '/')
+    
+    # For E:\ drive, preserve the path structure
+    if full_path_str.startswith('E:/') or full_path_str.startswith('e:/'):
+        pdf_directory = full_path_str[3:]
+    else:
+        # For other drives (G:\, etc.), use just the folder name
+        pdf_directory = folder_name
+    
+    return folder_name, pdf_directory, f"docs/{folder_name}"
+
+def _write_structure_manifest(logs_dir, root_dir, pdf_directory, gcs_prefix):
+    """Write y_logs/DIRECTORY_STRUCTURE_MANIFEST.txt and return its path"""
+    structure_manifest_path = logs_dir / "DIRECTORY_STRUCTURE_MANIFEST.txt"
+    with open(structure_manifest_path, 'w', encoding='utf-8') as f:
+        f.write("="*80 + "\n")
+        f.write("DIRECTORY STRUCTURE MANIFEST\n")
+        f.write("="*80 + "\n\n")
+        f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write(f"Root Directory: {root_dir}\n")
+        f.write(f"Folder Name: {root_dir.name}\n")
+        f.write(f"PDF Directory Path: {pdf_directory}\n")
+        f.write(f"GCS Bucket: {GCS_BUCKET}\n")
+        f.write(f"GCS Prefix: {gcs_prefix}\n")
+        f.write(f"GCS Full Path: gs://{GCS_BUCKET}/{gcs_prefix}/\n")
+        f.write("\n" + "="*80 + "\n\n")
+    return structure_manifest_path
+
+def _write_document_catalog(logs_dir, pdf_files, pdf_directory, gcs_prefix, convert_dir, format_dir):
+    """Write y_logs/DOCUMENT_CATALOG.txt (each document's file in every stage) and return its path"""
+    document_catalog_path = logs_dir / "DOCUMENT_CATALOG.txt"
+    with open(document_catalog_path, 'w', encoding='utf-8') as f:
+        f.write("="*80 + "\n")
+        f.write("DOCUMENT CATALOG\n")
+        f.write("="*80 + "\n\n")
+        f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write(f"Directory: {pdf_directory}\n")
+        f.write(f"Total Documents: {len(pdf_files)}\n")
+        f.write("\n" + "-"*80 + "\n")
+        f.write("DOCUMENTS BY PIPELINE STAGE:\n")
+        f.write("-"*80 + "\n\n")
+        
+        for i, pdf_path in enumerate(pdf_files, 1):
+            # Extract base name by removing known suffixes
+            base_name = pdf_path.stem
+            for suffix in ['_o', '_d', '_r', '_a', '_t', '_c', '_v22', '_v31', '_gp']:
+                if base_name.endswith(suffix):
+                    base_name = base_name[:-len(suffix)]
+                    break
+            
+            f.write(f"{i}. {base_name}\n")
+            f.write(f"   Clean PDF:   03_doc-clean/{pdf_path.name}\n")
+            
+            # Look for convert file with any suffix
+            convert_file = None
+            for suffix in ['_c']:
+                candidate = convert_dir / f"{base_name}{suffix}.txt"
+                if candidate.exists():
+                    convert_file = candidate
+                    break
+            
+            if convert_file:
+                f.write(f"   Convert TXT: 04_doc-convert/{convert_file.name}\n")
+            else:
+                f.write(f"   Convert TXT: [MISSING] 04_doc-convert/{base_name}_c.txt\n")
+            
+            # Look for format file with any suffix
+            format_file = None
+            for suffix in ['_v31', '_gp', '_v22']:
+                candidate = format_dir / f"{base_name}{suffix}.txt"
+                if candidate.exists():
+                    format_file = candidate
+                    break
+            
+            if format_file:
+                f.write(f"   Format TXT:  05_doc-format/{format_file.name}\n")
+            else:
+                f.write(f"   Format TXT:  [MISSING] 05_doc-format/{base_name}_v31.txt\n")
+            
+            f.write(f"   GCS Target:  gs://{GCS_BUCKET}/{gcs_prefix}/{pdf_path.name}\n")
+            f.write(f"   Public URL:  https://storage.cloud.google.com/{GCS_BUCKET}/{gcs_prefix}/{pdf_path.name}\n")
+            f.write("\n")
+    
+    return document_catalog_path
+
+def _read_header_links(text_file):
+    """(PDF DIRECTORY, PDF PUBLIC LINK) from the first lines of a 04/05 text file"""
+    with open(text_file, 'r', encoding='utf-8') as f:
+        lines = [f.readline() for _ in range(15)]
+    
+    found_dir = None
+    found_url = None
+    for line in lines:
+        if line.startswith("PDF DIRECTORY:"):
+            found_dir = line.replace("PDF DIRECTORY:", "").strip()
+        elif line.startswith("PDF PUBLIC LINK:"):
+            found_url = line.replace("PDF PUBLIC LINK:", "").strip()
+    return found_dir, found_url
+
+def _verify_document_headers(pdf_path, pdf_directory, gcs_prefix, convert_dir, format_dir):
+    """Check one document's 04/05 headers against its directory and GCS URL.
+    
+    Returns {'document', 'lines' (report lines), 'mismatches'}.
+    """
+    # Extract base name by removing known suffixes
+    base_name = pdf_path.stem
+    for suffix in ['_o', '_d', '_r', '_a', '_t', '_c', '_v22', '_v31', '_gp']:
+        if base_name.endswith(suffix):
+            base_name = base_name[:-len(suffix)]
+            break
+    
+    lines = []
+    mismatches = 0
+    expected_url = f"https://storage.cloud.google.com/{GCS_BUCKET}/{gcs_prefix}/{pdf_path.name}"
+    
+    # Check convert file, then format file (try multiple suffixes)
+    format_file = None
+    for suffix in ['_v31', '_gp', '_v22']:
+        candidate = format_dir / f"{base_name}{suffix}.txt"
+        if candidate.exists():
+            format_file = candidate
+            break
+    convert_file = convert_dir / f"{base_name}_c.txt"
+    for label, text_file in (('Convert', convert_file if convert_file.exists() else None), ('Format', format_file)):
+        if text_file is None:
+            lines.append(f"  [MISSING] {label} file not found")
+            mismatches += 1
+            continue
+        found_dir, found_url = _read_header_links(text_file)
+        
+        if found_dir == pdf_directory:
+            lines.append(f"  [OK] {label} directory matches: {found_dir}")
+        else:
+            lines.append(f"  [MISMATCH] {label} directory: expected '{pdf_directory}', found '{found_dir}'")
+            mismatches += 1
+        
+        if found_url == expected_url:
+            lines.append(f"  [OK] {label} URL matches")
+        else:
+            lines.append(f"  [MISMATCH] {label} URL: expected '{expected_url}', found '{found_url}'")
+            mismatches += 1
+    
+    return {'document': base_name, 'lines': lines, 'mismatches': mismatches}
+
+def _write_header_verification(logs_dir, verifications, pdf_directory, gcs_prefix):
+    """Write y_logs/HEADER_VERIFICATION_<ts>.txt; returns (path, mismatch count)"""
+    header_log_path = logs_dir / f"HEADER_VERIFICATION_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+    mismatch_count = 0
     
-    success_count = len([r for r in report_data['format'] if r.get('status') == 'OK'])
-    print(f"\n[OK] Formatted {success_count}/{len(txt_files)} files")
-    if skipped_count > 0:
-        print(f"[INFO] Skipped {skipped_count} already formatted files")
+    with open(header_log_path, 'w', encoding='utf-8') as f:
+        f.write("="*80 + "\n")
+        f.write("HEADER VERIFICATION REPORT\n")
+        f.write("="*80 + "\n\n")
+        f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write(f"Expected Directory: {pdf_directory}\n")
+        f.write(f"Expected GCS Prefix: {gcs_prefix}\n")
+        f.write("\n" + "-"*80 + "\n\n")
+        
+        for verification in verifications:
+            f.write(f"Document: {verification['document']}\n")
+            for line in verification['lines']:
+                f.write(line + "\n")
+            f.write("\n")
+            mismatch_count += verification['mismatches']
+    
+    return header_log_path, mismatch_count
 
-# === PHASE 6: GCS UPLOAD - COMPREHENSIVE STRUCTURE MANAGEMENT ===
 def phase6_gcs_upload(root_dir, force_reupload=False):
     """Upload cleaned PDFs to GCS with comprehensive directory structure management.
     
@@ -1814,33 +2597,8 @@ def phase6_gcs_upload(root_dir, force_reupload=False):
     
     # STEP 1: Create directory structure documentation
     print("\n[STEP 1] Creating directory structure documentation...")
-    folder_name = root_dir.name
-    full_path_str = str(root_dir).replace('\\', '/')
-    
-    # For E:\ drive, preserve the path structure
-    if full_path_str.startswith('E:/') or full_path_str.startswith('e:/'):
-        full_path = full_path_str[3:]
-    else:
-        # For other drives (G:\, etc.), use just the folder name
-        full_path = folder_name
-    
-    gcs_prefix = f"docs/{folder_name}"
-    pdf_directory = full_path
-    
-    # Create structure manifest
-    structure_manifest_path = logs_dir / "DIRECTORY_STRUCTURE_MANIFEST.txt"
-    with open(structure_manifest_path, 'w', encoding='utf-8') as f:
-        f.write("="*80 + "\n")
-        f.write("DIRECTORY STRUCTURE MANIFEST\n")
-        f.write("="*80 + "\n\n")
-        f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"Root Directory: {root_dir}\n")
-        f.write(f"Folder Name: {folder_name}\n")
-        f.write(f"PDF Directory Path: {pdf_directory}\n")
-        f.write(f"GCS Bucket: {GCS_BUCKET}\n")
-        f.write(f"GCS Prefix: {gcs_prefix}\n")
-        f.write(f"GCS Full Path: gs://{GCS_BUCKET}/{gcs_prefix}/\n")
-        f.write("\n" + "="*80 + "\n\n")
+    folder_name, pdf_directory, gcs_prefix = _gcs_layout(root_dir)
+    structure_manifest_path = _write_structure_manifest(logs_dir, root_dir, pdf_directory, gcs_prefix)
     
     print(f"[OK] Structure manifest created: {structure_manifest_path.name}")
     print(f"[INFO] PDF Directory: {pdf_directory}")
@@ -1864,58 +2622,8 @@ def phase6_gcs_upload(root_dir, force_reupload=False):
     # Sort by file size (smallest to largest)
     pdf_files.sort(key=lambda x: x.stat().st_size)
     
-    document_catalog_path = logs_dir / "DOCUMENT_CATALOG.txt"
-    with open(document_catalog_path, 'w', encoding='utf-8') as f:
-        f.write("="*80 + "\n")
-        f.write("DOCUMENT CATALOG\n")
-        f.write("="*80 + "\n\n")
-        f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"Directory: {pdf_directory}\n")
-        f.write(f"Total Documents: {len(pdf_files)}\n")
-        f.write("\n" + "-"*80 + "\n")
-        f.write("DOCUMENTS BY PIPELINE STAGE:\n")
-        f.write("-"*80 + "\n\n")
-        
-        for i, pdf_path in enumerate(pdf_files, 1):
-            # Extract base name by removing known suffixes
-            base_name = pdf_path.stem
-            for suffix in ['_o', '_d', '_r', '_a', '_t', '_c', '_v22', '_v31', '_gp']:
-                if base_name.endswith(suffix):
-                    base_name = base_name[:-len(suffix)]
-                    break
-            
-            f.write(f"{i}. {base_name}\n")
-            f.write(f"   Clean PDF:   03_doc-clean/{pdf_path.name}\n")
-            
-            # Look for convert file with any suffix
-            convert_file = None
-            for suffix in ['_c']:
-                candidate = convert_dir / f"{base_name}{suffix}.txt"
-                if candidate.exists():
-                    convert_file = candidate
-                    break
-            
-            if convert_file:
-                f.write(f"   Convert TXT: 04_doc-convert/{convert_file.name}\n")
-            else:
-                f.write(f"   Convert TXT: [MISSING] 04_doc-convert/{base_name}_c.txt\n")
-            
-            # Look for format file with any suffix
-            format_file = None
-            for suffix in ['_v31', '_gp', '_v22']:
-                candidate = format_dir / f"{base_name}{suffix}.txt"
-                if candidate.exists():
-                    format_file = candidate
-                    break
-            
-            if format_file:
-                f.write(f"   Format TXT:  05_doc-format/{format_file.name}\n")
-            else:
-                f.write(f"   Format TXT:  [MISSING] 05_doc-format/{base_name}_v31.txt\n")
-            
-            f.write(f"   GCS Target:  gs://{GCS_BUCKET}/{gcs_prefix}/{pdf_path.name}\n")
-            f.write(f"   Public URL:  https://storage.cloud.google.com/{GCS_BUCKET}/{gcs_prefix}/{pdf_path.name}\n")
-            f.write("\n")
+    document_catalog_path = _write_document_catalog(logs_dir, pdf_files, pdf_directory, gcs_prefix,
+                                                    convert_dir, format_dir)
     
     print(f"[OK] Document catalog created: {document_catalog_path.name}")
     print(f"[INFO] Found {len(pdf_files)} PDFs to process")
@@ -2001,118 +2709,31 @@ def phase6_gcs_upload(root_dir, force_reupload=False):
     # Upload all PDFs
     print(f"\n[UPLOAD] Processing {len(pdf_files)} PDFs...")
     upload_log = []
+    copied_count = 0
     convert_updated_count = 0
     format_updated_count = 0
     
     for pdf_path in pdf_files:
         try:
-            # Upload to GCS with full directory path
-            blob_name = f"{gcs_prefix}/{pdf_path.name}"
-            blob = bucket.blob(blob_name)
-            
-            # CRITICAL: Delete existing file first to ensure fresh upload
-            if force_reupload or blob.exists():
-                if blob.exists():
-                    blob.delete()
-            
-            # Upload new file
-            if force_reupload or not blob.exists():
-                print(f"\n[UPLOAD] {pdf_path.name} -> gs://{GCS_BUCKET}/{blob_name}")
-                blob.upload_from_filename(str(pdf_path))
-                blob.make_public()
+            with measure() as m:
+                outcome = _upload_pdf_and_update_headers(pdf_path, bucket, gcs_prefix, pdf_directory,
+                                                         convert_dir, format_dir, force_reupload)
+            m.add(api_calls=outcome['api_calls'], bytes_in=pdf_path.stat().st_size if outcome['uploaded'] else 0)
+            metrics.add_file('gcs_upload', pdf_path.name, 'OK', m.as_dict())
+            if outcome['uploaded']:
                 uploaded_count += 1
-                print(f"[OK] Uploaded")
-                
-                # Log upload
-                gcs_url = f"https://storage.cloud.google.com/{GCS_BUCKET}/{blob_name}"
-                upload_log.append({
-                    'file': pdf_path.name,
-                    'gcs_path': blob_name,
-                    'url': gcs_url,
-                    'size': pdf_path.stat().st_size
-                })
-            
-            # Generate GCS URL (always do this for header updates)
-            gcs_url = f"https://storage.cloud.google.com/{GCS_BUCKET}/{blob_name}"
-            
-            # Find corresponding files - extract base name by removing known suffixes
-            base_name = pdf_path.stem
-            for suffix in ['_o', '_d', '_r', '_a', '_t', '_c', '_v22', '_v31', '_gp']:
-                if base_name.endswith(suffix):
-                    base_name = base_name[:-len(suffix)]
-                    break
-            
-            # Find convert file (look for any _c.txt file)
-            convert_file = None
-            if convert_dir.exists():
-                candidate = convert_dir / f"{base_name}_c.txt"
-                if candidate.exists():
-                    convert_file = candidate
-            
-            # Find format file (look for any format suffix)
-            format_file = None
-            if format_dir.exists():
-                for suffix in ['_v31', '_gp', '_v22']:
-                    candidate = format_dir / f"{base_name}{suffix}.txt"
-                    if candidate.exists():
-                        format_file = candidate
-                        break
-            
-            # Update 04_doc-convert/*_c.txt header
-            if convert_file and convert_file.exists():
-                with open(convert_file, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-                
-                # Update PDF DIRECTORY and PDF PUBLIC LINK lines in template
-                updated = False
-                for i, line in enumerate(lines):
-                    if line.startswith("PDF DIRECTORY:"):
-                        lines[i] = f"PDF DIRECTORY: {pdf_directory}\n"
-                        updated = True
-                    elif line.startswith("PDF PUBLIC LINK:") or line.startswith("PDF PUBLIC URL:"):
-                        lines[i] = f"PDF PUBLIC LINK: {gcs_url}\n"
-                        updated = True
-                
-                if updated:
-                    with open(convert_file, 'w', encoding='utf-8') as f:
-                        f.writelines(lines)
-                    convert_updated_count += 1
-                    print(f"[OK] Updated header in: {convert_file.name}")
-                else:
-                    print(f"[WARN] No header lines found to update in: {convert_file.name}")
-            
-            # Update 05_doc-format/*_v31.txt header
-            if format_file and format_file.exists():
-                with open(format_file, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-                
-                # Update PDF DIRECTORY and PDF PUBLIC LINK lines in template
-                updated = False
-                for i, line in enumerate(lines):
-                    if line.startswith("PDF DIRECTORY:"):
-                        lines[i] = f"PDF DIRECTORY: {pdf_directory}\n"
-                        updated = True
-                    elif line.startswith("PDF PUBLIC LINK:") or line.startswith("PDF PUBLIC URL:"):
-                        lines[i] = f"PDF PUBLIC LINK: {gcs_url}\n"
-                        updated = True
-                
-                if updated:
-                    with open(format_file, 'w', encoding='utf-8') as f:
-                        f.writelines(lines)
-                    format_updated_count += 1
-                    print(f"[OK] Updated header in: {format_file.name}")
-                else:
-                    print(f"[WARN] No header lines found to update in: {format_file.name}")
-            
-            if not convert_file or not convert_file.exists():
-                print(f"[WARN] No convert file found: {base_name}_c.txt")
-            if not format_file or not format_file.exists():
-                # List possible format file suffixes that were checked
-                checked = ', '.join([f"{base_name}{s}.txt" for s in ['_v31', '_gp', '_v22']])
-                print(f"[WARN] No format file found (checked: {checked})")
+            elif outcome.get('reused_from'):
+                copied_count += 1
+            if outcome['log']:
+                upload_log.append(outcome['log'])
+            if outcome['convert_updated']:
+                convert_updated_count += 1
+            if outcome['format_updated']:
+                format_updated_count += 1
         
         except Exception as e:
             print(f"[FAIL] Error uploading {pdf_path.name}: {e}")
+            metrics.add_file('gcs_upload', pdf_path.name, 'FAILED')
             upload_log.append({
                 'file': pdf_path.name,
                 'error': str(e)
@@ -2120,125 +2741,21 @@ def phase6_gcs_upload(root_dir, force_reupload=False):
             continue
     
     # Save upload log
-    upload_log_path = logs_dir / f"UPLOAD_LOG_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-    with open(upload_log_path, 'w', encoding='utf-8') as f:
-        f.write("="*80 + "\n")
-        f.write("GCS UPLOAD LOG\n")
-        f.write("="*80 + "\n\n")
-        f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"Force Reupload: {force_reupload}\n")
-        f.write(f"Total Files: {len(upload_log)}\n")
-        f.write(f"Successful: {uploaded_count}\n")
-        f.write(f"Failed: {len([x for x in upload_log if 'error' in x])}\n")
-        f.write("\n" + "-"*80 + "\n\n")
-        
-        for item in upload_log:
-            if 'error' in item:
-                f.write(f"[FAIL] {item['file']}\n")
-                f.write(f"  Error: {item['error']}\n\n")
-            else:
-                f.write(f"[OK] {item['file']}\n")
-                f.write(f"  GCS: {item['gcs_path']}\n")
-                f.write(f"  URL: {item['url']}\n")
-                f.write(f"  Size: {item['size']:,} bytes\n\n")
+    upload_log_path = _write_upload_log(logs_dir, upload_log, uploaded_count, force_reupload)
     
     print(f"\n[OK] Upload log saved: {upload_log_path.name}")
     print(f"[SUMMARY] Deleted {deleted_count} existing file(s) from GCS")
     print(f"[SUMMARY] Uploaded {uploaded_count}/{len(pdf_files)} PDFs to GCS")
+    if copied_count:
+        print(f"[SUMMARY] Copied {copied_count} PDFs already in GCS for other folders (no upload)")
     print(f"[SUMMARY] Updated {convert_updated_count} convert files (04_doc-convert)")
     print(f"[SUMMARY] Updated {format_updated_count} format files (05_doc-format)")
     
     # STEP 6: Verify all 04 and 05 headers match directory structure
     print("\n[STEP 6] Verifying header consistency...")
-    header_log_path = logs_dir / f"HEADER_VERIFICATION_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-    mismatch_count = 0
-    
-    with open(header_log_path, 'w', encoding='utf-8') as f:
-        f.write("="*80 + "\n")
-        f.write("HEADER VERIFICATION REPORT\n")
-        f.write("="*80 + "\n\n")
-        f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"Expected Directory: {pdf_directory}\n")
-        f.write(f"Expected GCS Prefix: {gcs_prefix}\n")
-        f.write("\n" + "-"*80 + "\n\n")
-        
-        for pdf_path in pdf_files:
-            # Extract base name by removing known suffixes
-            base_name = pdf_path.stem
-            for suffix in ['_o', '_d', '_r', '_a', '_t', '_c', '_v22', '_v31', '_gp']:
-                if base_name.endswith(suffix):
-                    base_name = base_name[:-len(suffix)]
-                    break
-            
-            f.write(f"Document: {base_name}\n")
-            
-            # Check convert file
-            convert_file = convert_dir / f"{base_name}_c.txt"
-            if convert_file.exists():
-                with open(convert_file, 'r', encoding='utf-8') as cf:
-                    lines = cf.readlines()
-                
-                found_dir = None
-                found_url = None
-                for line in lines[:15]:
-                    if line.startswith("PDF DIRECTORY:"):
-                        found_dir = line.replace("PDF DIRECTORY:", "").strip()
-                    elif line.startswith("PDF PUBLIC LINK:"):
-                        found_url = line.replace("PDF PUBLIC LINK:", "").strip()
-                
-                if found_dir == pdf_directory:
-                    f.write(f"  [OK] Convert directory matches: {found_dir}\n")
-                else:
-                    f.write(f"  [MISMATCH] Convert directory: expected '{pdf_directory}', found '{found_dir}'\n")
-                    mismatch_count += 1
-                
-                expected_url = f"https://storage.cloud.google.com/{GCS_BUCKET}/{gcs_prefix}/{pdf_path.name}"
-                if found_url == expected_url:
-                    f.write(f"  [OK] Convert URL matches\n")
-                else:
-                    f.write(f"  [MISMATCH] Convert URL: expected '{expected_url}', found '{found_url}'\n")
-                    mismatch_count += 1
-            else:
-                f.write(f"  [MISSING] Convert file not found\n")
-                mismatch_count += 1
-            
-            # Check format file (try multiple suffixes)
-            format_file = None
-            for suffix in ['_v31', '_gp', '_v22']:
-                candidate = format_dir / f"{base_name}{suffix}.txt"
-                if candidate.exists():
-                    format_file = candidate
-                    break
-            
-            if format_file:
-                with open(format_file, 'r', encoding='utf-8') as ff:
-                    lines = ff.readlines()
-                
-                found_dir = None
-                found_url = None
-                for line in lines[:15]:
-                    if line.startswith("PDF DIRECTORY:"):
-                        found_dir = line.replace("PDF DIRECTORY:", "").strip()
-                    elif line.startswith("PDF PUBLIC LINK:"):
-                        found_url = line.replace("PDF PUBLIC LINK:", "").strip()
-                
-                if found_dir == pdf_directory:
-                    f.write(f"  [OK] Format directory matches: {found_dir}\n")
-                else:
-                    f.write(f"  [MISMATCH] Format directory: expected '{pdf_directory}', found '{found_dir}'\n")
-                    mismatch_count += 1
-                
-                expected_url = f"https://storage.cloud.google.com/{GCS_BUCKET}/{gcs_prefix}/{pdf_path.name}"
-                if found_url == expected_url:
-                    f.write(f"  [OK] Format URL matches\n")
-                else:
-                    f.write(f"  [MISMATCH] Format URL: expected '{expected_url}', found '{found_url}'\n")
-                    mismatch_count += 1
-            else:
-                f.write(f"  [MISSING] Format file not found\n")
-                mismatch_count += 1
-            
-            f.write("\n")
+    verifications = [_verify_document_headers(pdf_path, pdf_directory, gcs_prefix, convert_dir, format_dir)
+                     for pdf_path in pdf_files]
+    header_log_path, mismatch_count = _write_header_verification(logs_dir, verifications, pdf_directory, gcs_prefix)
     
     print(f"[OK] Header verification saved: {header_log_path.name}")
     if mismatch_count == 0:
@@ -2894,7 +3411,6 @@ def repair_specific_pages(root_dir, base_name, problem_pages, overall_accuracy):
         print(f"    [INFO] Document has {len(pages)} pages, repairing {len(problem_pages)} pages")
         
         # Load Gemini API
-        import google.generativeai as genai
         genai.configure(api_key=GEMINI_API_KEY)
         model = genai.GenerativeModel(MODEL_NAME)
         
@@ -2919,17 +3435,18 @@ Page content to fix:"""
             marker, content = pages[page_idx][1], pages[page_idx][2]
             print(f"      Reformatting page {page_num}...")
             
-            # Call Gemini to reformat just this page
-            response = model.generate_content(
-                prompt + "\n\n" + content.strip(),
-                generation_config=genai.types.GenerationConfig(
+            # Call Gemini to reformat just this page (streamed; restarts if it stalls)
+            page_text, _ = generate_with_resume(
+                model, prompt, content.strip(),
+                genai.types.GenerationConfig(
                     temperature=0.1,
                     max_output_tokens=8192  # Single page shouldn't exceed this
-                )
+                ),
+                label=f"{base_name} page {page_num}"
             )
             
             # Replace the content for this page
-            pages[page_idx] = (page_num, marker, "\n\n" + response.text.strip() + "\n\n")
+            pages[page_idx] = (page_num, marker, "\n\n" + page_text.strip() + "\n\n")
             print(f"      [OK] Page {page_num} reformatted")
         
         # Reassemble document
@@ -2944,8 +3461,7 @@ Page content to fix:"""
         final_text = header + new_body.strip() + "\n\n" + footer
         
         # Write updated file
-        with open(formatted_file, 'w', encoding='utf-8') as f:
-            f.write(final_text)
+        atomic_write_text(formatted_file, final_text)
         
         print(f"    [OK] Repaired {len(problem_pages)} pages in {formatted_file.name}")
     
@@ -2970,12 +3486,15 @@ def reprocess_pdf_enhanced(root_dir, base_name):
         return
     
     try:
-        import subprocess
         import fitz  # PyMuPDF
         
         # Step 1: Clean metadata with PyMuPDF
         temp_clean = clean_dir / f"{base_name}_temp.pdf"
+        # _o.pdf may be a hardlink/reflink of _r.pdf (or of another folder's _o.pdf):
+        # write the repair to a new file and rename it over _o.pdf, never into it
+        repaired = clean_dir / f"{base_name}_repair.pdf"
         doc = fitz.open(pdf_renamed)
+        page_count = doc.page_count
         doc.set_metadata({})  # Clear all metadata
         doc.save(temp_clean, garbage=4, deflate=True)
         doc.close()
@@ -2993,17 +3512,21 @@ def reprocess_pdf_enhanced(root_dir, base_name):
             "--oversample", "1200",  # Higher DPI for better quality
             "--jpeg-quality", "95",  # Higher JPEG quality
             "--output-type", "pdfa", # PDF/A format
+            "--jobs", str(max(1, min(page_count, cpu_budget()))),  # Repairs run one at a time
             str(temp_clean),
-            str(pdf_clean)
+            str(repaired)
         ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
+        # 1200 DPI costs about twice the Phase 3 per-page budget
+        result = run_subprocess(cmd, timeout_for(page_count, 2 * OCR_SECONDS_PER_PAGE), tool_env())
         
-        if result.returncode == 0:
+        if result.ok and repaired.exists():
+            os.replace(repaired, pdf_clean)
             print(f"    [OK] Enhanced OCR complete: {pdf_clean.name}")
             temp_clean.unlink()  # Remove temp file
         else:
-            print(f"    [WARN] OCR had issues: {result.stderr}")
+            print(f"    [WARN] OCR had issues: {result.message}")
+            repaired.unlink(missing_ok=True)
             # Use temp file as fallback
             if temp_clean.exists():
                 temp_clean.rename(pdf_clean)
@@ -3012,8 +3535,7 @@ def reprocess_pdf_enhanced(root_dir, base_name):
         print(f"    [ERROR] Enhanced OCR failed: {e}")
         # Fallback: copy original if nothing else worked
         if not pdf_clean.exists() and pdf_renamed.exists():
-            import shutil
-            shutil.copy2(pdf_renamed, pdf_clean)
+            materialize(pdf_renamed, pdf_clean)
 
 def reconvert_single_file(root_dir, base_name):
     """Re-extract text from PDF using Google Vision API"""
@@ -3076,8 +3598,7 @@ END OF PROCESSED DOCUMENT
         full_text = header + extracted_text + footer
         
         # Write converted text
-        with open(txt_path, 'w', encoding='utf-8') as f:
-            f.write(full_text)
+        atomic_write_text(txt_path, full_text)
         
         print(f"    [OK] Text re-extracted: {txt_path.name}")
     
@@ -3087,7 +3608,6 @@ END OF PROCESSED DOCUMENT
 def extract_text_with_vision(pdf_path):
     """Extract text using Google Vision API in batches"""
     import fitz
-    from google.cloud import vision
     import io
     
     client = vision.ImageAnnotatorClient()
@@ -3180,27 +3700,11 @@ def format_single_file(root_dir, base_name):
         footer = full_text[footer_start:]  # Includes the === line before END
         
         # Use EXACT v31 prompt from Phase 5
-        prompt = """You are correcting OCR output for a legal document. Your task is to:
-1. Fix OCR errors and preserve legal terminology
-2. CRITICAL: Preserve ALL page markers EXACTLY as they appear: '[BEGIN PDF Page N]' with blank lines before and after
-3. NEVER remove or modify page markers, especially [BEGIN PDF Page 1] - it MUST be preserved
-4. NEVER move page markers - they must stay at the START of each page's content
-5. Format with lines under 65 characters and proper paragraph breaks
-6. Render logo/header text on SINGLE lines (e.g., "MERRY FARNEN & RYAN" not multi-line)
-7. Use standard bullet points (•) not filled circles (⚫)
-8. Use full forwarded message marker: "---------- Forwarded message ---------"
-9. Return only the corrected text with ALL page markers in their ORIGINAL positions
-
-CRITICAL STRUCTURE:
-[BEGIN PDF Page 1]
-
-<content for page 1>
-
-[BEGIN PDF Page 2]
-
-<content for page 2>
-
-DO NOT move markers to the end of content. Keep them at the START."""
+        prompt = FORMAT_PROMPT
+        
+        # Streamed output so far is kept here until each call completes
+        partial_dir = format_dir / "_log" / base_name
+        partial_dir.mkdir(parents=True, exist_ok=True)
         
         # Check if document needs chunking (count pages)
         page_count = len(re.findall(r'\[BEGIN PDF Page \d+\]', raw_body))
@@ -3213,14 +3717,16 @@ DO NOT move markers to the end of content. Keep them at the START."""
             
             for idx, chunk in enumerate(chunks, 1):
                 print(f"      Processing chunk {idx}/{len(chunks)}...")
-                response = model.generate_content(
-                    prompt + "\n\n" + chunk,
-                    generation_config=genai.types.GenerationConfig(
+                cleaned_chunk, _ = generate_with_resume(
+                    model, prompt, chunk,
+                    genai.types.GenerationConfig(
                         temperature=0.1,
                         max_output_tokens=MAX_OUTPUT_TOKENS
-                    )
+                    ),
+                    partial_path=partial_dir / f"repair_{idx:03d}.partial",
+                    label=f"{base_name} chunk {idx}"
                 )
-                cleaned_chunks.append(response.text.strip())
+                cleaned_chunks.append(cleaned_chunk.strip())
             
             # Consolidate chunks
             cleaned_body = "\n\n".join(cleaned_chunks)
@@ -3228,14 +3734,16 @@ DO NOT move markers to the end of content. Keep them at the START."""
         
         else:
             # Small document - process in single call
-            response = model.generate_content(
-                prompt + "\n\n" + raw_body,
-                generation_config=genai.types.GenerationConfig(
+            cleaned_body, _ = generate_with_resume(
+                model, prompt, raw_body,
+                genai.types.GenerationConfig(
                     temperature=0.1,
                     max_output_tokens=MAX_OUTPUT_TOKENS
-                )
+                ),
+                partial_path=partial_dir / "repair_001.partial",
+                label=base_name
             )
-            cleaned_body = response.text.strip()
+            cleaned_body = cleaned_body.strip()
         
         # Reassemble: header + cleaned_body + footer (like v21/Phase 5)
         # CRITICAL: Ensure blank lines between sections
@@ -3246,8 +3754,7 @@ DO NOT move markers to the end of content. Keep them at the START."""
         final_text = header + cleaned_body + "\n\n" + footer
         
         # Write formatted output
-        with open(formatted_file, 'w', encoding='utf-8') as f:
-            f.write(final_text)
+        atomic_write_text(formatted_file, final_text)
         
         print(f"    [OK] Reformatted: {formatted_file.name} ({page_count} pages)")
     
@@ -3318,8 +3825,7 @@ def update_headers_single_file(root_dir, base_name):
             else:
                 updated_lines.append(line)
         
-        with open(formatted_file, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(updated_lines))
+        atomic_write_text(formatted_file, '\n'.join(updated_lines))
         
         print(f"    [OK] Updated headers in {formatted_file.name}")
     
@@ -3339,8 +3845,7 @@ def update_headers_single_file(root_dir, base_name):
             else:
                 updated_lines.append(line)
         
-        with open(convert_file, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(updated_lines))
+        atomic_write_text(convert_file, '\n'.join(updated_lines))
 
 def get_public_url_for_pdf(root_dir, pdf_filename):
     """Get or construct public URL for a PDF"""
@@ -3440,6 +3945,194 @@ def phase8_repair(root_dir):
     print("[INFO] Run Phase 7 (Verify) again to confirm all issues are resolved")
     print("="*80)
 
+# === STREAMING PIPELINE - Per-file dataflow across Phases 3-6 ===
+PIPELINE_PHASES = ['clean', 'convert', 'format', 'gcs_upload']
+
+def run_pipeline(root_dir, phases, force_reupload=False):
+    """Run Phases 3-6 per file: each document moves to its next phase as soon
+    as the previous one finishes, instead of waiting for the whole batch.
+    
+    Uses the same per-file workers and output directories as the phase
+    functions; OCR runs in a process pool, Vision/Gemini/GCS in thread pools.
+    """
+    phases = [p for p in PIPELINE_PHASES if p in phases]
+    print("\nPIPELINE: STREAMING " + " -> ".join(p.upper() for p in phases))
+    print("-" * 80)
+    
+    # Ensure directory structure exists
+    ensure_directory_structure(root_dir)
+    
+    renamed_dir = root_dir / "02_doc-renamed"
+    clean_dir = root_dir / "03_doc-clean"
+    convert_dir = root_dir / "04_doc-convert"
+    format_dir = root_dir / "05_doc-format"
+    logs_dir = root_dir / "y_logs"
+    
+    # Documents enter the pipeline at the first requested phase
+    entry_inputs = {
+        'clean': (renamed_dir, "*_r.pdf"),
+        'convert': (clean_dir, "*_o.pdf"),
+        'format': (convert_dir, "*_c.txt"),
+        'gcs_upload': (clean_dir, "*_o.pdf"),
+    }
+    input_dir, pattern = entry_inputs[phases[0]]
+    input_files = [f for f in input_dir.glob(pattern) if not f.name.startswith('_')]
+    
+    if not input_files:
+        print(f"[SKIP] No input files found in {input_dir.name}")
+        return
+    
+    # Sort by file size (smallest to largest)
+    input_files.sort(key=lambda x: x.stat().st_size)
+    items = [f.stem[:-2] for f in input_files]  # Remove _r/_o/_c suffix
+    
+    # Documents processed before in another folder: reuse those outputs, so their stages are skipped
+    _reuse_prior_artifacts(root_dir, items, phases)
+    
+    # Resume is journal-checked per stage, as in the phase functions
+    journal = get_journal(root_dir)
+    
+    def journal_input(stage_name, base_name):
+        """Journal kwargs identifying a stage's input for base_name"""
+        if stage_name == 'clean':
+            return {'input_path': renamed_dir / f"{base_name}_r.pdf"}
+        if stage_name == 'convert':
+            return {'input_path': clean_dir / f"{base_name}_o.pdf"}
+        if stage_name == 'format':
+            return {'input_hash': _format_input_hash(convert_dir / f"{base_name}_c.txt", FORMAT_PROMPT)}
+        return {}
+    
+    stages = []
+    ocr_slots = ocr_workers()
+    if 'clean' in phases:
+        stages.append(Stage(
+            name='clean', func=process_clean_pdf, kind='process', workers=ocr_slots,
+            make_args=lambda b: (renamed_dir / f"{b}_r.pdf", clean_dir),
+            is_done=lambda b: journal.should_skip(b, 'clean', clean_dir / f"{b}_o.pdf",
+                                                  input_path=renamed_dir / f"{b}_r.pdf"),
+            initializer=init_worker, initargs=(CoreBudget(cpu_budget(), slots=ocr_slots),)
+        ))
+    
+    if 'convert' in phases:
+        try:
+            client = vision.ImageAnnotatorClient()
+        except Exception as e:
+            print(f"[FAIL] Could not initialize Google Vision: {e}")
+            return
+        stages.append(Stage(
+            name='convert', func=_process_convert_pdf, workers=MAX_WORKERS_IO,
+            make_args=lambda b: (clean_dir / f"{b}_o.pdf", root_dir, convert_dir / f"{b}_c.txt", client),
+            is_done=lambda b: journal.should_skip(b, 'convert', convert_dir / f"{b}_c.txt",
+                                                  input_path=clean_dir / f"{b}_o.pdf")
+        ))
+    
+    if 'format' in phases:
+        genai.configure(api_key=GEMINI_API_KEY)
+        stages.append(Stage(
+            name='format', func=_process_format_file, workers=MAX_WORKERS_IO,
+            make_args=lambda b: (convert_dir / f"{b}_c.txt", format_dir, FORMAT_PROMPT),
+            is_done=lambda b: _format_is_done(journal, convert_dir / f"{b}_c.txt",
+                                              format_dir / f"{b}_v31.txt", FORMAT_PROMPT)
+        ))
+    
+    upload_log = []
+    verifications = {}
+    if 'gcs_upload' in phases:
+        folder_name, pdf_directory, gcs_prefix = _gcs_layout(root_dir)
+        
+        try:
+            bucket = storage.Client().bucket(GCS_BUCKET)
+        except Exception as e:
+            print(f"[FAIL] Could not initialize GCS client: {e}")
+            return
+        
+        def upload_document(base_name):
+            pdf_path = clean_dir / f"{base_name}_o.pdf"
+            with measure() as m:
+                try:
+                    outcome = _upload_pdf_and_update_headers(pdf_path, bucket, gcs_prefix, pdf_directory,
+                                                             convert_dir, format_dir, force_reupload)
+                except Exception as e:
+                    upload_log.append({'file': pdf_path.name, 'error': str(e)})
+                    return ProcessingResult(file_name=pdf_path.name, status='FAILED', error=str(e))
+            if outcome['log']:
+                upload_log.append(outcome['log'])
+            m.add(api_calls=outcome['api_calls'], bytes_in=pdf_path.stat().st_size if outcome['uploaded'] else 0)
+            # Same header check as Phase 6 STEP 6, per document as soon as its upload is done
+            verification = _verify_document_headers(pdf_path, pdf_directory, gcs_prefix, convert_dir, format_dir)
+            verifications[base_name] = verification
+            if verification['mismatches']:
+                print(f"[WARN] gcs_upload: {verification['mismatches']} header mismatch(es) in {base_name}")
+            return attach_metrics(ProcessingResult(file_name=pdf_path.name, status='OK', metadata=outcome), m)
+        
+        stages.append(Stage(name='gcs_upload', func=upload_document, workers=MAX_WORKERS_IO))
+    
+    def on_start(base_name, stage_name):
+        if stage_name != 'gcs_upload':
+            journal.record(base_name, stage_name, STARTED, **journal_input(stage_name, base_name))
+    
+    def on_result(base_name, stage_name, result):
+        metrics.add_result(stage_name, base_name, result)
+        if result.status == 'SKIPPED':
+            print(f"[SKIP] {stage_name}: {base_name} already done")
+            return
+        ok = result.status in ['OK', 'PARTIAL', 'COPIED']
+        if stage_name != 'gcs_upload':
+            journal.record(base_name, stage_name, DONE if ok else FAILED,
+                           error=result.error, **journal_input(stage_name, base_name))
+        if ok:
+            print(f"[OK] {stage_name}: {result.file_name}")
+            if stage_name in _REUSABLE_STAGES:
+                _register_stage_output(root_dir, base_name, stage_name)
+        else:
+            print(f"[FAIL] {stage_name}: {result.file_name}: {result.error or 'Unknown error'}")
+        
+        metadata = result.metadata if result.metadata else {}
+        if stage_name == 'clean':
+            report_data['clean'].append({'file': f"{base_name}_r.pdf", 'status': result.status if ok else 'FAILED'})
+        elif stage_name == 'convert':
+            entry = {'file': f"{base_name}_o.pdf", 'status': 'OK' if ok else 'FAILED'}
+            if ok:
+                entry.update({'pages': metadata.get('pages', 0), 'chars': metadata.get('chars', 0)})
+            else:
+                entry['error'] = result.error
+            report_data['convert'].append(entry)
+        elif stage_name == 'format':
+            entry = {'file': f"{base_name}_c.txt", 'status': 'OK' if ok else 'FAILED'}
+            if ok:
+                entry.update({'chars_in': metadata.get('chars_in', 0), 'chars_out': metadata.get('chars_out', 0)})
+            else:
+                entry['error'] = result.error
+            report_data['format'].append(entry)
+    
+    print(f"[INFO] Streaming {len(items)} documents through {len(stages)} stages "
+          f"({ocr_slots} OCR workers on {cpu_budget()} cores, {MAX_WORKERS_IO} I/O workers per stage)...")
+    results = PipelineScheduler(stages, on_result=on_result, on_start=on_start).run(items)
+    
+    if 'gcs_upload' in phases:
+        # Phase 6 reports, written once the DAG has finished
+        logs_dir.mkdir(exist_ok=True)
+        uploaded_count = len([x for x in upload_log if 'error' not in x])
+        upload_log_path = _write_upload_log(logs_dir, upload_log, uploaded_count, force_reupload)
+        print(f"[OK] Upload log saved: {upload_log_path.name}")
+        structure_manifest_path = _write_structure_manifest(logs_dir, root_dir, pdf_directory, gcs_prefix)
+        print(f"[OK] Structure manifest created: {structure_manifest_path.name}")
+        uploaded_pdfs = [clean_dir / f"{b}_o.pdf" for b in items if b in verifications]
+        document_catalog_path = _write_document_catalog(logs_dir, uploaded_pdfs, pdf_directory, gcs_prefix,
+                                                        convert_dir, format_dir)
+        print(f"[OK] Document catalog created: {document_catalog_path.name}")
+        header_log_path, mismatch_count = _write_header_verification(
+            logs_dir, [verifications[b] for b in items if b in verifications], pdf_directory, gcs_prefix)
+        print(f"[OK] Header verification saved: {header_log_path.name}")
+        if mismatch_count == 0:
+            print(f"[OK] All headers match directory structure")
+        else:
+            print(f"[WARN] Found {mismatch_count} header mismatches - see log for details")
+    
+    completed = len([r for r in results.values() if len(r) == len(stages)
+                     and all(res.status != 'FAILED' for _, res in r)])
+    print(f"\n[OK] Pipeline completed {completed}/{len(items)} documents through all stages")
+
 # === INTERACTIVE MENU ===
 def interactive_menu():
     """Interactive menu for user to select phases and verification mode"""
@@ -3513,7 +4206,8 @@ def confirm_phase(phase_name):
         'convert': 'Text convertion with Google Vision API with _c suffix',
         'format': 'AI-powered text formatting with Gemini with _v31 suffix',
         'gcs_upload': 'Upload PDFs to GCS and update file headers with directory and public links',
-        'verify': 'Comprehensive verification: PDF directory, online access, and content accuracy'
+        'verify': 'Comprehensive verification: PDF directory, online access, and content accuracy',
+        'pipeline': 'Streaming clean/convert/format/gcs_upload per file (phases overlap across files)'
     }
     
     print("\n" + "-"*80)
@@ -3541,6 +4235,11 @@ def print_phase_overview():
     print("    * Remove existing suffixes (_o, _d, _r, _a, _t, _c, _v22, _v31)")
     print("    * Add _d suffix (document/original)")
     print("    * Move to 01_doc-original/")
+    print("  Step 1.3: Detect duplicates")
+    print("    * Exact duplicates by sha256, near duplicates by MinHash/LSH over page text")
+    print("    * Scans by perceptual page hashes, also against the cross-folder index (reported, not moved)")
+    print("    * Gemini confirms ambiguous pairs only")
+    print("    * Move duplicates to 01_doc-original/_duplicate/")
     print("  Output: *_d.pdf -> 01_doc-original/")
     
     print("\nPHASE 2: RENAME - ADD DATE PREFIX, PRESERVE ORIGINAL NAME")
@@ -3573,6 +4272,9 @@ def print_phase_overview():
     print("    * OCR with 600 DPI oversample")
     print("    * Output as PDF/A format")
     print("    * Fallback: Ghostscript flatten or copy if OCR fails")
+    print("    * Little or no text: preprocess pages (PIL), Tesseract per page in parallel,")
+    print("      text layer merged onto the original pages (ocrmypdf if Tesseract fails)")
+    print("    * Original page images are kept; DOCPROCESS_OCR_OUTPUT=raster outputs the preprocessed pages")
     print("  Step 3.3: Delete temporary metadata file")
     print("    * Remove *_metadata_cleaned.pdf")
     print("  Step 3.4: Compress for online access [Ghostscript]")
@@ -3581,7 +4283,9 @@ def print_phase_overview():
     print("    * Cleanup: *_compressed_temp.pdf")
     print("  Output: *_o.pdf -> 03_doc-clean/")
     print("  Tools: PyMuPDF (fitz), ocrmypdf 16.11.1, Ghostscript")
-    print("  Processing: Large files (>5MB) sequential, smaller files parallel (5 workers)")
+    print("  Processing: All files parallel (one worker per core by default, DOCPROCESS_OCR_WORKERS)")
+    print("    * ocrmypdf --jobs from a shared core budget (DOCPROCESS_CPU_BUDGET), Tesseract single-threaded")
+    print("    * ocrmypdf/Ghostscript calls time out per page; a timed-out OCR retries at 300 DPI")
     
     print("\nPHASE 4: CONVERT - TEXT EXTRACTION")
     print("-" * 80)
@@ -3670,6 +4374,7 @@ def print_phase_overview():
 
 # === MAIN PIPELINE ===
 def main():
+    global BACKEND, EXTRACT_MODE, genai, vision, storage
     parser = argparse.ArgumentParser(description='Document Processing Pipeline v31')
     parser.add_argument('--dir', type=str, help='Target directory to process')
     parser.add_argument('--phase', nargs='+', choices=['directory', 'rename', 'clean', 'convert', 'text_import', 'format', 'gcs_upload', 'verify', 'repair', 'all'],
@@ -3678,9 +4383,32 @@ def main():
     parser.add_argument('--force-reupload', action='store_true', help='Force re-upload to GCS and update all headers (use after directory rename)')
     parser.add_argument('--auto-repair', action='store_true', help='Automatically repair files with issues during Phase 7 verification')
     parser.add_argument('--repair-and-verify', action='store_true', help='Repair all issues and re-verify (same as --phase repair verify)')
+    parser.add_argument('--pipeline', action='store_true', help='Stream clean/convert/format/gcs_upload per file instead of running them as whole-batch phases')
+    parser.add_argument('--backend', choices=BACKENDS, default=None,
+                       help='Service backend: google (default) or fake (offline in-process Gemini/Vision/GCS; see docprocess_backends.py)')
+    parser.add_argument('--extract-mode', choices=EXTRACT_MODES, default=None,
+                       help='Phase 4 page source: vision (default), local-textlayer (no Vision calls) or auto (text layer for good pages, Vision for weak ones)')
+    parser.add_argument('--no-dedup', action='store_true',
+                       help='Skip Phase 1 duplicate detection (same as DOCPROCESS_DEDUP=0)')
+    parser.add_argument('--trace', choices=['json', 'otlp'], default=None,
+                       help='Record tracing spans to y_logs/TRACE_<ts>.jsonl (json) or an OTLP/HTTP collector (otlp)')
+    parser.add_argument('--otlp-endpoint', type=str, default=docprocess_tracing.DEFAULT_OTLP_ENDPOINT,
+                       help='OTLP/HTTP traces endpoint for --trace otlp')
     
     args = parser.parse_args()
     
+    # Switch service backend before any phase creates a client (usually already loaded from argv at import)
+    if args.backend:
+        os.environ[BACKEND_ENV] = args.backend
+        if args.backend != BACKEND:
+            BACKEND = args.backend
+            genai, vision, storage = load_backends(BACKEND)
+    if args.extract_mode:
+        EXTRACT_MODE = args.extract_mode
+        os.environ[EXTRACT_MODE_ENV] = EXTRACT_MODE
+    if args.no_dedup:
+        os.environ[DEDUP_ENV] = '0'
+    
     if not args.dir:
         print("Error: --dir parameter required")
         print("Usage: python doc-process-v31.py --dir /path/to/directory [--phase directory rename clean convert format gcs_upload verify repair]")
@@ -3716,6 +4444,23 @@ def main():
     # Display comprehensive phase overview
     print_phase_overview()
     
+    # Optional tracing (configured before any worker pool starts so workers inherit it)
+    if args.trace == 'json':
+        (root_dir / "y_logs").mkdir(exist_ok=True)
+        trace_path = root_dir / "y_logs" / f"TRACE_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+        docprocess_tracing.configure(trace_file=trace_path)
+        print(f"[INFO] Tracing to {trace_path}")
+    elif args.trace == 'otlp':
+        docprocess_tracing.configure(otlp_endpoint=args.otlp_endpoint)
+        print(f"[INFO] Tracing to OTLP collector {args.otlp_endpoint}")
+    
+    # Streaming mode: collapse Phases 3-6 into one per-file dataflow step
+    streaming_phases = [p for p in PIPELINE_PHASES if p in phases]
+    if args.pipeline and len(streaming_phases) > 1:
+        first_index = min(phases.index(p) for p in streaming_phases)
+        phases = [p for p in phases if p not in streaming_phases]
+        phases.insert(first_index, 'pipeline')
+    
     # Execute phases with optional verification
     phase_functions = {
         'directory': phase1_directory,
@@ -3738,14 +4483,18 @@ def main():
         # Execute the phase with error handling
         try:
             print(f"\n[START] Beginning {phase_name} phase...")
-            # Pass auto_repair to phase 7
-            if phase_name == 'verify':
-                phase_functions[phase_name](root_dir, auto_repair=args.auto_repair)
-            # Pass force_reupload to phase 6
-            elif phase_name == 'gcs_upload':
-                phase_functions[phase_name](root_dir, force_reupload=args.force_reupload)
-            else:
-                phase_functions[phase_name](root_dir)
+            with metrics.phase(phase_name), span('phase', phase=phase_name, root=str(root_dir)):
+                # Pass auto_repair to phase 7
+                if phase_name == 'verify':
+                    phase_functions[phase_name](root_dir, auto_repair=args.auto_repair)
+                # Run Phases 3-6 as one streaming pipeline
+                elif phase_name == 'pipeline':
+                    run_pipeline(root_dir, streaming_phases, force_reupload=args.force_reupload)
+                # Pass force_reupload to phase 6
+                elif phase_name == 'gcs_upload':
+                    phase_functions[phase_name](root_dir, force_reupload=args.force_reupload)
+                else:
+                    phase_functions[phase_name](root_dir)
             print(f"[DONE] Completed {phase_name} phase")
         except KeyboardInterrupt:
             print(f"\n[WARN] Received interrupt signal during {phase_name} phase")
@@ -3758,6 +4507,16 @@ def main():
             print(f"[CONTINUE] Moving to next phase...")
             continue
     
+    docprocess_tracing.flush()
+    
+    # Per-phase timing and throughput
+    metrics.print_summary()
+    try:
+        metrics_path = metrics.write(root_dir / "y_logs")
+        print(f"[OK] Metrics saved: {metrics_path.name}")
+    except OSError as e:
+        print(f"[WARN] Could not write metrics: {e}")
+    
     print("\n" + "="*80)
     print("[OK] Processing complete")
     print("="*80 + "\n")
@@ -0,0 +1,363 @@
+"""
+docprocess_backends.py
+
+Pluggable service backends for doc-process-v31 (Gemini, Vision, GCS).
+
+Every phase talks to `genai`, `vision` and `storage` module objects. This
+module decides what those names refer to:
+- 'google' (default): the real google-generativeai / google-cloud SDKs.
+- 'fake': in-process fakes with the same call surface, for offline load
+  testing of the scheduler, retry and batching logic:
+    * Gemini echoes the document body back (or canned rename JSON, one
+      object per document for batched prompts), streamed
+      in pieces when stream=True
+    * Vision returns the PDF's text layer via PyMuPDF
+    * GCS stores objects under a local directory
+
+Design goals:
+- Selected by DOCPROCESS_BACKEND (or --backend); nothing else in the
+  pipeline changes between real and fake runs.
+- Fakes model the failure modes that matter for throughput work: per-call
+  latency (fixed + per KB), random 429 quota errors, a per-service
+  requests-per-second quota, and payload limits that fail like the real API.
+- Configured from environment variables so spawned worker processes and
+  benchmark children see the same settings:
+    DOCPROCESS_FAKE_LATENCY_MS, DOCPROCESS_FAKE_LATENCY_PER_KB_MS,
+    DOCPROCESS_FAKE_ERROR_RATE, DOCPROCESS_FAKE_QPS_LIMIT,
+    DOCPROCESS_FAKE_MAX_PAYLOAD_BYTES (each optionally per service, e.g.
+    DOCPROCESS_FAKE_VISION_LATENCY_MS), DOCPROCESS_FAKE_SEED,
+    DOCPROCESS_FAKE_GCS_ROOT.
+"""
+
+import collections
+import enum
+import json
+import os
+import random
+import re
+import shutil
+import threading
+import time
+import types
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+BACKEND_ENV = 'DOCPROCESS_BACKEND'
+BACKENDS = ('google', 'fake')
+_FAKE_ENV_PREFIX = 'DOCPROCESS_FAKE_'
+SERVICES = ('gemini', 'vision', 'gcs')
+
+# Limits of the real services, used as fake defaults
+VISION_MAX_INLINE_BYTES = 40 * 1024 * 1024
+GEMINI_MAX_INPUT_BYTES = 4 * 1024 * 1024   # ~1M tokens at ~4 bytes/token
+GCS_MAX_OBJECT_BYTES = 5 * 1024 ** 4
+
+
+def load_backends(name: Optional[str] = None) -> Tuple[object, object, object]:
+    """Return (genai, vision, storage) for the named backend (default: $DOCPROCESS_BACKEND or 'google')."""
+    name = (name or os.environ.get(BACKEND_ENV) or 'google').lower()
+    if name == 'google':
+        import google.generativeai as genai
+        from google.cloud import vision
+        from google.cloud import storage
+        return genai, vision, storage
+    if name == 'fake':
+        configure_fakes(FakeConfig.from_env())
+        return fake_genai, fake_vision, fake_storage
+    raise ValueError(f"Unknown backend '{name}' (expected one of: {', '.join(BACKENDS)})")
+
+
+# === FAKE CONFIGURATION ===
+@dataclass
+class FakeServiceConfig:
+    latency_ms: float = 0.0           # Fixed delay per call
+    latency_per_kb_ms: float = 0.0    # Extra delay per KB of request payload
+    error_rate: float = 0.0           # Probability a call raises a 429 quota error
+    qps_limit: float = 0.0            # Calls per second before 429s (0 = unlimited)
+    max_payload_bytes: int = 0        # Request size limit (0 = service default)
+
+
+@dataclass
+class FakeConfig:
+    gemini: FakeServiceConfig = field(default_factory=FakeServiceConfig)
+    vision: FakeServiceConfig = field(default_factory=FakeServiceConfig)
+    gcs: FakeServiceConfig = field(default_factory=FakeServiceConfig)
+    seed: int = 0
+    gcs_root: str = ''                # Directory backing fake buckets (default: ~/.docprocess/fake-gcs)
+
+    @classmethod
+    def from_env(cls, environ=None) -> 'FakeConfig':
+        env = os.environ if environ is None else environ
+
+        def read(service, key, cast):
+            value = env.get(f"{_FAKE_ENV_PREFIX}{service.upper()}_{key}") or env.get(f"{_FAKE_ENV_PREFIX}{key}")
+            return cast(value) if value else cast(0)
+
+        services = {
+            s: FakeServiceConfig(
+                latency_ms=read(s, 'LATENCY_MS', float),
+                latency_per_kb_ms=read(s, 'LATENCY_PER_KB_MS', float),
+                error_rate=read(s, 'ERROR_RATE', float),
+                qps_limit=read(s, 'QPS_LIMIT', float),
+                max_payload_bytes=read(s, 'MAX_PAYLOAD_BYTES', int),
+            )
+            for s in SERVICES
+        }
+        return cls(seed=int(env.get(f"{_FAKE_ENV_PREFIX}SEED") or 0),
+                   gcs_root=env.get(f"{_FAKE_ENV_PREFIX}GCS_ROOT", ''), **services)
+
+    def to_env(self) -> Dict[str, str]:
+        """Environment variables that reproduce this config in another process."""
+        env = {BACKEND_ENV: 'fake', f"{_FAKE_ENV_PREFIX}SEED": str(self.seed)}
+        if self.gcs_root:
+            env[f"{_FAKE_ENV_PREFIX}GCS_ROOT"] = self.gcs_root
+        for s in SERVICES:
+            cfg = getattr(self, s)
+            for key, value in (('LATENCY_MS', cfg.latency_ms), ('LATENCY_PER_KB_MS', cfg.latency_per_kb_ms),
+                               ('ERROR_RATE', cfg.error_rate), ('QPS_LIMIT', cfg.qps_limit),
+                               ('MAX_PAYLOAD_BYTES', cfg.max_payload_bytes)):
+                if value:
+                    env[f"{_FAKE_ENV_PREFIX}{s.upper()}_{key}"] = str(value)
+        return env
+
+
+class FakeQuotaError(Exception):
+    """Injected failure shaped like a Google API 429."""
+
+
+class FakePayloadError(Exception):
+    """Request exceeded the fake service's payload limit (shaped like a 400)."""
+
+
+_config = FakeConfig()
+_rng = random.Random(0)
+_lock = threading.Lock()
+_call_times: Dict[str, collections.deque] = {s: collections.deque() for s in SERVICES}
+call_counts: Dict[str, int] = {s: 0 for s in SERVICES}
+error_counts: Dict[str, int] = {s: 0 for s in SERVICES}
+
+
+def configure_fakes(config: FakeConfig) -> None:
+    global _config, _rng
+    with _lock:
+        _config = config
+        _rng = random.Random(config.seed)
+        for s in SERVICES:
+            _call_times[s].clear()
+            call_counts[s] = 0
+            error_counts[s] = 0
+
+
+def _fake_call(service: str, payload_bytes: int = 0, default_limit: int = 0) -> None:
+    """Apply payload limit, latency, quota and error injection for one call."""
+    cfg: FakeServiceConfig = getattr(_config, service)
+    limit = cfg.max_payload_bytes or default_limit
+    now = time.monotonic()
+    with _lock:
+        call_counts[service] += 1
+        over_quota = False
+        if cfg.qps_limit:
+            window = _call_times[service]
+            while window and now - window[0] > 1.0:
+                window.popleft()
+            over_quota = len(window) >= cfg.qps_limit
+            if not over_quota:
+                window.append(now)
+        injected = cfg.error_rate > 0 and _rng.random() < cfg.error_rate
+        if over_quota or injected or (limit and payload_bytes > limit):
+            error_counts[service] += 1
+    if limit and payload_bytes > limit:
+        raise FakePayloadError(f"400 Request payload size {payload_bytes} exceeds the limit {limit} ({service} fake)")
+    delay_ms = cfg.latency_ms + cfg.latency_per_kb_ms * payload_bytes / 1024
+    if delay_ms > 0:
+        time.sleep(delay_ms / 1000)
+    if over_quota:
+        raise FakeQuotaError(f"429 Quota exceeded: {cfg.qps_limit:g} requests per second ({service} fake)")
+    if injected:
+        raise FakeQuotaError(f"429 Resource has been exhausted ({service} fake)")
+
+
+class _Obj:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+# === FAKE GEMINI ===
+class _GenerationConfig(_Obj):
+    pass
+
+
+_FAKE_RENAME_METADATA = {"date": "20240115", "party": "RR", "case": "9c1", "description": "Fake-Backend-Document"}
+
+
+# First page marker of the document body: a marker line not followed by the prompt's "<content for page N>" example
+_DOCUMENT_MARKER_RE = re.compile(r'^\[BEGIN PDF Page \d+\][ \t]*\n(?!\s*<content for page)', re.MULTILINE)
+
+
+class _GenerativeModel:
+    def __init__(self, model_name, **kwargs):
+        self.model_name = model_name
+
+    def generate_content(self, prompt, generation_config=None, request_options=None, stream=False, **kwargs):
+        _fake_call('gemini', len(prompt.encode('utf-8')), GEMINI_MAX_INPUT_BYTES)
+        body = _DOCUMENT_MARKER_RE.search(prompt)
+        if "JSON array" in prompt:
+            # Batched rename metadata prompt: one object per document
+            count = prompt.count("=== DOCUMENT ")
+            text = json.dumps([dict(_FAKE_RENAME_METADATA, document=i) for i in range(1, count + 1)])
+        elif body:
+            # Formatting prompt: echo the document body back with whitespace runs collapsed
+            text = "\n".join(" ".join(line.split()) for line in prompt[body.start():].splitlines())
+        elif "JSON" in prompt:
+            # Rename metadata prompt
+            text = json.dumps(_FAKE_RENAME_METADATA)
+        else:
+            text = "Fake backend response."
+        # ~4 characters per token; cut off at max_output_tokens like the real model
+        finish_reason = _FinishReason.STOP
+        max_tokens = getattr(generation_config, 'max_output_tokens', None)
+        if max_tokens and len(text) // 4 > max_tokens:
+            text = text[:max_tokens * 4]
+            finish_reason = _FinishReason.MAX_TOKENS
+        usage = _Obj(prompt_token_count=len(prompt) // 4, candidates_token_count=len(text) // 4)
+        candidates = [_Obj(finish_reason=finish_reason)]
+        if stream:
+            return _stream_pieces(text, usage, candidates)
+        return _Obj(text=text, usage_metadata=usage, candidates=candidates)
+
+
+class _FinishReason(enum.IntEnum):
+    FINISH_REASON_UNSPECIFIED = 0
+    STOP = 1
+    MAX_TOKENS = 2
+
+
+def _stream_pieces(text, usage, candidates, piece_chars=2048):
+    """Yield a response the way stream=True does: text pieces, usage on the last one."""
+    pieces = [text[i:i + piece_chars] for i in range(0, len(text), piece_chars)] or ['']
+    for i, piece in enumerate(pieces):
+        if i == len(pieces) - 1:
+            yield _Obj(text=piece, usage_metadata=usage, candidates=candidates)
+        else:
+            yield _Obj(text=piece, usage_metadata=None,
+                       candidates=[_Obj(finish_reason=_FinishReason.FINISH_REASON_UNSPECIFIED)])
+
+
+fake_genai = types.SimpleNamespace(
+    configure=lambda api_key=None, **kwargs: None,
+    GenerativeModel=_GenerativeModel,
+    types=types.SimpleNamespace(GenerationConfig=_GenerationConfig),
+)
+
+
+# === FAKE VISION ===
+class _Feature(_Obj):
+    class Type:
+        DOCUMENT_TEXT_DETECTION = 11
+        TEXT_DETECTION = 1
+
+
+class _ImageAnnotatorClient:
+    def batch_annotate_files(self, requests):
+        import fitz
+        responses = []
+        for request in requests:
+            content = request.input_config.content
+            _fake_call('vision', len(content), VISION_MAX_INLINE_BYTES)
+            page_responses = []
+            with fitz.open(stream=content, filetype='pdf') as doc:
+                for page_num in request.pages:
+                    if page_num > doc.page_count:
+                        break
+                    text = doc[page_num - 1].get_text()
+                    if not text.strip():
+                        # Image-only page without an OCR layer: typical page-sized text
+                        text = f"Fake OCR text for page {page_num}.\n" + ("Lorem ipsum dolor sit amet. " * 60)
+                    page_responses.append(_Obj(full_text_annotation=_Obj(text=text)))
+            responses.append(_Obj(responses=page_responses))
+        return _Obj(responses=responses)
+
+    def text_detection(self, image):
+        _fake_call('vision', len(image.content), VISION_MAX_INLINE_BYTES)
+        # No OCR engine in the fake; callers fall back to the PDF text layer
+        return _Obj(text_annotations=[])
+
+
+fake_vision = types.SimpleNamespace(
+    ImageAnnotatorClient=_ImageAnnotatorClient,
+    Feature=_Feature,
+    AnnotateFileRequest=type('AnnotateFileRequest', (_Obj,), {}),
+    InputConfig=type('InputConfig', (_Obj,), {}),
+    ImageContext=type('ImageContext', (_Obj,), {}),
+    Image=type('Image', (_Obj,), {}),
+)
+
+
+# === FAKE GCS ===
+def _gcs_root() -> Path:
+    return Path(_config.gcs_root) if _config.gcs_root else Path.home() / ".docprocess" / "fake-gcs"
+
+
+class _Blob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    @property
+    def _path(self) -> Path:
+        return self.bucket._root / self.name
+
+    def exists(self):
+        _fake_call('gcs')
+        return self._path.exists()
+
+    def delete(self):
+        _fake_call('gcs')
+        self._path.unlink()
+
+    def upload_from_filename(self, filename):
+        _fake_call('gcs', Path(filename).stat().st_size, GCS_MAX_OBJECT_BYTES)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(filename, self._path)
+
+    def make_public(self):
+        _fake_call('gcs')
+
+    def generate_signed_url(self, **kwargs):
+        return self._path.as_uri()
+
+
+class _Bucket:
+    def __init__(self, name):
+        self.name = name
+        self._root = _gcs_root() / name
+
+    def blob(self, name):
+        return _Blob(self, name)
+
+    def copy_blob(self, blob, destination_bucket, new_name=None):
+        _fake_call('gcs')
+        copy = destination_bucket.blob(new_name or blob.name)
+        copy._path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(blob._path, copy._path)
+        return copy
+
+
+class _StorageClient:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def bucket(self, name):
+        return _Bucket(name)
+
+    def list_blobs(self, bucket_name, prefix=''):
+        _fake_call('gcs')
+        bucket = _Bucket(bucket_name)
+        if not bucket._root.exists():
+            return []
+        names = sorted(p.relative_to(bucket._root).as_posix() for p in bucket._root.rglob('*') if p.is_file())
+        return [_Blob(bucket, n) for n in names if n.startswith(prefix)]
+
+
+fake_storage = types.SimpleNamespace(Client=_StorageClient)
@@ -0,0 +1,179 @@
+"""
+docprocess_collect.py
+
+Concurrent file collection for Phase 1 (directory).
+
+phase1_directory used to stat every PDF in the root for a size sort and
+then shutil.move them one at a time. On Google Drive or a network share
+each move is a copy + delete over the wire, so thousands of files took a
+long time; a name clash was reported as [SKIP] even when the two files had
+different content, leaving the new file behind.
+
+Design goals:
+- Bounded concurrency: moves run in a thread pool (DOCPROCESS_COLLECT_WORKERS,
+  default 8); the work is I/O bound, so threads overlap network latency.
+- Cheap moves: os.rename when source and target are on the same filesystem
+  (a metadata update, even on network mounts); otherwise copy to a hidden
+  temp file in the target directory, replace it into place, then delete the
+  source, so an interrupted copy never leaves a half-written PDF.
+- Collisions resolved by content: a target that already holds identical
+  bytes (same size, then same sha256) means the source is dropped; different
+  content gets the next free numbered name (name-2_d.pdf, name-3_d.pdf, ...).
+- Deterministic: sources that map to the same target name are handled in
+  order by one worker, and suffixed names are reserved under a lock, so two
+  workers never claim the same name.
+"""
+
+import errno
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from docprocess_journal import file_sha256
+
+WORKERS_ENV = 'DOCPROCESS_COLLECT_WORKERS'
+DEFAULT_WORKERS = 8
+MAX_SUFFIX = 999
+
+# Collect outcomes
+MOVED = 'MOVED'          # Moved to its target name
+SUFFIXED = 'SUFFIXED'    # Name taken by different content: moved to a numbered name
+DROPPED = 'DROPPED'      # Identical file already at the target: source removed
+FAILED = 'FAILED'
+
+
+@dataclass
+class CollectResult:
+    """Outcome of collecting one source file."""
+    source: Path
+    target: Optional[Path]
+    status: str
+    method: str = ''              # 'rename' or 'copy' for moved files
+    error: Optional[str] = None
+
+
+def collect_workers() -> int:
+    value = os.environ.get(WORKERS_ENV)
+    return max(1, int(value)) if value else DEFAULT_WORKERS
+
+
+def same_filesystem(source: Path, target_dir: Path) -> bool:
+    try:
+        return os.stat(source).st_dev == os.stat(target_dir).st_dev
+    except OSError:
+        return False
+
+
+def same_content(a: Path, b: Path) -> bool:
+    """Byte-identical files: size first, sha256 only when sizes match."""
+    if os.path.getsize(a) != os.path.getsize(b):
+        return False
+    return file_sha256(a) == file_sha256(b)
+
+
+def move_file(source: Path, target: Path) -> str:
+    """Move source to a target name that does not exist yet; returns 'rename' or 'copy'."""
+    if same_filesystem(source, target.parent):
+        try:
+            os.rename(source, target)
+            return 'rename'
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+    temp = target.with_name(f".{target.name}.part")
+    try:
+        shutil.copy2(source, temp)
+        os.replace(temp, target)
+    except BaseException:
+        try:
+            temp.unlink()
+        except OSError:
+            pass
+        raise
+    os.unlink(source)
+    return 'copy'
+
+
+def _numbered(target: Path, n: int) -> Path:
+    """name_d.pdf -> name-2_d.pdf (the pipeline suffix stays last)."""
+    stem, ext = target.stem, target.suffix
+    if stem.endswith('_d'):
+        return target.with_name(f"{stem[:-2]}-{n}_d{ext}")
+    return target.with_name(f"{stem}-{n}{ext}")
+
+
+class _Reservations:
+    """Target names claimed by this run but possibly not on disk yet."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._names: Set[Path] = set()
+
+    def claim(self, target: Path, source: Path) -> Tuple[Optional[Path], bool]:
+        """First free name for source: (name, False), or (existing copy, True) if identical.
+
+        Files already on disk are compared by content; names claimed by
+        moves that have not finished yet are skipped.
+        """
+        for n in range(1, MAX_SUFFIX + 1):
+            candidate = target if n == 1 else _numbered(target, n)
+            with self._lock:
+                if not candidate.exists():
+                    if candidate in self._names:
+                        # Claimed by a move still in flight (targets appear only when complete)
+                        continue
+                    self._names.add(candidate)
+                    return candidate, False
+            if same_content(source, candidate):
+                return candidate, True
+        return None, False
+
+
+def _collect_group(sources: List[Path], target: Path, reservations: _Reservations) -> List[CollectResult]:
+    """Collect sources that all want the same target name, in order."""
+    results = []
+    for source in sources:
+        try:
+            destination, identical = reservations.claim(target, source)
+            if destination is None:
+                results.append(CollectResult(source, None, FAILED,
+                                             error=f"no free name after {MAX_SUFFIX} attempts"))
+            elif identical:
+                os.unlink(source)
+                results.append(CollectResult(source, destination, DROPPED))
+            else:
+                method = move_file(source, destination)
+                results.append(CollectResult(source, destination, MOVED if destination == target else SUFFIXED,
+                                             method=method))
+        except OSError as e:
+            results.append(CollectResult(source, None, FAILED, error=str(e)))
+    return results
+
+
+def collect_files(moves: Iterable[Tuple[Path, Path]], workers: Optional[int] = None,
+                  on_result=None) -> List[CollectResult]:
+    """Move (source, target) pairs concurrently, resolving name collisions by content.
+
+    on_result(result) is called from the main thread as each group finishes,
+    for progress output. Returns one CollectResult per source.
+    """
+    groups: Dict[Path, List[Path]] = {}
+    for source, target in moves:
+        groups.setdefault(Path(target), []).append(Path(source))
+    if not groups:
+        return []
+    reservations = _Reservations()
+    results: List[CollectResult] = []
+    with ThreadPoolExecutor(max_workers=min(workers or collect_workers(), len(groups))) as executor:
+        futures = [executor.submit(_collect_group, sources, target, reservations)
+                   for target, sources in groups.items()]
+        for future in as_completed(futures):
+            for result in future.result():
+                results.append(result)
+                if on_result:
+                    on_result(result)
+    return results
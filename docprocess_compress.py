@@ -0,0 +1,144 @@
+"""
+docprocess_compress.py
+
+Compression planner for the Phase 3 Ghostscript pass.
+
+Every Phase 3 output used to be rewritten by Ghostscript (/ebook) after
+ocrmypdf --optimize 3 had already compressed it, and the result was thrown
+away whenever it saved 10% or less - most of the time for born-digital
+files. This module predicts from the PDF's image streams whether the pass
+can pay off, so Ghostscript only runs when it is likely to.
+
+Design goals:
+- Cheap: reads only the xref dictionaries of the images (fitz), never
+  decodes pixels; a plan takes milliseconds even for large scans.
+- Models what /ebook actually does: color and gray images above 1.5x 150
+  DPI are downsampled to 150 DPI and re-encoded as JPEG; mono images are
+  only downsampled above 1.5x 300 DPI. Images already JPEG-compressed at or
+  below the target resolution have nothing left to give.
+- Conservative: text, fonts and vector content are assumed to stay the same
+  size, and the pass is planned only when the predicted saving reaches
+  DOCPROCESS_COMPRESS_MIN_SAVING (default 15%, above the 10% the caller
+  needs to keep the result).
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import Dict
+
+import fitz  # PyMuPDF
+
+MIN_SAVING_ENV = 'DOCPROCESS_COMPRESS_MIN_SAVING'
+DEFAULT_MIN_SAVING = 0.15
+MIN_BYTES_PER_PAGE = 30 * 1024       # Below this a page has little image data to shrink
+
+# Ghostscript /ebook distiller settings
+COLOR_DPI = 150                      # ColorImageResolution / GrayImageResolution
+MONO_DPI = 300                       # MonoImageResolution
+DOWNSAMPLE_THRESHOLD = 1.5           # Images are only downsampled above threshold x target DPI
+
+# Typical JPEG output (default Ghostscript quality) per pixel, by color components
+JPEG_BYTES_PER_PIXEL = {1: 0.15, 3: 0.25, 4: 0.3}
+
+_JPEG_FILTERS = ('DCTDecode', 'JPXDecode')
+_COMPONENTS = {'DeviceGray': 1, 'CalGray': 1, 'DeviceRGB': 3, 'CalRGB': 3, 'Lab': 3, 'DeviceCMYK': 4}
+
+
+@dataclass
+class CompressionPlan:
+    """Image-stream statistics of a PDF and whether a Ghostscript pass is worthwhile."""
+    pages: int = 0
+    file_bytes: int = 0
+    image_count: int = 0
+    image_bytes: int = 0
+    predicted_image_bytes: int = 0
+    mono_images: int = 0
+    filters: Dict[str, int] = field(default_factory=dict)   # Filter -> stream bytes
+    estimated_saving: float = 0.0                            # Fraction of the file
+    worthwhile: bool = False
+    reason: str = ''
+
+    @property
+    def bytes_per_page(self) -> float:
+        return self.file_bytes / self.pages if self.pages else 0.0
+
+    def summary(self) -> str:
+        return (f"{self.image_count} images, {self.bytes_per_page / 1024:.0f} KB/page, "
+                f"~{self.estimated_saving:.0%} predicted saving")
+
+
+def min_saving() -> float:
+    value = os.environ.get(MIN_SAVING_ENV)
+    return float(value) if value else DEFAULT_MIN_SAVING
+
+
+def _stream_length(doc, xref: int) -> int:
+    kind, value = doc.xref_get_key(xref, 'Length')
+    if kind == 'int':
+        return int(value)
+    # Indirect /Length: read the raw (still encoded) stream
+    return len(doc.xref_stream_raw(xref) or b'')
+
+
+def _components(doc, xref: int, colorspace: str) -> int:
+    if colorspace in _COMPONENTS:
+        return _COMPONENTS[colorspace]
+    if colorspace == 'ICCBased':
+        kind, value = doc.xref_get_key(xref, 'ColorSpace')
+        # '[/ICCBased 12 0 R]' -> /N of object 12
+        parts = value.strip('[]').split()
+        if kind == 'array' and len(parts) >= 2 and parts[1].isdigit():
+            n_kind, n = doc.xref_get_key(int(parts[1]), 'N')
+            if n_kind == 'int':
+                return int(n)
+    return 3
+
+
+def _predicted_bytes(current: int, width: int, height: int, bpc: int, components: int,
+                     jpeg: bool, dpi: float) -> int:
+    """Size of one image stream after a /ebook pass (never more than now)."""
+    if bpc == 1:
+        if dpi <= MONO_DPI * DOWNSAMPLE_THRESHOLD:
+            return current
+        return int(current * (MONO_DPI / dpi) ** 2)
+    scale = (COLOR_DPI / dpi) ** 2 if dpi > COLOR_DPI * DOWNSAMPLE_THRESHOLD else 1.0
+    if jpeg:
+        # Already JPEG: only downsampling gains anything
+        return int(current * scale)
+    estimate = width * height * scale * JPEG_BYTES_PER_PIXEL.get(components, JPEG_BYTES_PER_PIXEL[3])
+    return int(min(current, estimate))
+
+
+def plan_compression(pdf_path) -> CompressionPlan:
+    """Predict what a Ghostscript /ebook pass would save on pdf_path."""
+    plan = CompressionPlan(file_bytes=os.path.getsize(pdf_path))
+    seen = set()
+    with fitz.open(str(pdf_path)) as doc:
+        plan.pages = doc.page_count
+        for page in doc:
+            page_width_in = page.rect.width / 72 or 1.0
+            for xref, _smask, width, height, bpc, colorspace, _alt, _name, filter_name, *_ in page.get_images(full=True):
+                if xref in seen or not width or not height:
+                    continue
+                seen.add(xref)
+                current = _stream_length(doc, xref)
+                # Scans fill the page width; smaller images come out at a higher real DPI (conservative)
+                dpi = width / page_width_in
+                jpeg = filter_name in _JPEG_FILTERS
+                plan.image_count += 1
+                plan.mono_images += bpc == 1
+                plan.image_bytes += current
+                plan.filters[filter_name or 'none'] = plan.filters.get(filter_name or 'none', 0) + current
+                plan.predicted_image_bytes += _predicted_bytes(
+                    current, width, height, bpc, _components(doc, xref, colorspace), jpeg, dpi)
+
+    if not plan.image_count:
+        plan.reason = "no images (born-digital)"
+        return plan
+    if plan.bytes_per_page < MIN_BYTES_PER_PAGE:
+        plan.reason = f"already small ({plan.bytes_per_page / 1024:.0f} KB/page)"
+        return plan
+    plan.estimated_saving = (plan.image_bytes - plan.predicted_image_bytes) / plan.file_bytes
+    plan.worthwhile = plan.estimated_saving >= min_saving()
+    plan.reason = plan.summary()
+    return plan
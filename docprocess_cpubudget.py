@@ -0,0 +1,94 @@
+"""
+docprocess_cpubudget.py
+
+Global CPU budget for Phase 3 OCR and Ghostscript.
+
+Phase 3 ran MAX_WORKERS_CPU concurrent ocrmypdf processes and each one
+defaulted to --jobs = all cores, with Tesseract free to start its own
+OpenMP threads on top: on a 24-core host that is 5 x 24 page workers times
+Tesseract threads, and the machine thrashed. Here every ocrmypdf call takes
+its --jobs from one shared core budget.
+
+Design goals:
+- One budget for the whole run (DOCPROCESS_CPU_BUDGET cores, default
+  os.cpu_count()), shared by all pool worker processes through a
+  multiprocessing condition passed to the pool initializer.
+- Split by size: a call asks for one job per page and gets what is free
+  when it starts (at least one core; it waits while none is free), capped
+  at a fair share of ceil(cores / pool slots). Many small files run with
+  one job each; a large file never holds the cores the other slots need,
+  so one file's page tail cannot idle the rest of the pool. With a single
+  file the pool has a single slot and it gets every core.
+- Ghostscript passes take one core from the same budget, including the
+  deferred compression threads in the main process.
+- No hidden threads: Tesseract runs with OMP_THREAD_LIMIT=1, so cores in
+  use equal the jobs granted and throughput scales with the core count
+  instead of oversubscribing it.
+- The Phase 3 pool keeps its memory footprint: DOCPROCESS_OCR_WORKERS,
+  default the budget capped at DEFAULT_OCR_WORKERS (5, the previous pool
+  size). Parallelism beyond the pool comes from --jobs.
+"""
+
+import math
+import multiprocessing
+import os
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+CPU_BUDGET_ENV = 'DOCPROCESS_CPU_BUDGET'
+OCR_WORKERS_ENV = 'DOCPROCESS_OCR_WORKERS'
+DEFAULT_OCR_WORKERS = 5     # One ocrmypdf process each; more would only add memory
+
+
+def cpu_budget() -> int:
+    """Cores available to OCR in this run."""
+    value = os.environ.get(CPU_BUDGET_ENV)
+    return max(1, int(value)) if value else (os.cpu_count() or 1)
+
+
+def ocr_workers(budget: Optional[int] = None) -> int:
+    """Concurrent ocrmypdf processes for Phase 3."""
+    value = os.environ.get(OCR_WORKERS_ENV)
+    return max(1, int(value)) if value else min(budget or cpu_budget(), DEFAULT_OCR_WORKERS)
+
+
+def tool_env() -> Dict[str, str]:
+    """Environment for OCR tools: one thread per Tesseract process (parallelism comes from --jobs)."""
+    env = dict(os.environ)
+    env['OMP_THREAD_LIMIT'] = '1'
+    return env
+
+
+class CoreBudget:
+    """Cores shared by the processes of one pool; pass it to the pool initializer."""
+
+    def __init__(self, cores: int, slots: int = 1, ctx=None):
+        ctx = ctx or multiprocessing.get_context()
+        self.cores = max(1, cores)
+        # Fair share per pool slot, so the first large file cannot take every core
+        self.max_grant = math.ceil(self.cores / max(1, slots))
+        self._free = ctx.Value('i', self.cores, lock=False)
+        self._cond = ctx.Condition()
+
+    def acquire(self, want: int) -> int:
+        """Block until at least one core is free; take up to `want` (capped at the fair share) and return the grant."""
+        want = max(1, min(want, self.max_grant))
+        with self._cond:
+            while self._free.value < 1:
+                self._cond.wait()
+            granted = min(want, self._free.value)
+            self._free.value -= granted
+            return granted
+
+    def release(self, granted: int) -> None:
+        with self._cond:
+            self._free.value += granted
+            self._cond.notify_all()
+
+    @contextmanager
+    def reserve(self, want: int) -> Iterator[int]:
+        granted = self.acquire(want)
+        try:
+            yield granted
+        finally:
+            self.release(granted)
@@ -0,0 +1,293 @@
+"""
+docprocess_dedup.py
+
+Near-linear duplicate detection for Phase 1 (directory).
+
+The original detect_duplicates made one Gemini call per PDF for a content
+fingerprint and one more for every pair of PDFs: O(n^2) LLM calls, too slow
+to leave enabled. Here duplicates are found locally:
+
+1. Exact duplicates: identical sha256 of the file bytes.
+2. Near duplicates: MinHash signatures over word shingles of the normalized
+   text of the first pages, bucketed with locality-sensitive hashing (LSH)
+   so only documents sharing a band are compared. Page count and file size
+   are used as extra features when judging a candidate pair.
+3. Visual duplicates: perceptual hashes (aHash + dHash, 256 bits each) of
+   low-DPI thumbnails of the first pages, for scans with no text layer.
+   Hashes are also looked up in the persistent index (docprocess_index.py)
+   so a re-scan of a filing processed in another folder is caught too.
+
+Design goals:
+- Near-linear: each document is read once (in a process pool) and lands in
+  a fixed number of LSH buckets; pairwise work is limited to bucket mates.
+- Pure Python: no numpy or datasketch dependency; fitz is already required.
+- Conservative: only pairs with very similar text, matching page counts and
+  comparable sizes count as duplicates. Pairs in the grey zone are reported
+  as 'ambiguous' for the caller to confirm (Phase 1 asks Gemini about those
+  pairs only). Perceptual hashes are only compared when a document has no
+  usable text (when both have text, the text comparison wins), and a
+  thumbnail match is never proof on its own: 'visual' pairs are reported
+  for review and both files stay in place.
+- Thumbnails are box-downsampled straight from the pixmap's byte buffer with
+  slice sums, so hashing needs neither Pillow nor numpy.
+"""
+
+import os
+import random
+import re
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+from docprocess_journal import file_sha256
+
+DEDUP_ENV = 'DOCPROCESS_DEDUP'   # '0' / 'off' / 'false' disables Phase 1 dedup
+
+MAX_PAGES = 10          # Pages of text used for the signature
+SHINGLE_WORDS = 5
+MIN_SHINGLES = 20       # Fewer shingles than this: too little text to compare
+NUM_PERM = 64           # MinHash permutations
+BANDS = 16              # LSH bands of NUM_PERM // BANDS rows (candidate threshold ~0.5)
+DUPLICATE_SIMILARITY = 0.90
+AMBIGUOUS_SIMILARITY = 0.70
+MIN_SIZE_RATIO = 0.5    # Smaller / larger file size for a confident near duplicate
+
+PHASH_PAGES = 3         # Leading pages hashed
+PHASH_DPI = 36          # Thumbnail resolution
+PHASH_SIZE = 16         # aHash grid 16x16, dHash grid 17x16: 256 bits each
+PHASH_BITS = PHASH_SIZE * PHASH_SIZE
+PHASH_MAX_DISTANCE = 36 # Mean dHash bits (of 256) that may differ per page (~14%)
+PHASH_MAX_LAYOUT_DISTANCE = 64  # aHash bits per page; aHash only captures layout
+PHASH_MIN_CONTRAST = 8  # Gray levels; flatter thumbnails (blank pages) are not hashed
+PHASH_BAND_BITS = 8     # dHash bands for bucketing (32 bands of 8 bits)
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(31)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+_NON_WORD_RE = re.compile(r'[^a-z0-9]+')
+
+
+@dataclass
+class DocumentSignature:
+    """Features of one PDF for duplicate detection."""
+    path: str
+    size: int = 0
+    sha256: str = ''
+    page_count: int = 0
+    minhash: Tuple[int, ...] = ()
+    phashes: Tuple[Tuple[int, int], ...] = ()   # (aHash, dHash) per leading page
+    text: str = field(default='', repr=False)   # First-page excerpt, for confirming ambiguous pairs
+    error: Optional[str] = None
+
+
+@dataclass
+class DuplicatePair:
+    """Two documents judged to be the same; keep is the copy to keep."""
+    keep: str
+    duplicate: str
+    kind: str               # 'exact', 'near', 'visual' or 'ambiguous'
+    similarity: float
+
+
+def dedup_enabled() -> bool:
+    return os.environ.get(DEDUP_ENV, '1').lower() not in ('0', 'off', 'false', 'no')
+
+
+def _minhash(text: str) -> Tuple[int, ...]:
+    words = _NON_WORD_RE.sub(' ', text.lower()).split()
+    shingles = {zlib.crc32(' '.join(words[i:i + SHINGLE_WORDS]).encode('utf-8'))
+                for i in range(max(1, len(words) - SHINGLE_WORDS + 1))} if words else set()
+    if len(shingles) < MIN_SHINGLES:
+        return ()
+    return tuple(min((a * h + b) % _MERSENNE_PRIME for h in shingles) for a, b in _PERMUTATIONS)
+
+
+def _grid_means(pix, cols: int, rows: int) -> List[float]:
+    """Mean gray level of each cell of a cols x rows grid over a 1-channel pixmap."""
+    width, height, stride = pix.width, pix.height, pix.stride
+    samples = pix.samples
+    xs = [width * c // cols for c in range(cols + 1)]
+    ys = [height * r // rows for r in range(rows + 1)]
+    means = []
+    for r in range(rows):
+        sums = [0] * cols
+        for y in range(ys[r], ys[r + 1]):
+            row = samples[y * stride:y * stride + width]
+            for c in range(cols):
+                sums[c] += sum(row[xs[c]:xs[c + 1]])
+        for c in range(cols):
+            area = (xs[c + 1] - xs[c]) * (ys[r + 1] - ys[r])
+            means.append(sums[c] / area if area else 0.0)
+    return means
+
+
+def page_hashes(page) -> Optional[Tuple[int, int]]:
+    """(aHash, dHash) of a page thumbnail, or None for a blank page."""
+    pix = page.get_pixmap(dpi=PHASH_DPI, colorspace=fitz.csGRAY, alpha=False)
+    if pix.width < PHASH_SIZE + 1 or pix.height < PHASH_SIZE:
+        return None
+    grid = _grid_means(pix, PHASH_SIZE, PHASH_SIZE)
+    if max(grid) - min(grid) < PHASH_MIN_CONTRAST:
+        return None
+    mean = sum(grid) / len(grid)
+    ahash = 0
+    for value in grid:
+        ahash = (ahash << 1) | (value > mean)
+    wide = _grid_means(pix, PHASH_SIZE + 1, PHASH_SIZE)
+    dhash = 0
+    for r in range(PHASH_SIZE):
+        row = wide[r * (PHASH_SIZE + 1):(r + 1) * (PHASH_SIZE + 1)]
+        for c in range(PHASH_SIZE):
+            dhash = (dhash << 1) | (row[c] < row[c + 1])
+    return ahash, dhash
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def phash_bands(dhash: int) -> List[int]:
+    """Band values of a dHash. Two hashes within 31 bits always share a band; at
+    PHASH_MAX_DISTANCE most bands still match."""
+    mask = (1 << PHASH_BAND_BITS) - 1
+    return [(dhash >> shift) & mask for shift in range(0, PHASH_BITS, PHASH_BAND_BITS)]
+
+
+def visual_distance(a: Tuple[Tuple[int, int], ...], b: Tuple[Tuple[int, int], ...]) -> Optional[float]:
+    """Mean per-page dHash distance, or None if the pages cannot be compared or the layouts differ."""
+    if not a or len(a) != len(b):
+        return None
+    if any(hamming(pa[0], pb[0]) > PHASH_MAX_LAYOUT_DISTANCE for pa, pb in zip(a, b)):
+        return None
+    return sum(hamming(pa[1], pb[1]) for pa, pb in zip(a, b)) / len(a)
+
+
+def visual_match(a: DocumentSignature, b: DocumentSignature) -> Optional[float]:
+    """Similarity (0..1) if a and b look like the same scan, else None.
+
+    Only used when at least one side has no usable text; otherwise the
+    MinHash comparison decides.
+    """
+    if a.minhash and b.minhash:
+        return None
+    if a.page_count != b.page_count:
+        return None
+    distance = visual_distance(a.phashes, b.phashes)
+    if distance is None or distance > PHASH_MAX_DISTANCE:
+        return None
+    return 1.0 - distance / PHASH_BITS
+
+
+def document_signature(pdf_path) -> DocumentSignature:
+    """Hash, MinHash and perceptual-hash one PDF. Runs in a process-pool worker."""
+    sig = DocumentSignature(path=str(pdf_path))
+    try:
+        sig.size = os.path.getsize(pdf_path)
+        sig.sha256 = file_sha256(str(pdf_path))
+        with fitz.open(str(pdf_path)) as doc:
+            sig.page_count = doc.page_count
+            pages = [doc[i].get_text() for i in range(min(MAX_PAGES, doc.page_count))]
+            hashes = [page_hashes(doc[i]) for i in range(min(PHASH_PAGES, doc.page_count))]
+        if hashes and all(hashes):
+            sig.phashes = tuple(hashes)
+        sig.text = pages[0][:2000] if pages else ''
+        sig.minhash = _minhash("\n".join(pages))
+    except Exception as e:
+        sig.error = str(e)
+    return sig
+
+
+def similarity(a: DocumentSignature, b: DocumentSignature) -> float:
+    """Estimated Jaccard similarity of the two documents' shingle sets."""
+    if not a.minhash or not b.minhash:
+        return 0.0
+    return sum(x == y for x, y in zip(a.minhash, b.minhash)) / NUM_PERM
+
+
+def _prefer(a: DocumentSignature, b: DocumentSignature) -> Tuple[DocumentSignature, DocumentSignature]:
+    """(keep, duplicate): the shorter file name is kept (longer names are usually copies)."""
+    name_a, name_b = os.path.basename(a.path), os.path.basename(b.path)
+    if (len(name_a), name_a) <= (len(name_b), name_b):
+        return a, b
+    return b, a
+
+
+def _candidate_pairs(signatures: List[DocumentSignature]) -> set:
+    rows = NUM_PERM // BANDS
+    buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = {}
+    for i, sig in enumerate(signatures):
+        if not sig.minhash:
+            continue
+        for band in range(BANDS):
+            key = (band, sig.minhash[band * rows:(band + 1) * rows])
+            buckets.setdefault(key, []).append(i)
+    pairs = set()
+    for members in buckets.values():
+        for x in range(len(members)):
+            for y in range(x + 1, len(members)):
+                pairs.add((members[x], members[y]))
+    return pairs
+
+
+def find_duplicates(signatures: List[DocumentSignature]) -> List[DuplicatePair]:
+    """Exact and near duplicate pairs among signatures.
+
+    Exact pairs come first, then near/ambiguous/visual pairs by decreasing
+    similarity. 'visual' pairs have no second signal (no text to compare)
+    and are for reporting only. Signatures with an error are ignored.
+    """
+    signatures = [s for s in signatures if s.error is None]
+    pairs: List[DuplicatePair] = []
+
+    # 1. Exact duplicates: one representative per identical-bytes group
+    by_hash: Dict[str, List[DocumentSignature]] = {}
+    for sig in signatures:
+        by_hash.setdefault(sig.sha256, []).append(sig)
+    representatives = []
+    for group in by_hash.values():
+        keep = group[0]
+        for other in group[1:]:
+            keep, _ = _prefer(keep, other)
+        representatives.append(keep)
+        for other in group:
+            if other is not keep:
+                pairs.append(DuplicatePair(keep.path, other.path, 'exact', 1.0))
+
+    # 2. Near duplicates among representatives, via LSH buckets
+    near = []
+    for i, j in _candidate_pairs(representatives):
+        a, b = representatives[i], representatives[j]
+        score = similarity(a, b)
+        if score < AMBIGUOUS_SIMILARITY:
+            continue
+        same_pages = a.page_count == b.page_count
+        size_ratio = min(a.size, b.size) / max(a.size, b.size, 1)
+        kind = 'near' if score >= DUPLICATE_SIMILARITY and same_pages and size_ratio >= MIN_SIZE_RATIO else 'ambiguous'
+        keep, duplicate = _prefer(a, b)
+        near.append(DuplicatePair(keep.path, duplicate.path, kind, round(score, 3)))
+
+    # 3. Visual duplicates (scans) among representatives, via dHash bands
+    paired = {(p.keep, p.duplicate) for p in near} | {(p.duplicate, p.keep) for p in near}
+    buckets: Dict[Tuple[int, int], List[int]] = {}
+    for i, sig in enumerate(representatives):
+        if sig.phashes:
+            for band, value in enumerate(phash_bands(sig.phashes[0][1])):
+                buckets.setdefault((band, value), []).append(i)
+    candidates = set()
+    for members in buckets.values():
+        for x in range(len(members)):
+            for y in range(x + 1, len(members)):
+                candidates.add((members[x], members[y]))
+    for i, j in candidates:
+        a, b = representatives[i], representatives[j]
+        if (a.path, b.path) in paired:
+            continue
+        score = visual_match(a, b)
+        if score is not None:
+            keep, duplicate = _prefer(a, b)
+            near.append(DuplicatePair(keep.path, duplicate.path, 'visual', round(score, 3)))
+
+    near.sort(key=lambda p: (-p.similarity, p.keep, p.duplicate))
+    return pairs + near
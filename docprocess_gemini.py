@@ -0,0 +1,282 @@
+"""
+docprocess_gemini.py
+
+Streaming Gemini generation for Phase 5 and the repair formatters.
+
+A blocking generate_content call on an 80-page chunk can run for minutes
+with no sign of life, and the old hard timeout (300s) threw away everything
+the model had already written. Here every call streams.
+
+Design goals:
+- Partial output is appended to a .partial file as it arrives, so a crash
+  or stall keeps the work done so far.
+- A stalled stream is detected by idle time between chunks, not total wall
+  time: long but healthy completions are never cut off. The first chunk
+  gets a longer allowance because the model thinks before it writes
+  (DOCPROCESS_GEMINI_FIRST_TOKEN_TIMEOUT, DOCPROCESS_GEMINI_IDLE_TIMEOUT).
+- Progress is reported in tokens/sec (estimated at ~4 characters per token
+  until the final usage metadata arrives).
+- A truncated stream (stall or mid-stream error) resumes from the last
+  complete page marker: output before that marker is kept and only the
+  remaining input pages are sent again.
+- Completeness guard: a finished call is checked right away for
+  finish_reason MAX_TOKENS and for page markers missing at the tail. Only
+  the missing tail pages are requested again and spliced in, so truncated
+  documents do not wait for Phase 7 verify -> repair to be found.
+"""
+
+import os
+import queue
+import re
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+FIRST_TOKEN_TIMEOUT_ENV = 'DOCPROCESS_GEMINI_FIRST_TOKEN_TIMEOUT'
+IDLE_TIMEOUT_ENV = 'DOCPROCESS_GEMINI_IDLE_TIMEOUT'
+DEFAULT_FIRST_TOKEN_TIMEOUT = 600.0   # Seconds before the first chunk (model thinking time)
+DEFAULT_IDLE_TIMEOUT = 120.0          # Seconds between chunks once output has started
+PROGRESS_INTERVAL = 15.0              # Seconds between tokens/sec progress lines
+MAX_RESUMES = 3
+
+_PAGE_MARKER_RE = re.compile(r'\[BEGIN PDF Page \d+\]')
+
+
+class GeminiStallError(Exception):
+    """The stream produced no data within the idle timeout."""
+
+    def __init__(self, message: str, partial: str = ''):
+        super().__init__(message)
+        self.partial = partial
+
+
+class GeminiTruncatedError(Exception):
+    """Output is still incomplete (MAX_TOKENS or missing tail pages) after all continuations."""
+
+
+@dataclass
+class StreamResult:
+    """One streamed generate_content call."""
+    text: str = ''
+    finish_reason: Optional[str] = None   # e.g. 'STOP', 'MAX_TOKENS'; None if the stream broke
+    usage_metadata: object = None
+    elapsed_s: float = 0.0
+    error: Optional[str] = None
+
+
+def _timeout_from_env(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+def finish_reason_name(reason) -> Optional[str]:
+    """'STOP', 'MAX_TOKENS', ... for an SDK enum, int or string finish reason."""
+    if reason is None:
+        return None
+    return getattr(reason, 'name', None) or str(reason)
+
+
+def _chunk_text(chunk) -> str:
+    try:
+        return chunk.text or ''
+    except (ValueError, AttributeError):
+        # Chunks without text parts (e.g. the final usage-only chunk)
+        return ''
+
+
+def _pump(stream, q: queue.Queue) -> None:
+    """Move stream chunks onto q from a daemon thread, so the reader can time out."""
+    try:
+        for chunk in stream:
+            q.put(('chunk', chunk))
+        q.put(('done', None))
+    except BaseException as e:
+        q.put(('error', e))
+
+
+def stream_generate(model, prompt: str, generation_config, partial_file=None, label: str = '',
+                    first_token_timeout: Optional[float] = None,
+                    idle_timeout: Optional[float] = None) -> StreamResult:
+    """Run one streaming generate_content call.
+
+    Text is appended to partial_file (if given) as it arrives. Raises
+    GeminiStallError on an idle timeout; any other stream error is raised
+    with the partial text attached as .partial.
+    """
+    first_token_timeout = first_token_timeout or _timeout_from_env(FIRST_TOKEN_TIMEOUT_ENV, DEFAULT_FIRST_TOKEN_TIMEOUT)
+    idle_timeout = idle_timeout or _timeout_from_env(IDLE_TIMEOUT_ENV, DEFAULT_IDLE_TIMEOUT)
+    result = StreamResult()
+    parts: List[str] = []
+    chars = 0
+    started = time.perf_counter()
+    last_progress = started
+
+    stream = model.generate_content(prompt, generation_config=generation_config, stream=True)
+    q: queue.Queue = queue.Queue()
+    threading.Thread(target=_pump, args=(stream, q), daemon=True).start()
+
+    out = open(partial_file, 'a', encoding='utf-8') if partial_file else None
+    try:
+        while True:
+            timeout = idle_timeout if parts else first_token_timeout
+            try:
+                kind, item = q.get(timeout=timeout)
+            except queue.Empty:
+                raise GeminiStallError(f"Gemini stream stalled: no data for {timeout:.0f}s "
+                                       f"after {chars} chars", partial="".join(parts))
+            if kind == 'done':
+                break
+            if kind == 'error':
+                item.partial = "".join(parts)
+                raise item
+
+            text = _chunk_text(item)
+            if text:
+                parts.append(text)
+                chars += len(text)
+                if out:
+                    out.write(text)
+                    out.flush()
+            usage = getattr(item, 'usage_metadata', None)
+            if usage is not None:
+                result.usage_metadata = usage
+            candidates = getattr(item, 'candidates', None)
+            if candidates:
+                reason = finish_reason_name(getattr(candidates[0], 'finish_reason', None))
+                if reason and reason != 'FINISH_REASON_UNSPECIFIED':
+                    result.finish_reason = reason
+
+            now = time.perf_counter()
+            if now - last_progress >= PROGRESS_INTERVAL:
+                last_progress = now
+                print(f"      [STREAM] {label + ': ' if label else ''}~{chars // 4} tokens, "
+                      f"{chars / 4 / (now - started):.0f} tok/s")
+    finally:
+        if out:
+            out.close()
+
+    result.text = "".join(parts)
+    result.elapsed_s = time.perf_counter() - started
+    return result
+
+
+def resume_point(source: str, partial: str) -> Optional[Tuple[str, str]]:
+    """Where to continue a truncated output.
+
+    Returns (kept_output, remaining_source): output before the last page
+    marker in partial (that page may be incomplete) and the source from the
+    same marker on. None if no complete page was produced.
+    """
+    markers = list(_PAGE_MARKER_RE.finditer(partial))
+    if not markers:
+        return None
+    last = markers[-1]
+    kept = partial[:last.start()].rstrip()
+    source_pos = source.find(last.group(0))
+    if not kept or source_pos < 0:
+        return None
+    return kept, source[source_pos:]
+
+
+def continuation_point(source: str, output: str, finish_reason: Optional[str]) -> Optional[Tuple[str, str]]:
+    """Check a finished call for truncation.
+
+    Returns None if the output is complete, else (kept_output,
+    remaining_source) for a continuation call. Raises GeminiTruncatedError
+    if the output was cut off before any complete page.
+    """
+    if finish_reason == 'MAX_TOKENS':
+        # The last page is probably cut mid-way: redo it and everything after
+        point = resume_point(source, output)
+        if point is None:
+            raise GeminiTruncatedError("Output hit MAX_TOKENS before completing a page")
+        return point
+
+    # Finished normally: every source page marker should be in the output
+    source_markers = _PAGE_MARKER_RE.findall(source)
+    present = [i for i, marker in enumerate(source_markers) if marker in output]
+    if not present or len(present) == len(source_markers):
+        # No markers to check against (single page), or complete
+        return None
+    first_missing = present[-1] + 1
+    if first_missing >= len(source_markers):
+        # Pages missing only in the middle: not a truncated tail, left to Phase 7 verify
+        return None
+    missing_marker = source_markers[first_missing]
+    return output.rstrip(), source[source.find(missing_marker):]
+
+
+def generate_with_resume(model, prompt: str, source: str, generation_config, partial_path=None,
+                         label: str = '', max_resumes: int = MAX_RESUMES) -> Tuple[str, List[StreamResult]]:
+    """Stream prompt + source, resuming from the last page marker if the stream breaks
+    and continuing the tail if the output comes back truncated.
+
+    partial_path keeps the output so far on disk; if it already exists
+    (a previous run died mid-stream) generation resumes from it. Returns
+    the full output text and one StreamResult per call, for usage metrics.
+    The partial file is removed on success.
+    """
+    partial_path = Path(partial_path) if partial_path else None
+    kept = ''
+    remaining = source
+    if partial_path and partial_path.exists():
+        point = resume_point(source, partial_path.read_text(encoding='utf-8'))
+        if point:
+            kept, remaining = point
+            print(f"      [RESUME] {label + ': ' if label else ''}continuing from previous partial output")
+    if partial_path:
+        partial_path.write_text(kept + "\n\n" if kept else '', encoding='utf-8')
+
+    results: List[StreamResult] = []
+    attempt = 0
+    while True:
+        try:
+            result = stream_generate(model, prompt + "\n\n" + remaining, generation_config,
+                                     partial_file=partial_path, label=label)
+            results.append(result)
+            point = continuation_point(remaining, result.text, result.finish_reason)
+            if point is None:
+                break
+            attempt += 1
+            if attempt > max_resumes:
+                raise GeminiTruncatedError(f"Output still incomplete after {max_resumes} continuations "
+                                           f"(finish_reason={result.finish_reason})")
+            new_kept, remaining = point
+            kept = kept + "\n\n" + new_kept if kept else new_kept
+            print(f"      [CONTINUE] {label + ': ' if label else ''}finish_reason={result.finish_reason} - "
+                  f"requesting from {remaining[:40].splitlines()[0]}")
+            if partial_path:
+                partial_path.write_text(kept + "\n\n", encoding='utf-8')
+            continue
+        except GeminiTruncatedError:
+            raise
+        except Exception as e:
+            partial = getattr(e, 'partial', '')
+            if not partial and not isinstance(e, GeminiStallError):
+                raise
+            results.append(StreamResult(text=partial, error=str(e)))
+            attempt += 1
+            if attempt > max_resumes:
+                raise
+            point = resume_point(remaining, partial)
+            if point:
+                new_kept, remaining = point
+                kept = kept + "\n\n" + new_kept if kept else new_kept
+                print(f"      [RESUME] {label + ': ' if label else ''}{e} - resuming from "
+                      f"{remaining[:40].splitlines()[0]}")
+            else:
+                print(f"      [RETRY] {label + ': ' if label else ''}{e} - no complete page yet, restarting")
+            if partial_path:
+                partial_path.write_text(kept + "\n\n" if kept else '', encoding='utf-8')
+
+    text = results[-1].text.strip()
+    if kept:
+        text = kept + "\n\n" + text
+    if partial_path:
+        try:
+            partial_path.unlink()
+        except OSError:
+            pass
+    return text, results
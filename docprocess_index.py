@@ -0,0 +1,273 @@
+"""
+docprocess_index.py
+
+Persistent cross-folder document index: duplicate detection and artifact reuse.
+
+Phase 1 dedup (docprocess_dedup.py) only sees the PDFs of one case folder.
+The same exhibit often shows up in several case folders, where it would pay
+for OCR, Vision and Gemini again. This index remembers every document Phase
+1 has kept, in any folder, by content hash and by perceptual page hashes,
+plus the artifacts each folder produced for it (_o.pdf, _c.txt, _v31.txt
+and the GCS blob), so later phases can reuse them instead of recomputing.
+
+Design goals:
+- One SQLite file shared by all folders: ~/.docprocess/document_index.sqlite3,
+  or $DOCPROCESS_INDEX_DB ('off' disables the index).
+- Millisecond lookups: exact matches by indexed sha256; visual matches via
+  dHash band values (indexed), so only documents sharing a band are
+  compared.
+- Artifacts are keyed by the sha256 of the document's input PDF. Only exact
+  matches share artifacts: a perceptual-hash match has no second signal
+  (no text to compare), so Phase 1 reports it and processes the document.
+- Self-cleaning: entries whose file no longer exists are dropped when a
+  lookup finds them.
+- WAL mode and a busy timeout, so concurrent runs in different folders can
+  share the file.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+from docprocess_dedup import PHASH_BITS, PHASH_MAX_DISTANCE, DocumentSignature, phash_bands, visual_distance
+
+INDEX_DB_ENV = 'DOCPROCESS_INDEX_DB'
+DEFAULT_INDEX_DB = Path.home() / ".docprocess" / "document_index.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    path TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    page_count INTEGER NOT NULL,
+    has_text INTEGER NOT NULL,
+    phashes TEXT NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_sha256 ON documents(sha256);
+CREATE TABLE IF NOT EXISTS phash_bands (
+    path TEXT NOT NULL,
+    band INTEGER NOT NULL,
+    value INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS phash_bands_lookup ON phash_bands(band, value);
+CREATE INDEX IF NOT EXISTS phash_bands_path ON phash_bands(path);
+CREATE TABLE IF NOT EXISTS aliases (
+    sha256 TEXT PRIMARY KEY,
+    canonical TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS artifacts (
+    root_dir TEXT NOT NULL,
+    base_name TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    clean_pdf TEXT,
+    converted_txt TEXT,
+    formatted_txt TEXT,
+    gcs_blob TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (root_dir, base_name)
+);
+CREATE INDEX IF NOT EXISTS artifacts_sha256 ON artifacts(sha256);
+"""
+
+# Artifact columns: files are checked for existence on lookup, GCS blobs are not
+ARTIFACT_KINDS = ('clean_pdf', 'converted_txt', 'formatted_txt', 'gcs_blob')
+
+
+@dataclass
+class IndexMatch:
+    """An indexed document that a new PDF duplicates."""
+    path: str
+    sha256: str
+    kind: str           # 'exact' or 'visual'
+    similarity: float
+
+
+@dataclass
+class ArtifactRecord:
+    """Artifacts one folder produced for a document."""
+    root_dir: str
+    base_name: str
+    sha256: str
+    clean_pdf: Optional[str] = None
+    converted_txt: Optional[str] = None
+    formatted_txt: Optional[str] = None
+    gcs_blob: Optional[str] = None
+
+
+def index_db_path() -> Optional[Path]:
+    """Index location from $DOCPROCESS_INDEX_DB, the default, or None if disabled."""
+    value = os.environ.get(INDEX_DB_ENV)
+    if value is None:
+        return DEFAULT_INDEX_DB
+    if value.strip().lower() in ('', '0', 'off', 'false', 'no'):
+        return None
+    return Path(value).expanduser()
+
+
+def _resolved(path) -> str:
+    return str(Path(path).resolve())
+
+
+class DocumentIndex:
+    """SQLite index of kept documents (sha256, page count, perceptual hashes) and their artifacts."""
+
+    def __init__(self, db_path):
+        self.path = Path(db_path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _is_stale(self, path: str) -> bool:
+        """True (and the entry is dropped) if an indexed file no longer exists."""
+        if os.path.exists(path):
+            return False
+        self.remove(path)
+        return True
+
+    def find_duplicate(self, sig: DocumentSignature) -> Optional[IndexMatch]:
+        """An indexed document (other than sig's own file) with the same bytes or the same scan."""
+        own_path = _resolved(sig.path)
+        with self._lock:
+            exact = [row[0] for row in self._conn.execute(
+                "SELECT path FROM documents WHERE sha256 = ? AND path != ?", (sig.sha256, own_path))]
+        for path in exact:
+            if not self._is_stale(path):
+                return IndexMatch(path, sig.sha256, 'exact', 1.0)
+
+        if not sig.phashes:
+            return None
+        bands = phash_bands(sig.phashes[0][1])
+        where = " OR ".join("(b.band = ? AND b.value = ?)" for _ in bands)
+        params = [x for pair in enumerate(bands) for x in pair]
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT DISTINCT d.path, d.sha256, d.has_text, d.phashes FROM phash_bands b "
+                f"JOIN documents d ON d.path = b.path WHERE ({where}) AND d.path != ? AND d.page_count = ?",
+                params + [own_path, sig.page_count]).fetchall()
+        best = None
+        for path, sha256, has_text, phashes in rows:
+            if sig.minhash and has_text:
+                # Both have text: Phase 1's text comparison decides, not thumbnails
+                continue
+            hashes = tuple((int(a, 16), int(d, 16)) for a, d in json.loads(phashes))
+            distance = visual_distance(sig.phashes, hashes)
+            if distance is None or distance > PHASH_MAX_DISTANCE:
+                continue
+            if (best is None or distance < best[1]) and not self._is_stale(path):
+                best = (path, distance, sha256)
+        if best is None:
+            return None
+        return IndexMatch(best[0], best[2], 'visual', round(1.0 - best[1] / PHASH_BITS, 3))
+
+    def add(self, sig: DocumentSignature) -> None:
+        """Index a kept document (replaces any entry for the same path)."""
+        path = _resolved(sig.path)
+        phashes = json.dumps([[f"{a:x}", f"{d:x}"] for a, d in sig.phashes])
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM phash_bands WHERE path = ?", (path,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (path, sha256, size, page_count, has_text, phashes, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, sig.sha256, sig.size, sig.page_count, int(bool(sig.minhash)), phashes, time.time()))
+            if sig.phashes:
+                self._conn.executemany("INSERT INTO phash_bands (path, band, value) VALUES (?, ?, ?)",
+                                       [(path, band, value) for band, value in
+                                        enumerate(phash_bands(sig.phashes[0][1]))])
+
+    def add_alias(self, sha256: str, canonical: str) -> None:
+        """Record that documents with sha256 are the same document as canonical (e.g. a re-scan)."""
+        canonical = self.canonical(canonical)
+        if sha256 == canonical:
+            return
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO aliases (sha256, canonical) VALUES (?, ?)",
+                               (sha256, canonical))
+
+    def canonical(self, sha256: str) -> str:
+        with self._lock:
+            row = self._conn.execute("SELECT canonical FROM aliases WHERE sha256 = ?", (sha256,)).fetchone()
+        return row[0] if row else sha256
+
+    def artifact_key(self, root_dir, base_name: str) -> Optional[str]:
+        """Content key recorded for a folder's document, if any."""
+        with self._lock:
+            row = self._conn.execute("SELECT sha256 FROM artifacts WHERE root_dir = ? AND base_name = ?",
+                                     (_resolved(root_dir), base_name)).fetchone()
+        return row[0] if row else None
+
+    def record_artifact(self, sha256: str, root_dir, base_name: str, **artifacts) -> None:
+        """Record a folder's artifacts for a document; columns not given are left unchanged."""
+        unknown = set(artifacts) - set(ARTIFACT_KINDS)
+        if unknown:
+            raise ValueError(f"Unknown artifact kinds: {', '.join(sorted(unknown))}")
+        values = {k: (v if k == 'gcs_blob' else _resolved(v)) for k, v in artifacts.items() if v is not None}
+        key = (_resolved(root_dir), base_name)
+        sha256 = self.canonical(sha256)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO artifacts (root_dir, base_name, sha256, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(root_dir, base_name) DO UPDATE SET sha256 = excluded.sha256, "
+                "updated_at = excluded.updated_at", key + (sha256, time.time()))
+            for kind, value in values.items():
+                self._conn.execute(f"UPDATE artifacts SET {kind} = ? WHERE root_dir = ? AND base_name = ?",
+                                   (value,) + key)
+
+    def find_artifact(self, sha256: str, kind: str, exclude=None) -> Optional[ArtifactRecord]:
+        """Most recent record of the same document that has artifact `kind`.
+
+        exclude is a (root_dir, base_name) pair to skip (the caller's own
+        record). Records whose artifact file is gone are cleared.
+        """
+        if kind not in ARTIFACT_KINDS:
+            raise ValueError(f"Unknown artifact kind: {kind}")
+        sha256 = self.canonical(sha256)
+        excluded = (_resolved(exclude[0]), exclude[1]) if exclude else None
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT root_dir, base_name, sha256, {', '.join(ARTIFACT_KINDS)} FROM artifacts "
+                f"WHERE sha256 = ? AND {kind} IS NOT NULL ORDER BY updated_at DESC", (sha256,)).fetchall()
+        for row in rows:
+            record = ArtifactRecord(*row)
+            if (record.root_dir, record.base_name) == excluded:
+                continue
+            if kind != 'gcs_blob' and not os.path.exists(getattr(record, kind)):
+                with self._lock, self._conn:
+                    self._conn.execute(f"UPDATE artifacts SET {kind} = NULL WHERE root_dir = ? AND base_name = ?",
+                                       (record.root_dir, record.base_name))
+                continue
+            return record
+        return None
+
+    def remove(self, path) -> None:
+        path = _resolved(path)
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM phash_bands WHERE path = ?", (path,))
+            self._conn.execute("DELETE FROM documents WHERE path = ?", (path,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_indexes: Dict[str, DocumentIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index() -> Optional[DocumentIndex]:
+    """Shared index for this process, or None if $DOCPROCESS_INDEX_DB disables it."""
+    db_path = index_db_path()
+    if db_path is None:
+        return None
+    key = str(db_path.resolve())
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = DocumentIndex(db_path)
+        return _indexes[key]
@@ -0,0 +1,198 @@
+"""
+docprocess_journal.py
+
+Durable job journal and atomic output helpers for doc-process-v31.
+
+Resume used to rely on output-file existence alone, so a crash could leave a
+truncated output that later phases treated as finished, and a crash in the
+middle of a chunked Gemini call lost every chunk already paid for.
+
+Design goals:
+- Append-only JSONL journal in y_logs/JOURNAL.jsonl, one line per
+  file/step/unit transition ('started', 'done', 'failed'), flushed and
+  fsynced so it survives a crash.
+- Each record carries the hash of the input it was produced from, so a
+  changed input is reprocessed even if an old output exists.
+- Outputs are written to a temp file and renamed into place, so an output
+  path either holds a complete file or nothing.
+- Units below file level (Vision page batches, Gemini chunks) are journaled
+  too, with their results cached under the phase's _log/ directory.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+
+JOURNAL_NAME = "JOURNAL.jsonl"
+
+STARTED = 'started'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def file_sha256(path, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a file's bytes, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def text_sha256(text: str) -> str:
+    """SHA-256 of a string's UTF-8 encoding."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _temp_path_for(path: Path) -> Path:
+    return path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+@contextmanager
+def atomic_output(path):
+    """Yield a temp path next to `path`; rename it into place on success.
+
+    The temp file is removed if the block raises, so `path` is never left
+    half-written.
+    """
+    path = Path(path)
+    temp_path = _temp_path_for(path)
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    finally:
+        if temp_path.exists():
+            try:
+                temp_path.unlink()
+            except OSError:
+                pass
+
+
+def atomic_write_text(path, text: str, encoding: str = 'utf-8') -> None:
+    """Write text to path via temp file + rename."""
+    with atomic_output(path) as temp_path:
+        with open(temp_path, 'w', encoding=encoding) as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class JobJournal:
+    """Append-only record of per-file, per-step and per-unit progress."""
+
+    def __init__(self, logs_dir):
+        self.path = Path(logs_dir) / JOURNAL_NAME
+        self._lock = threading.Lock()
+        self._state: Dict[Tuple[str, str, Optional[str]], dict] = {}
+        self._hash_cache: Dict[str, Tuple[int, int, str]] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    # Last line cut short by a crash - everything before it is intact
+                    continue
+                self._apply(rec)
+
+    def _apply(self, rec: dict) -> None:
+        self._state[(rec.get('file'), rec.get('step'), rec.get('unit'))] = rec
+        stat = rec.get('input_stat')
+        if stat and rec.get('input_path') and rec.get('input_hash'):
+            self._hash_cache[rec['input_path']] = (stat[0], stat[1], rec['input_hash'])
+
+    def record(self, file: str, step: str, status: str, unit: Optional[str] = None,
+               input_path=None, input_hash: Optional[str] = None, **extra) -> dict:
+        """Append one transition and return it."""
+        rec = {'ts': round(time.time(), 3), 'file': file, 'step': step, 'unit': unit, 'status': status}
+        if input_path is not None:
+            input_path = Path(input_path)
+            if input_hash is None:
+                input_hash = self.input_hash(input_path)
+            st = input_path.stat()
+            rec['input_path'] = str(input_path)
+            rec['input_stat'] = [st.st_size, st.st_mtime_ns]
+        if input_hash is not None:
+            rec['input_hash'] = input_hash
+        rec.update(extra)
+
+        line = json.dumps(rec, ensure_ascii=True) + "\n"
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._apply(rec)
+        return rec
+
+    def last(self, file: str, step: str, unit: Optional[str] = None) -> Optional[dict]:
+        with self._lock:
+            return self._state.get((file, step, unit))
+
+    def input_hash(self, path) -> str:
+        """Hash of an input file, reusing the journaled hash while size and mtime are unchanged."""
+        path = Path(path)
+        st = path.stat()
+        with self._lock:
+            cached = self._hash_cache.get(str(path))
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        digest = file_sha256(path)
+        with self._lock:
+            self._hash_cache[str(path)] = (st.st_size, st.st_mtime_ns, digest)
+        return digest
+
+    def is_done(self, file: str, step: str, unit: Optional[str] = None,
+                input_hash: Optional[str] = None) -> bool:
+        """True if the last transition for this unit is 'done' (for the same input, if given)."""
+        rec = self.last(file, step, unit)
+        if not rec or rec.get('status') != DONE:
+            return False
+        return input_hash is None or rec.get('input_hash') == input_hash
+
+    def should_skip(self, file: str, step: str, output_path, input_path=None,
+                    input_hash: Optional[str] = None) -> bool:
+        """Resume check for a whole-file step.
+
+        Skip only if the output exists and either the journal has no record
+        for it (output predates the journal) or the last record is 'done' for
+        the current input. The input is identified by input_hash if given,
+        otherwise by hashing input_path.
+        """
+        if not Path(output_path).exists():
+            return False
+        rec = self.last(file, step)
+        if rec is None:
+            return True
+        if rec.get('status') != DONE:
+            return False
+        if not rec.get('input_hash'):
+            return True
+        if input_hash is None and input_path is not None and Path(input_path).exists():
+            input_hash = self.input_hash(input_path)
+        return input_hash is None or rec['input_hash'] == input_hash
+
+
+_journals: Dict[str, JobJournal] = {}
+_journals_lock = threading.Lock()
+
+
+def get_journal(root_dir) -> JobJournal:
+    """Shared journal for a pipeline root (y_logs/JOURNAL.jsonl)."""
+    logs_dir = Path(root_dir) / "y_logs"
+    key = str(logs_dir.resolve())
+    with _journals_lock:
+        if key not in _journals:
+            _journals[key] = JobJournal(logs_dir)
+        return _journals[key]
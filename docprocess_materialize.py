@@ -0,0 +1,130 @@
+"""
+docprocess_materialize.py
+
+Stage-directory materialization without full file copies.
+
+Phase 2 copied every _d.pdf into 02_doc-renamed only to give it a new name,
+so each input existed twice on disk before OCR wrote its _o.pdf, and
+renaming a large intake meant reading and writing every byte again. Stage
+files that are byte-identical to their source are materialized here
+instead.
+
+Design goals:
+- Chosen per filesystem: a hardlink where the filesystem supports it (no
+  data written, no extra space), else a reflink / copy-on-write clone
+  (Linux FICLONE on btrfs/XFS, clonefile on APFS), else a plain copy.
+  The working method is cached per (source device, target device) pair,
+  so unsupported methods are tried once per run, not once per file.
+- Safe to share only if every writer replaces: a hardlink or reflink
+  shares its bytes with the source (and a reused _o.pdf with another
+  folder's), so anything that updates a stage file must write a new file
+  and rename it over the old one (atomic_output, os.replace), or unlink
+  the target before writing (the Phase 3 workers' _new_file). A tool that
+  writes straight into an existing stage path would change the linked
+  file too.
+- Atomic: the link or copy is created under a temp name next to the target
+  and renamed over it.
+- DOCPROCESS_MATERIALIZE forces one method ('hardlink', 'reflink', 'copy');
+  'auto' (default) picks per filesystem. A forced method that fails falls
+  back to a copy.
+"""
+
+import os
+import shutil
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, Tuple
+
+from docprocess_journal import atomic_output
+
+MATERIALIZE_ENV = 'DOCPROCESS_MATERIALIZE'
+HARDLINK = 'hardlink'
+REFLINK = 'reflink'
+COPY = 'copy'
+STRATEGIES = ('auto', HARDLINK, REFLINK, COPY)
+
+_FICLONE = 0x40049409  # Linux ioctl: clone the whole file (btrfs, XFS with reflink=1, ...)
+
+_methods: Dict[Tuple[int, int], str] = {}
+_methods_lock = threading.Lock()
+
+
+def materialize_strategy() -> str:
+    value = (os.environ.get(MATERIALIZE_ENV) or 'auto').strip().lower()
+    if value not in STRATEGIES:
+        raise ValueError(f"{MATERIALIZE_ENV} must be one of {', '.join(STRATEGIES)}, got {value!r}")
+    return value
+
+
+def _reflink(source: Path, target: Path) -> None:
+    """Copy-on-write clone of source at target (which must not exist); OSError if unsupported."""
+    if sys.platform.startswith('linux'):
+        import fcntl
+        with open(source, 'rb') as src, open(target, 'wb') as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+            except OSError:
+                dst.close()
+                os.unlink(target)
+                raise
+        shutil.copystat(source, target)
+    elif sys.platform == 'darwin':
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(source), os.fsencode(target), 0) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+    else:
+        raise OSError(f"reflink not supported on {sys.platform}")
+
+
+def _create(method: str, source: Path, target: Path) -> None:
+    if method == HARDLINK:
+        os.link(source, target)
+    elif method == REFLINK:
+        _reflink(source, target)
+    else:
+        shutil.copy2(source, target)
+
+
+def _devices(source: Path, target: Path) -> Tuple[int, int]:
+    return os.stat(source).st_dev, os.stat(target.parent).st_dev
+
+
+def materialize(source, target) -> str:
+    """Make target a file with source's content; returns the method used.
+
+    The method is hardlink, reflink or copy: forced by DOCPROCESS_MATERIALIZE
+    or picked per filesystem pair. An existing target is replaced atomically.
+    """
+    source, target = Path(source), Path(target)
+    strategy = materialize_strategy()
+    key = _devices(source, target)
+    known = None
+    if strategy != 'auto':
+        candidates = [strategy] if strategy == COPY else [strategy, COPY]
+    else:
+        with _methods_lock:
+            known = _methods.get(key)
+        if known:
+            candidates = [known] if known == COPY else [known, COPY]
+        elif key[0] != key[1]:
+            # Links and clones never cross filesystems
+            candidates = [COPY]
+        else:
+            candidates = [HARDLINK, REFLINK, COPY]
+
+    with atomic_output(target) as temp_path:
+        for method in candidates:
+            try:
+                _create(method, source, temp_path)
+                break
+            except OSError:
+                if method == COPY:
+                    raise
+    if strategy == 'auto' and known is None:
+        # First file on this filesystem pair: remember what worked
+        with _methods_lock:
+            _methods[key] = method
+    return method
@@ -0,0 +1,205 @@
+"""
+docprocess_metadata.py
+
+Local rule-based metadata extraction for Phase 2 (rename).
+
+convert_date_from_filename only understands dates written into the file
+name. Court documents usually carry their date on the first page as well
+("Filed: January 5, 2024", "Dated this 5th day of January, 2024",
+"E-Filed 01/05/2024"). This module reads those with precompiled regular
+expressions so most renames need no Gemini call.
+
+Design goals:
+- Fast and offline: a few compiled patterns over one page of text; no
+  models, no network.
+- Scored, not guessed: every field gets a confidence in 0..1. A date only
+  scores high in a filing position: a short caption, stamp or signature
+  line opened by its cue ("Filed: ...", "Dated this 5th day of ...",
+  "DONE AND ORDERED ... this ..."), or a cue in two places agreeing on it.
+  A cue mid-sentence alone ("the order entered March 3, 2019") may cite
+  an earlier filing and stays below the threshold; a bare date scores low,
+  and a date labelled as something else ("Date of Loss", "Hearing") lower
+  still. Conflicting candidates lower the score.
+- Gemini stays the fallback: Phase 2 only trusts the local result when the
+  date confidence reaches DOCPROCESS_METADATA_MIN_CONFIDENCE (default 0.8).
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from datetime import date as _date
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+MIN_CONFIDENCE_ENV = 'DOCPROCESS_METADATA_MIN_CONFIDENCE'
+DEFAULT_MIN_CONFIDENCE = 0.8
+
+# Date candidate weights
+POSITIONED_WEIGHT = 0.9    # Cue opens a short caption/stamp/signature line with the date
+CUED_WEIGHT = 0.7          # Cue elsewhere before the date (may cite an earlier order)
+UNCUED_WEIGHT = 0.5        # Bare date
+OTHER_DATE_WEIGHT = 0.2    # Labelled as a different kind of date (loss, hearing, birth...)
+REPEAT_BONUS = 0.05        # Per extra occurrence of the same date, up to MAX_REPEAT_BONUS
+MAX_REPEAT_BONUS = 0.1
+AGREEMENT_BONUS = 0.15     # Same date cued in two places
+CONFLICT_MARGIN = 0.15     # Runner-up this close to the best date -> ambiguous
+CONFLICT_PENALTY = 0.3
+
+_CONTEXT_CHARS = 60        # How far before a date (same line) cues are looked for
+_TAIL_CHARS = 30           # Text allowed after the date on a caption/stamp line ("10:32 AM", "at Miami")
+
+_MONTHS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12,
+}
+_MONTH = (r'(?P<month>jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?'
+          r'|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\.?')
+
+# (pattern, cued) - "this 5th day of January" is a signature/filing formula in itself
+_DATE_PATTERNS = [
+    (re.compile(rf'\b{_MONTH}\s+(?P<day>\d{{1,2}})(?:st|nd|rd|th)?,?\s+(?P<year>\d{{4}})\b', re.IGNORECASE), False),
+    (re.compile(rf'\b(?P<day>\d{{1,2}})(?:st|nd|rd|th)?\s+day\s+of\s+{_MONTH},?\s+(?:A\.?D\.?,?\s+)?(?P<year>\d{{4}})\b',
+                re.IGNORECASE), True),
+    (re.compile(rf'\b(?P<day>\d{{1,2}})(?:st|nd|rd|th)?\s+{_MONTH},?\s+(?P<year>\d{{4}})\b', re.IGNORECASE), False),
+    (re.compile(r'\b(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})\b'), False),
+    (re.compile(r'\b(?P<month>\d{1,2})[/.\-](?P<day>\d{1,2})[/.\-](?P<year>\d{4}|\d{2})\b'), False),
+]
+
+_CUE_RE = re.compile(r'\b(?:e-?filed|filed|dated|date|entered|signed|executed|received|served|submitted|'
+                     r'done\s+and\s+ordered|ordered|stamped|rendered)\b', re.IGNORECASE)
+_OTHER_DATE_RE = re.compile(r'\b(?:loss|birth|dob|incident|accident|injury|effective|expir\w*|period|'
+                            r'hearing|trial|deadline|due|inception|occurrence)\b', re.IGNORECASE)
+
+
+@dataclass
+class ExtractedMetadata:
+    """Fields found on a first page, each with a 0..1 confidence."""
+    date: str = ''                 # YYYYMMDD
+    party: str = ''                # Acronym from PARTY_ACRONYMS
+    case: str = ''                 # Entry of CASE_ACRONYMS
+    date_confidence: float = 0.0
+    party_confidence: float = 0.0
+    case_confidence: float = 0.0
+
+    def as_metadata(self) -> dict:
+        """Same keys as the Gemini rename JSON, plus source and confidence."""
+        return {'date': self.date, 'party': self.party, 'case': self.case, 'description': '',
+                'source': 'local', 'confidence': round(self.date_confidence, 2)}
+
+
+def min_confidence() -> float:
+    value = os.environ.get(MIN_CONFIDENCE_ENV)
+    return float(value) if value else DEFAULT_MIN_CONFIDENCE
+
+
+def _to_yyyymmdd(year: str, month: str, day: str) -> Optional[str]:
+    if month.isdigit():
+        m = int(month)
+    else:
+        m = _MONTHS.get(month[:3].lower())
+        if m is None:
+            return None
+    y = int(year)
+    if len(year) == 2:
+        # Two-digit years are 20YY, like convert_date_from_filename, unless that is in the future
+        y += 2000 if 2000 + y <= _date.today().year + 1 else 1900
+    if not 1950 <= y <= _date.today().year + 1:
+        return None
+    try:
+        return _date(y, m, int(day)).strftime('%Y%m%d')
+    except ValueError:
+        return None
+
+
+def _date_candidates(text: str) -> List[Tuple[str, float]]:
+    """(YYYYMMDD, weight) for every date on the page; overlapping matches count once."""
+    found = []
+    taken: List[Tuple[int, int]] = []
+    for pattern, cued in _DATE_PATTERNS:
+        for match in pattern.finditer(text):
+            start, end = match.span()
+            if any(start < t_end and t_start < end for t_start, t_end in taken):
+                continue
+            value = _to_yyyymmdd(match.group('year'), match.group('month'), match.group('day'))
+            if value is None:
+                continue
+            taken.append((start, end))
+            line_start = text.rfind('\n', 0, start) + 1
+            line_end = text.find('\n', end)
+            context_start = max(line_start, start - _CONTEXT_CHARS)
+            context = text[context_start:start]
+            cue = _CUE_RE.search(context)
+            if _OTHER_DATE_RE.search(context):
+                weight = OTHER_DATE_WEIGHT
+            elif cue or cued:
+                # The "day of" formula is its own cue
+                cue_start = context_start + cue.start() if cue else start
+                opens_line = not re.search(r'\w', text[line_start:cue_start])
+                tail = text[end:len(text) if line_end < 0 else line_end].strip()
+                weight = POSITIONED_WEIGHT if opens_line and len(tail) <= _TAIL_CHARS else CUED_WEIGHT
+            else:
+                weight = UNCUED_WEIGHT
+            found.append((value, weight))
+    return found
+
+
+def _score_dates(candidates: List[Tuple[str, float]]) -> Tuple[str, float]:
+    if not candidates:
+        return '', 0.0
+    scores: Dict[str, float] = {}
+    counts: Dict[str, int] = {}
+    cued: Dict[str, int] = {}
+    for value, weight in candidates:
+        scores[value] = max(scores.get(value, 0.0), weight)
+        counts[value] = counts.get(value, 0) + 1
+        cued[value] = cued.get(value, 0) + (weight >= CUED_WEIGHT)
+    for value in scores:
+        bonus = min(MAX_REPEAT_BONUS, REPEAT_BONUS * (counts[value] - 1))
+        if cued[value] >= 2:
+            bonus += AGREEMENT_BONUS
+        scores[value] = min(1.0, scores[value] + bonus)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    best, confidence = ranked[0]
+    if len(ranked) > 1 and ranked[1][1] >= confidence - CONFLICT_MARGIN:
+        confidence -= CONFLICT_PENALTY
+    return best, max(0.0, confidence)
+
+
+@lru_cache(maxsize=None)
+def _name_pattern(names: Tuple[str, ...]) -> 're.Pattern':
+    # Longest first so "Fremont Insurance" wins over "Fremont"
+    alternatives = sorted(names, key=len, reverse=True)
+    return re.compile(r'\b(' + '|'.join(re.escape(n) for n in alternatives) + r')\b', re.IGNORECASE)
+
+
+def _best_match(text: str, names: Tuple[str, ...], value_of) -> Tuple[str, float]:
+    """Most frequent name (mapped through value_of) and its share of all matches."""
+    if not names:
+        return '', 0.0
+    counts: Dict[str, int] = {}
+    lookup = {n.lower(): n for n in names}
+    for match in _name_pattern(names).finditer(text):
+        value = value_of(lookup[match.group(1).lower()])
+        counts[value] = counts.get(value, 0) + 1
+    if not counts:
+        return '', 0.0
+    value, count = max(counts.items(), key=lambda item: item[1])
+    return value, count / sum(counts.values())
+
+
+def extract_metadata(text: str, party_acronyms: Optional[Dict[str, str]] = None,
+                     case_acronyms: Optional[Iterable[str]] = None) -> ExtractedMetadata:
+    """Extract date, party and case from first-page text with confidence scores.
+
+    party_acronyms maps names to acronyms (PARTY_ACRONYMS); case_acronyms
+    lists case acronyms (CASE_ACRONYMS), matched as whole words so
+    "Case No. 9C1-1234" gives "9c1".
+    """
+    result = ExtractedMetadata()
+    if not text or not text.strip():
+        return result
+    result.date, result.date_confidence = _score_dates(_date_candidates(text))
+    party_acronyms = party_acronyms or {}
+    result.party, result.party_confidence = _best_match(text, tuple(party_acronyms), party_acronyms.get)
+    result.case, result.case_confidence = _best_match(text, tuple(case_acronyms or ()), lambda name: name)
+    return result
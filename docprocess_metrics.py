@@ -0,0 +1,215 @@
+"""
+docprocess_metrics.py
+
+Per-file and per-phase timing/throughput metrics for doc-process-v31.
+
+report_data only records status strings, so a slow run could not be traced
+to OCR, Vision, Gemini or GCS. This module records where the time went.
+
+Design goals:
+- measure() times one unit of work (wall + CPU) and collects counters:
+  bytes in/out, pages, API calls, retries and Gemini tokens.
+- Workers return their FileMetrics inside ProcessingResult.metadata
+  ['metrics'], so the same path works for thread pools, process pools and
+  the streaming scheduler; only the parent process aggregates.
+- PipelineMetrics aggregates per file and per phase, writes
+  y_logs/METRICS_<ts>.json and prints a summary table at the end of main.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, fields
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+@dataclass
+class FileMetrics:
+    """Timing and counters for one file in one phase."""
+    wall_s: float = 0.0
+    cpu_s: float = 0.0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    pages: int = 0
+    api_calls: int = 0
+    retries: int = 0
+    tokens_in: int = 0
+    tokens_out: int = 0
+
+    def add(self, **counts) -> None:
+        """Increment counters, e.g. m.add(api_calls=1, pages=5)."""
+        for name, value in counts.items():
+            if not hasattr(self, name):
+                raise KeyError(f"Unknown metric: {name}")
+            setattr(self, name, getattr(self, name) + (value or 0))
+
+    def merge(self, other: dict) -> None:
+        for f in fields(self):
+            if f.name in other:
+                setattr(self, f.name, getattr(self, f.name) + (other[f.name] or 0))
+
+    def as_dict(self) -> dict:
+        d = asdict(self)
+        d['wall_s'] = round(d['wall_s'], 3)
+        d['cpu_s'] = round(d['cpu_s'], 3)
+        return d
+
+
+def _children_cpu() -> float:
+    t = os.times()
+    return t.children_user + t.children_system
+
+
+@contextmanager
+def measure(include_children: bool = False):
+    """Time the enclosed block and yield a FileMetrics for its counters.
+
+    CPU is the calling thread's CPU time. With include_children=True, CPU
+    of finished subprocesses (ocrmypdf, Ghostscript) is added; only use that
+    in a process-pool worker, where no other thread starts subprocesses.
+    """
+    m = FileMetrics()
+    wall0 = time.perf_counter()
+    cpu0 = time.thread_time()
+    child0 = _children_cpu() if include_children else 0.0
+    try:
+        yield m
+    finally:
+        m.wall_s += time.perf_counter() - wall0
+        m.cpu_s += time.thread_time() - cpu0
+        if include_children:
+            m.cpu_s += _children_cpu() - child0
+
+
+def attach_metrics(result, m: FileMetrics):
+    """Store m in result.metadata['metrics'] and return result."""
+    metadata = dict(result.metadata) if result.metadata else {}
+    metadata['metrics'] = m.as_dict()
+    result.metadata = metadata
+    return result
+
+
+@dataclass
+class PhaseMetrics:
+    """Aggregate for one phase (or pipeline stage)."""
+    wall_s: float = 0.0      # Phase wall time (from phase()); 0 for stages inside the pipeline
+    cpu_s: float = 0.0       # Main-process CPU during phase()
+    files_ok: int = 0
+    files_failed: int = 0
+    files_skipped: int = 0
+    totals: Optional[FileMetrics] = None
+
+    def __post_init__(self):
+        if self.totals is None:
+            self.totals = FileMetrics()
+
+
+OK_STATUSES = ('OK', 'PARTIAL', 'COPIED')
+
+
+class PipelineMetrics:
+    """Thread-safe collector for a whole run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = datetime.now()
+        self.phases: Dict[str, PhaseMetrics] = {}
+        self.files: List[dict] = []
+
+    def _phase(self, name: str) -> PhaseMetrics:
+        if name not in self.phases:
+            self.phases[name] = PhaseMetrics()
+        return self.phases[name]
+
+    @contextmanager
+    def phase(self, name: str):
+        """Record the wall and main-process CPU time of a whole phase."""
+        wall0 = time.perf_counter()
+        cpu0 = time.process_time()
+        try:
+            yield
+        finally:
+            with self._lock:
+                pm = self._phase(name)
+                pm.wall_s += time.perf_counter() - wall0
+                pm.cpu_s += time.process_time() - cpu0
+
+    def add_file(self, phase: str, file: str, status: str, metrics: Optional[dict] = None) -> None:
+        with self._lock:
+            pm = self._phase(phase)
+            if status == 'SKIPPED':
+                pm.files_skipped += 1
+                return
+            if status in OK_STATUSES:
+                pm.files_ok += 1
+            else:
+                pm.files_failed += 1
+            if metrics:
+                pm.totals.merge(metrics)
+                self.files.append(dict(metrics, phase=phase, file=file, status=status))
+
+    def add_result(self, phase: str, file: str, result) -> None:
+        """Record a ProcessingResult, using its metadata['metrics'] if present."""
+        metadata = result.metadata if result.metadata else {}
+        self.add_file(phase, file, result.status, metadata.get('metrics'))
+
+    def summary(self) -> Dict[str, dict]:
+        """Per-phase totals plus derived throughput."""
+        out = {}
+        with self._lock:
+            for name, pm in self.phases.items():
+                totals = pm.totals.as_dict()
+                # Stages inside the pipeline overlap, so fall back to summed file time
+                elapsed = pm.wall_s or totals['wall_s']
+                out[name] = {
+                    'wall_s': round(pm.wall_s, 3),
+                    'main_cpu_s': round(pm.cpu_s, 3),
+                    'files_ok': pm.files_ok,
+                    'files_failed': pm.files_failed,
+                    'files_skipped': pm.files_skipped,
+                    'totals': totals,
+                    'pages_per_s': round(totals['pages'] / elapsed, 3) if elapsed else 0.0,
+                    'mb_in_per_s': round(totals['bytes_in'] / (1024 * 1024) / elapsed, 3) if elapsed else 0.0,
+                }
+        return out
+
+    def write(self, logs_dir) -> Path:
+        """Write y_logs/METRICS_<ts>.json and return its path."""
+        logs_dir = Path(logs_dir)
+        logs_dir.mkdir(parents=True, exist_ok=True)
+        path = logs_dir / f"METRICS_{self.started.strftime('%Y%m%d_%H%M%S')}.json"
+        with self._lock:
+            files = list(self.files)
+        payload = {
+            'started': self.started.isoformat(timespec='seconds'),
+            'finished': datetime.now().isoformat(timespec='seconds'),
+            'phases': self.summary(),
+            'files': files,
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, indent=2)
+        return path
+
+    def print_summary(self) -> None:
+        summary = self.summary()
+        if not summary:
+            return
+        print("\nPERFORMANCE SUMMARY")
+        print("-" * 100)
+        print(f"{'Phase':<12} {'Wall s':>9} {'File s':>9} {'CPU s':>9} {'OK':>5} {'Fail':>5} {'Skip':>5} "
+              f"{'Pages':>7} {'MB in':>8} {'API':>6} {'Retry':>6} {'Tokens':>9}")
+        for name, s in summary.items():
+            t = s['totals']
+            print(f"{name:<12} {s['wall_s']:>9.1f} {t['wall_s']:>9.1f} {t['cpu_s']:>9.1f} "
+                  f"{s['files_ok']:>5} {s['files_failed']:>5} {s['files_skipped']:>5} "
+                  f"{t['pages']:>7} {t['bytes_in'] / (1024 * 1024):>8.1f} {t['api_calls']:>6} "
+                  f"{t['retries']:>6} {t['tokens_in'] + t['tokens_out']:>9}")
+        print("-" * 100)
+
+
+# Run-wide collector used by doc-process-v31.py
+metrics = PipelineMetrics()
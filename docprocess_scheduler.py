@@ -0,0 +1,135 @@
+"""
+docprocess_scheduler.py
+
+File-level dataflow scheduler for doc-process-v31.
+
+The phase functions in doc-process-v31.py are barriers: every file finishes
+Phase 3 before any file starts Phase 4, and so on. This scheduler instead
+moves each document through an ordered list of stages (clean -> convert ->
+format -> upload) as soon as its previous stage finishes.
+
+Design goals:
+- One executor per stage, all draining concurrently (CPU-bound OCR in a
+  process pool, Vision/Gemini/GCS I/O in thread pools).
+- Stage functions are the same per-file workers the phases use, so the
+  output layout is unchanged.
+- A single coordinator thread submits follow-on work; no stage function
+  needs to know about the stages around it.
+- One bad document cannot stop the run: an error in a stage's is_done,
+  make_args or on_start hook is recorded as a FAILED result for that
+  document and stage, and the other documents keep moving.
+"""
+
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from docprocess_workers import ProcessingResult
+
+
+# Statuses that let a document continue to its next stage
+ADVANCE_STATUSES = ('OK', 'PARTIAL', 'COPIED', 'SKIPPED')
+
+
+@dataclass
+class Stage:
+    """One step of the per-document pipeline.
+
+    func is called as func(*make_args(item)) in the stage's executor and must
+    return a ProcessingResult. For kind='process' the func and its arguments
+    must be picklable (module-level functions only).
+    """
+    name: str
+    func: Callable
+    kind: str = 'thread'  # 'thread' or 'process'
+    workers: int = 1
+    make_args: Optional[Callable] = None
+    is_done: Optional[Callable] = None  # item -> True to skip this stage
+    initializer: Optional[Callable] = None
+    initargs: tuple = ()
+
+
+class PipelineScheduler:
+    """Run items through stages, overlapping stages across items."""
+
+    def __init__(self, stages: Sequence[Stage],
+                 on_result: Optional[Callable[[str, str, ProcessingResult], None]] = None,
+                 on_start: Optional[Callable[[str, str], None]] = None):
+        if not stages:
+            raise ValueError("PipelineScheduler needs at least one stage")
+        self.stages = list(stages)
+        self.on_result = on_result
+        self.on_start = on_start
+
+    def _make_executor(self, stage: Stage):
+        if stage.kind == 'process':
+            return ProcessPoolExecutor(max_workers=stage.workers, initializer=stage.initializer,
+                                       initargs=stage.initargs)
+        return ThreadPoolExecutor(max_workers=stage.workers, thread_name_prefix=f"stage-{stage.name}",
+                                  initializer=stage.initializer, initargs=stage.initargs)
+
+    def run(self, items: Sequence[str]) -> Dict[str, List[Tuple[str, ProcessingResult]]]:
+        """Process all items; returns {item: [(stage_name, result), ...]}."""
+        results: Dict[str, List[Tuple[str, ProcessingResult]]] = {item: [] for item in items}
+        done_queue: "queue.Queue" = queue.Queue()
+        executors = [self._make_executor(stage) for stage in self.stages]
+        in_flight = 0
+        started = time.time()
+
+        def submit(item, stage_idx):
+            """Submit item to the first stage at or after stage_idx that is not already done."""
+            nonlocal in_flight
+            while stage_idx < len(self.stages):
+                stage = self.stages[stage_idx]
+                try:
+                    if stage.is_done and stage.is_done(item):
+                        skipped = ProcessingResult(file_name=item, status='SKIPPED')
+                        self._record(results, item, stage, skipped)
+                        stage_idx += 1
+                        continue
+                    args = stage.make_args(item) if stage.make_args else (item,)
+                    if self.on_start:
+                        self.on_start(item, stage.name)
+                    future = executors[stage_idx].submit(stage.func, *args)
+                except Exception as e:
+                    # e.g. an unreadable input in the journal check: fail this document, not the run
+                    failed = ProcessingResult(file_name=item, status='FAILED', error=f"{stage.name}: {e}")
+                    self._record(results, item, stage, failed)
+                    return
+                in_flight += 1
+                future.add_done_callback(lambda f, i=item, s=stage_idx: done_queue.put((i, s, f)))
+                return
+
+        try:
+            for item in items:
+                submit(item, 0)
+
+            while in_flight:
+                item, stage_idx, future = done_queue.get()
+                in_flight -= 1
+                stage = self.stages[stage_idx]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = ProcessingResult(file_name=item, status='FAILED', error=str(e))
+                self._record(results, item, stage, result)
+
+                if result.status in ADVANCE_STATUSES:
+                    submit(item, stage_idx + 1)
+        finally:
+            for executor in executors:
+                executor.shutdown(wait=True)
+
+        print(f"[OK] Pipeline drained {len(items)} documents in {time.time() - started:.1f}s")
+        return results
+
+    def _record(self, results, item, stage, result):
+        results[item].append((stage.name, result))
+        if self.on_result:
+            try:
+                self.on_result(item, stage.name, result)
+            except Exception as e:
+                # The bookkeeping may hit the same bad input the stage did; keep draining
+                print(f"[WARN] Could not record {stage.name} result for {item}: {e}")
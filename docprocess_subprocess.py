@@ -0,0 +1,195 @@
+"""
+docprocess_subprocess.py
+
+Managed subprocess runner for the OCR tools (ocrmypdf, Ghostscript).
+
+run_subprocess used subprocess.run without a timeout and buffered all
+output with capture_output, so one pathological PDF could hang Phase 3
+forever; large files were run one at a time outside the pool to contain
+that. Here every tool call is bounded.
+
+Design goals:
+- Timeouts scale with the document: base + per-page seconds, capped
+  (DOCPROCESS_SUBPROCESS_BASE_TIMEOUT, DOCPROCESS_SUBPROCESS_MAX_TIMEOUT;
+  per-page seconds are chosen by the caller per tool).
+- Clean cancellation: the tool runs in its own process group/session, so a
+  timeout terminates it together with its children (tesseract, gs
+  workers): SIGTERM, then SIGKILL after a grace period. On Windows the
+  process tree is killed with taskkill /T.
+- Opt-in resource caps via resource.prlimit on the started tool (Linux;
+  children it forks afterwards inherit them): address space
+  (DOCPROCESS_SUBPROCESS_MEMORY_MB) and CPU seconds
+  (DOCPROCESS_SUBPROCESS_CPU_S). Both default to no cap: RLIMIT_AS bounds
+  virtual address space, not resident memory, and ocrmypdf (Python,
+  pikepdf, worker threads) reserves far more than it touches, so a
+  RAM-derived default failed healthy calls on small hosts and containers.
+  Limits apply per process; for a real memory bound use a cgroup
+  (container or systemd memory limit) around the whole run.
+- stdout/stderr are drained by reader threads into bounded tails, so a
+  chatty tool can neither fill a pipe and deadlock nor grow memory.
+- Callers get a SubprocessResult with timed_out set, and decide whether to
+  retry with a cheaper (degraded) profile.
+"""
+
+import collections
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Sequence
+
+BASE_TIMEOUT_ENV = 'DOCPROCESS_SUBPROCESS_BASE_TIMEOUT'
+MAX_TIMEOUT_ENV = 'DOCPROCESS_SUBPROCESS_MAX_TIMEOUT'
+MEMORY_MB_ENV = 'DOCPROCESS_SUBPROCESS_MEMORY_MB'
+CPU_S_ENV = 'DOCPROCESS_SUBPROCESS_CPU_S'
+
+DEFAULT_BASE_TIMEOUT = 120.0      # Seconds for startup and a first page
+DEFAULT_MAX_TIMEOUT = 4 * 3600.0  # Upper bound for any single tool call
+KILL_GRACE = 10.0                 # Seconds between SIGTERM and SIGKILL
+TAIL_LINES = 200                  # Lines of stdout/stderr kept per call
+
+
+@dataclass
+class SubprocessResult:
+    """Outcome of one managed tool call."""
+    returncode: Optional[int]
+    stdout: str = ''
+    stderr: str = ''
+    timed_out: bool = False
+    elapsed_s: float = 0.0
+    timeout_s: float = 0.0
+    error: Optional[str] = None       # Could not start (missing executable, ...)
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out
+
+    @property
+    def message(self) -> str:
+        """Short failure description for logs."""
+        if self.timed_out:
+            return f"timed out after {self.timeout_s:.0f}s (killed)"
+        if self.error:
+            return self.error
+        return self.stderr.strip() or self.stdout.strip() or f"exit code {self.returncode}"
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+def timeout_for(pages: int, per_page_s: float, base_s: Optional[float] = None) -> float:
+    """Wall-clock budget for a tool call over `pages` pages."""
+    base_s = _env_float(BASE_TIMEOUT_ENV, DEFAULT_BASE_TIMEOUT) if base_s is None else base_s
+    return min(base_s + max(pages, 1) * per_page_s, _env_float(MAX_TIMEOUT_ENV, DEFAULT_MAX_TIMEOUT))
+
+
+def memory_limit_mb() -> int:
+    """Address-space cap per tool process in MB from DOCPROCESS_SUBPROCESS_MEMORY_MB; 0 (default) = none."""
+    value = os.environ.get(MEMORY_MB_ENV)
+    return max(0, int(value)) if value else 0
+
+
+def _apply_limits(pid: int, memory_mb: int, cpu_s: int) -> None:
+    """Cap a started child's address space and CPU time (Linux prlimit; no-op elsewhere).
+
+    Set from the parent right after the start instead of a preexec_fn, which
+    is unsafe in a process that runs threads. This races with the tool:
+    anything it allocates or forks before prlimit lands (typically the first
+    milliseconds of interpreter startup) is not capped, and children already
+    forked keep their own unlimited values.
+    """
+    try:
+        import resource
+        prlimit = resource.prlimit
+    except (ImportError, AttributeError):
+        return
+    try:
+        if memory_mb > 0:
+            limit = memory_mb * 1024 * 1024
+            prlimit(pid, resource.RLIMIT_AS, (limit, limit))
+        if cpu_s > 0:
+            prlimit(pid, resource.RLIMIT_CPU, (cpu_s, cpu_s + 5))
+    except (OSError, ValueError):
+        # Already exited, or a limit below current usage
+        pass
+
+
+def _drain(stream, tail: Deque[str]) -> None:
+    try:
+        for line in iter(stream.readline, ''):
+            tail.append(line)
+    except (OSError, ValueError):
+        pass
+    finally:
+        stream.close()
+
+
+def _kill_tree(process: subprocess.Popen) -> None:
+    """Terminate the tool and its children, escalating to a hard kill."""
+    if sys.platform == 'win32':
+        subprocess.run(['taskkill', '/T', '/F', '/PID', str(process.pid)],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=KILL_GRACE)
+    except ProcessLookupError:
+        return
+    except subprocess.TimeoutExpired:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+def run_managed(command: Sequence[str], timeout: Optional[float] = None,
+                env: Optional[Dict[str, str]] = None) -> SubprocessResult:
+    """Run command with a wall-clock timeout, process-group kill, rlimits and streamed output."""
+    command = [str(c) for c in command]
+    timeout = timeout or _env_float(MAX_TIMEOUT_ENV, DEFAULT_MAX_TIMEOUT)
+    kwargs = dict(stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL,
+                  text=True, encoding='utf-8', errors='replace', env=env)
+    if sys.platform == 'win32':
+        kwargs['creationflags'] = subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs['start_new_session'] = True
+
+    started = time.perf_counter()
+    try:
+        process = subprocess.Popen(command, **kwargs)
+    except OSError as e:
+        # Executable missing or not runnable
+        return SubprocessResult(returncode=None, error=str(e), timeout_s=timeout)
+    _apply_limits(process.pid, memory_limit_mb(), int(_env_float(CPU_S_ENV, 0)))
+
+    stdout: Deque[str] = collections.deque(maxlen=TAIL_LINES)
+    stderr: Deque[str] = collections.deque(maxlen=TAIL_LINES)
+    readers: List[threading.Thread] = [
+        threading.Thread(target=_drain, args=(process.stdout, stdout), daemon=True),
+        threading.Thread(target=_drain, args=(process.stderr, stderr), daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+
+    timed_out = False
+    try:
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        timed_out = True
+        _kill_tree(process)
+        process.wait()
+    except BaseException:
+        # Interrupted (e.g. KeyboardInterrupt): never leave the tool running
+        _kill_tree(process)
+        raise
+    finally:
+        for reader in readers:
+            reader.join(timeout=KILL_GRACE)
+
+    return SubprocessResult(returncode=process.returncode, stdout=''.join(stdout), stderr=''.join(stderr),
+                            timed_out=timed_out, elapsed_s=time.perf_counter() - started, timeout_s=timeout)
@@ -0,0 +1,164 @@
+"""
+docprocess_tesseract.py
+
+Native Tesseract engine for the Phase 3 preprocessing fallback.
+
+When fast OCR fails or finds almost no text, Phase 3 renders every page
+with PIL (grayscale, contrast, underline removal). The fallback then
+wrapped those rasters in a _preprocessed.pdf for ocrmypdf --force-ocr
+--oversample 600, which rasterized every page a second time, upsampled it,
+ran Tesseract and rebuilt the PDF. Here the preprocessed page images go
+straight to Tesseract.
+
+Design goals:
+- One rasterization per page: the preprocessed PNG is the Tesseract input
+  (tesseract CLI, text-only PDF output via textonly_pdf=1), with the render
+  resolution passed as --dpi so the layer has the page's real size.
+- Parallel per page: pages are submitted as they are preprocessed, to as
+  many concurrent Tesseract processes as the caller's core grant allows
+  (each single-threaded, OMP_THREAD_LIMIT=1), so preprocessing overlaps OCR.
+- The invisible text layers are merged onto the pages with fitz
+  (show_pdf_page), respecting page rotation.
+- Bounded like every other tool call: per-page timeouts, process-group
+  kill and resource caps through docprocess_subprocess. If any page fails
+  the caller falls back to ocrmypdf.
+- DOCPROCESS_OCR_LANG selects the Tesseract language(s) (default 'eng').
+- Overlay output (DOCPROCESS_OCR_OUTPUT='overlay', default): the enhanced
+  rasters are only OCR input. The ocrmypdf fallback's output is reduced to
+  its text layer (images dropped) and overlaid the same way, so no fallback
+  path replaces a page with its grayscale raster. 'raster' keeps the
+  previous output: the preprocessed page images with the text layer.
+- No doubled text: in a mixed file the original pages that already carry
+  text (at least TEXT_PAGE_CHARS characters, the fast-OCR quality bar) get
+  no overlay, as with ocrmypdf --skip-text. Raster pages have no text of
+  their own, so every one gets its layer.
+"""
+
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+from docprocess_cpubudget import tool_env
+from docprocess_subprocess import run_managed, timeout_for
+from docprocess_tracing import span
+
+OCR_LANG_ENV = 'DOCPROCESS_OCR_LANG'
+DEFAULT_OCR_LANG = 'eng'
+SECONDS_PER_PAGE = 60.0     # One page at the fallback render resolution
+TEXT_PAGE_CHARS = 100       # Existing text that makes an original page skip the overlay
+
+OCR_OUTPUT_ENV = 'DOCPROCESS_OCR_OUTPUT'
+OVERLAY = 'overlay'         # Original pages + invisible OCR text
+RASTER = 'raster'           # Preprocessed page images + invisible OCR text
+OUTPUT_MODES = (OVERLAY, RASTER)
+
+_TESSERACT_WINDOWS = Path('C:\\Program Files\\Tesseract-OCR\\tesseract.exe')
+
+
+def resolve_tesseract() -> Optional[str]:
+    """Return the tesseract executable (PATH first, then the Windows installer location), or None."""
+    found = shutil.which('tesseract')
+    if found:
+        return found
+    if _TESSERACT_WINDOWS.exists():
+        return str(_TESSERACT_WINDOWS)
+    return None
+
+
+def ocr_language() -> str:
+    return os.environ.get(OCR_LANG_ENV) or DEFAULT_OCR_LANG
+
+
+def ocr_output_mode() -> str:
+    value = (os.environ.get(OCR_OUTPUT_ENV) or OVERLAY).strip().lower()
+    if value not in OUTPUT_MODES:
+        raise ValueError(f"{OCR_OUTPUT_ENV} must be one of {', '.join(OUTPUT_MODES)}, got {value!r}")
+    return value
+
+
+def ocr_image(tesseract: str, image_path: Path, dpi: int) -> Tuple[Optional[Path], str]:
+    """Text-only PDF for one page image: (layer path, '') or (None, error)."""
+    output_base = image_path.with_suffix('')
+    command = [tesseract, str(image_path), str(output_base), '-l', ocr_language(), '--dpi', str(dpi),
+               '-c', 'textonly_pdf=1', 'pdf']
+    with span('subprocess', tool='tesseract', argv=' '.join(command)) as sp:
+        result = run_managed(command, timeout_for(1, SECONDS_PER_PAGE), tool_env())
+        sp.set_attributes(exit_code=result.returncode, timed_out=result.timed_out)
+    layer = output_base.with_suffix('.pdf')
+    if not (result.ok and layer.exists()):
+        return None, result.message
+    return layer, ''
+
+
+def ocr_pages(tesseract: str, images: Iterable[Tuple[int, Path]], dpi: int,
+              jobs: int) -> Tuple[Dict[int, Path], Dict[int, str]]:
+    """OCR (page index, image path) pairs on `jobs` concurrent Tesseract processes.
+
+    images may be a generator that preprocesses pages lazily: each page is
+    submitted as soon as it is produced. Returns (layers, errors) by page index.
+    """
+    layers: Dict[int, Path] = {}
+    errors: Dict[int, str] = {}
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = {index: executor.submit(ocr_image, tesseract, path, dpi) for index, path in images}
+        for index, future in futures.items():
+            layer, error = future.result()
+            if layer:
+                layers[index] = layer
+            else:
+                errors[index] = error
+    return layers, errors
+
+
+def has_text(page) -> bool:
+    """True if page already has a text layer worth keeping (no OCR overlay needed)."""
+    return len(page.get_text().strip()) >= TEXT_PAGE_CHARS
+
+
+def _overlay_page(page, layer, pno: int) -> None:
+    """Place page pno of layer (display orientation) over page, turned with the page's rotation."""
+    page.show_pdf_page(page.rect * page.derotation_matrix, layer, pno, rotate=page.rotation)
+
+
+def overlay_text_layers(doc, layers: Dict[int, Path]) -> int:
+    """Merge text-only PDFs onto the pages of doc (page index -> layer PDF), in place.
+
+    Layers are in display orientation (rendered pages), so they are placed
+    on the unrotated page rect and turned with the page. Pages that already
+    have text are skipped. Returns the number of pages overlaid.
+    """
+    overlaid = 0
+    for index, layer_path in sorted(layers.items()):
+        if has_text(doc[index]):
+            continue
+        with fitz.open(str(layer_path)) as layer:
+            _overlay_page(doc[index], layer, 0)
+        overlaid += 1
+    return overlaid
+
+
+def overlay_ocr_pdf(doc, ocr_path) -> int:
+    """Merge the text layer of an OCR'd copy of doc's rendered pages onto doc, in place.
+
+    ocr_path has one page per page of doc (e.g. ocrmypdf output for the
+    preprocessed rasters); its images are dropped so only the invisible
+    text is added. Pages that already have text are skipped. Returns the
+    number of pages overlaid.
+    """
+    with fitz.open(str(ocr_path)) as ocr:
+        if ocr.page_count != doc.page_count:
+            raise ValueError(f"OCR output has {ocr.page_count} pages, expected {doc.page_count}")
+        targets = [index for index in range(doc.page_count) if not has_text(doc[index])]
+        for index in targets:
+            # Remove the page images, keep the text
+            page = ocr[index]
+            page.add_redact_annot(page.rect)
+            page.apply_redactions(images=fitz.PDF_REDACT_IMAGE_REMOVE, graphics=fitz.PDF_REDACT_LINE_ART_NONE,
+                                  text=fitz.PDF_REDACT_TEXT_NONE)
+        for index in targets:
+            _overlay_page(doc[index], ocr, index)
+    return len(targets)
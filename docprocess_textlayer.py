@@ -0,0 +1,142 @@
+"""
+docprocess_textlayer.py
+
+Local text-layer extraction for Phase 4 (convert).
+
+Phase 3 leaves a searchable _o.pdf: born-digital pages keep their original
+text and scanned pages carry an ocrmypdf/Tesseract layer. Sending every page
+of that file to Google Vision repeats work that is often already good enough.
+This module decides, page by page, whether the embedded text can be used
+as-is.
+
+Extraction modes (--extract-mode / DOCPROCESS_EXTRACT_MODE):
+- 'vision' (default): every page goes to Google Vision (v31 behaviour).
+- 'local-textlayer': every page is read from the text layer; no Vision calls.
+- 'auto': pages whose text layer passes the quality checks are read locally;
+  only weak pages (image-only, sparse or garbled OCR) go to Vision.
+
+Design goals:
+- Cheap: one pass over the open PyMuPDF document, plain-Python scoring, no
+  dictionary files or language models.
+- Conservative: a page is used locally only if it has enough text
+  (density), most tokens look like words, and a fair share are common
+  English or legal vocabulary. Anything doubtful goes to Vision.
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from typing import List, Tuple
+
+EXTRACT_MODE_ENV = 'DOCPROCESS_EXTRACT_MODE'
+EXTRACT_MODES = ('vision', 'local-textlayer', 'auto')
+
+# Quality thresholds for using a page's text layer without Vision
+MIN_CHARS = 200               # Non-whitespace characters on the page
+MIN_TOKENS = 30
+MIN_ALPHA_RATIO = 0.60        # Letters / non-whitespace characters
+MIN_WORDLIKE_RATIO = 0.75     # Tokens shaped like words / all tokens
+MIN_DICTIONARY_RATIO = 0.20   # Tokens in COMMON_WORDS / word tokens
+
+COMMON_WORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have having
+he her here hers him his how i if in into is it its itself just may me more most must my no nor not now of
+off on once only or other our ours out over own same she shall should so some such than that the their
+theirs them then there these they this those through to too under until up upon very was we were what when
+where which while who whom why will with within without would you your yours one two three four five six
+seven eight nine ten first second third new made make said see time day days year years date dated number
+page pages name names state states county city united district circuit court courts case cases cause
+plaintiff plaintiffs defendant defendants petitioner respondent appellant appellee party parties counsel
+attorney attorneys law legal judge honorable clerk motion motions order orders ordered hearing hearings
+discovery appraisal insurance insured insurer policy claim claims damages exhibit exhibits pursuant section
+statute statutes filed file filing served service respectfully request requests requested judgment evidence
+record records testimony witness witnesses agreement contract notice complaint answer response reply
+counterclaim dismiss dismissed granted denied trial jury verdict appeal rule rules civil procedure
+certificate certify certifies hereby herein thereof therein whereas sworn affidavit deposition transcript
+property loss payment amount amounts paid pay company inc llc corporation florida texas california
+""".split())
+
+_TOKEN_RE = re.compile(r"\S+")
+_WORD_RE = re.compile(r"[A-Za-z][a-z]*(?:['’][a-z]+)?|[A-Z]+")
+_STRIP_PUNCT = "\"'()[]{}<>.,;:!?“”‘’-—–*"
+_VOWELS = set("aeiouyAEIOUY")
+
+
+@dataclass
+class PageQuality:
+    """Scores for one page's embedded text."""
+    chars: int = 0
+    tokens: int = 0
+    alpha_ratio: float = 0.0
+    wordlike_ratio: float = 0.0
+    dictionary_ratio: float = 0.0
+    ok: bool = False
+
+
+def resolve_extract_mode(mode: str = None) -> str:
+    """Return a valid extraction mode (argument, then $DOCPROCESS_EXTRACT_MODE, then 'vision')."""
+    mode = (mode or os.environ.get(EXTRACT_MODE_ENV) or 'vision').lower()
+    if mode not in EXTRACT_MODES:
+        raise ValueError(f"Unknown extract mode '{mode}' (expected one of: {', '.join(EXTRACT_MODES)})")
+    return mode
+
+
+def page_quality(text: str) -> PageQuality:
+    """Score a page's text layer for density and dictionary-word quality."""
+    q = PageQuality()
+    compact = "".join(text.split())
+    q.chars = len(compact)
+    if q.chars < MIN_CHARS:
+        return q
+    tokens = _TOKEN_RE.findall(text)
+    q.tokens = len(tokens)
+    if q.tokens < MIN_TOKENS:
+        return q
+    q.alpha_ratio = sum(c.isalpha() for c in compact) / q.chars
+
+    wordlike = 0
+    words = 0
+    known = 0
+    for token in tokens:
+        core = token.strip(_STRIP_PUNCT)
+        if not core:
+            continue
+        if core.replace(',', '').replace('.', '').replace('/', '').replace('$', '').isdigit():
+            # Numbers, dates, amounts, section references are legitimate tokens
+            wordlike += 1
+            continue
+        if _WORD_RE.fullmatch(core) and (len(core) <= 3 or _VOWELS.intersection(core)) and len(core) <= 25:
+            wordlike += 1
+            words += 1
+            if core.lower() in COMMON_WORDS:
+                known += 1
+    q.wordlike_ratio = wordlike / q.tokens
+    q.dictionary_ratio = known / words if words else 0.0
+    q.ok = (q.alpha_ratio >= MIN_ALPHA_RATIO
+            and q.wordlike_ratio >= MIN_WORDLIKE_RATIO
+            and q.dictionary_ratio >= MIN_DICTIONARY_RATIO)
+    return q
+
+
+def plan_pages(doc, mode: str) -> Tuple[List[int], List[int]]:
+    """Split the pages of an open PyMuPDF document between local extraction and Vision.
+
+    Returns (local_pages, vision_pages) as 1-based page numbers. Page text
+    is scored and dropped, so memory does not grow with document length;
+    callers re-read local pages with doc[n - 1].get_text() when writing.
+    """
+    if mode == 'vision':
+        return [], list(range(1, doc.page_count + 1))
+    local, weak = [], []
+    for n, page in enumerate(doc, 1):
+        text = page.get_text()
+        if mode == 'local-textlayer':
+            # Pages without a text layer are dropped, like empty Vision pages
+            if text.strip():
+                local.append(n)
+        elif page_quality(text).ok:
+            local.append(n)
+        else:
+            weak.append(n)
+    return local, weak
@@ -0,0 +1,317 @@
+"""
+docprocess_tracing.py
+
+Optional OpenTelemetry-compatible tracing spans for doc-process-v31.
+
+Follows one document through the phases and their external calls
+(ocrmypdf / Ghostscript subprocesses, Vision batch_annotate_files, Gemini
+generate_content, GCS uploads), including calls made in process-pool workers.
+
+Design goals:
+- Free when disabled: span() returns a shared no-op context manager after a
+  single global check; no ids, clocks or attribute dicts are created.
+- No opentelemetry dependency. Spans are exported as OTLP/JSON, either
+  appended to a local .jsonl file (one ExportTraceServiceRequest per line,
+  the OpenTelemetry Collector file format) or POSTed to an OTLP/HTTP
+  collector such as http://localhost:4318/v1/traces.
+- One trace per document per run: the trace id is derived from a run id and
+  the document's base name, so spans recorded in different processes and
+  phases line up without propagating context, and a rerun of the same
+  document gets a trace of its own. Nested spans in a thread get parent
+  ids from a thread-local stack.
+- Never on the critical path: OTLP/HTTP posts run on a background thread
+  per process, drained (for at most EXPORT_DRAIN_S) at exit. The first
+  failed post turns OTLP export off for that process, so a slow or absent
+  collector costs one timeout, not one per document.
+- Configuration travels to spawned workers through environment variables
+  (DOCPROCESS_TRACE_FILE, DOCPROCESS_OTLP_ENDPOINT, DOCPROCESS_TRACE_RUN_ID).
+"""
+
+import atexit
+import hashlib
+import json
+import multiprocessing.util
+import os
+import queue
+import threading
+import time
+import urllib.request
+from typing import Dict, List, Optional
+
+TRACE_FILE_ENV = 'DOCPROCESS_TRACE_FILE'
+OTLP_ENDPOINT_ENV = 'DOCPROCESS_OTLP_ENDPOINT'
+RUN_ID_ENV = 'DOCPROCESS_TRACE_RUN_ID'
+DEFAULT_OTLP_ENDPOINT = 'http://localhost:4318/v1/traces'
+SERVICE_NAME = 'doc-process-v31'
+EXPORT_TIMEOUT_S = 5        # One OTLP/HTTP post
+EXPORT_DRAIN_S = 10         # Waiting for queued posts at exit
+
+_STATUS_OK = 1
+_STATUS_ERROR = 2
+_SPAN_KIND_INTERNAL = 1
+
+_enabled = False
+_trace_file: Optional[str] = None
+_otlp_endpoint: Optional[str] = None
+_buffer: List[dict] = []
+_buffer_lock = threading.Lock()
+_local = threading.local()
+_export_warned = False
+_run_id = ''
+_otlp_failed = False
+_exporter: Optional[threading.Thread] = None
+_exporter_pid: Optional[int] = None
+_export_queue: "queue.Queue" = queue.Queue()
+
+
+class _NoopSpan:
+    """Returned by span() when tracing is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, **attributes):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def _random_hex(nbytes: int) -> str:
+    return os.urandom(nbytes).hex()
+
+
+def document_trace_id(document: str) -> str:
+    """128-bit trace id for a document base name, the same in every process of this run."""
+    return hashlib.sha256(f"{_run_id}:{document}".encode('utf-8')).hexdigest()[:32]
+
+
+def _stack() -> list:
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+class Span:
+    """A single timed operation; use through span()."""
+
+    def __init__(self, name: str, document: Optional[str], attributes: Dict):
+        self.name = name
+        self.attributes = attributes
+        self.parent: Optional[Span] = None
+        self.document = document
+        self.trace_id = ''
+        self.span_id = _random_hex(8)
+        self.start_ns = 0
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        stack = _stack()
+        self.parent = stack[-1] if stack else None
+        if self.document:
+            self.trace_id = document_trace_id(self.document)
+            # A document span under a different document's span starts its own tree
+            if self.parent is not None and self.parent.trace_id != self.trace_id:
+                self.parent = None
+        elif self.parent is not None:
+            self.trace_id = self.parent.trace_id
+            self.document = self.parent.document
+        else:
+            self.trace_id = _random_hex(16)
+        if self.document:
+            self.attributes.setdefault('document', self.document)
+        stack.append(self)
+        self.start_ns = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end_ns = time.time_ns()
+        stack = _stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        _buffer_span(self._to_otlp(end_ns))
+        if not stack:
+            flush()
+        return False
+
+    def _to_otlp(self, end_ns: int) -> dict:
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': _SPAN_KIND_INTERNAL,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(end_ns),
+            'attributes': [_otlp_attribute(k, v) for k, v in self.attributes.items() if v is not None],
+            'status': {'code': _STATUS_ERROR, 'message': self.error} if self.error else {'code': _STATUS_OK},
+        }
+        if self.parent is not None:
+            span['parentSpanId'] = self.parent.span_id
+        return span
+
+
+def _otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        typed = {'boolValue': value}
+    elif isinstance(value, int):
+        typed = {'intValue': str(value)}
+    elif isinstance(value, float):
+        typed = {'doubleValue': value}
+    else:
+        typed = {'stringValue': str(value)}
+    return {'key': key, 'value': typed}
+
+
+def span(name: str, document: Optional[str] = None, **attributes):
+    """Context manager for a traced operation.
+
+    document: base name of the document this work belongs to (sets the trace
+    id); nested spans inherit it. Extra keyword arguments become attributes,
+    e.g. phase='convert', page_range='6-10', bytes_in=1234.
+    """
+    if not _enabled:
+        return _NOOP_SPAN
+    return Span(name, document, attributes)
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def configure(trace_file: Optional[str] = None, otlp_endpoint: Optional[str] = None) -> None:
+    """Enable export to a JSONL file and/or an OTLP/HTTP collector.
+
+    The settings are also put in the environment so spawned worker
+    processes pick them up when they import this module.
+    """
+    global _enabled, _trace_file, _otlp_endpoint, _run_id
+    _trace_file = str(trace_file) if trace_file else None
+    _otlp_endpoint = otlp_endpoint or None
+    _enabled = bool(_trace_file or _otlp_endpoint)
+    # Workers inherit the run id, so their spans join the parent's document traces
+    _run_id = os.environ.get(RUN_ID_ENV) or _random_hex(8)
+    for env, value in ((TRACE_FILE_ENV, _trace_file), (OTLP_ENDPOINT_ENV, _otlp_endpoint),
+                       (RUN_ID_ENV, _run_id if _enabled else None)):
+        if value:
+            os.environ[env] = value
+        else:
+            os.environ.pop(env, None)
+
+
+def _buffer_span(otlp_span: dict) -> None:
+    with _buffer_lock:
+        _buffer.append(otlp_span)
+
+
+def _export_request(spans: List[dict]) -> dict:
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': [
+                _otlp_attribute('service.name', SERVICE_NAME),
+                _otlp_attribute('process.pid', os.getpid()),
+                _otlp_attribute('docprocess.run_id', _run_id),
+            ]},
+            'scopeSpans': [{'scope': {'name': 'docprocess_tracing'}, 'spans': spans}],
+        }]
+    }
+
+
+def _post(payload: str) -> None:
+    """POST one export request; the first failure turns OTLP export off for this process."""
+    global _otlp_failed
+    if _otlp_failed or not _otlp_endpoint:
+        return
+    try:
+        request = urllib.request.Request(_otlp_endpoint, data=payload.encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+        with urllib.request.urlopen(request, timeout=EXPORT_TIMEOUT_S):
+            pass
+    except Exception as e:
+        _otlp_failed = True
+        print(f"  [WARN] Trace export to {_otlp_endpoint} failed, OTLP export off for this process: {e}")
+
+
+def _export_loop(requests: "queue.Queue") -> None:
+    while True:
+        payload = requests.get()
+        if payload is None:
+            return
+        _post(payload)
+
+
+def _drain() -> None:
+    """Let queued posts finish (bounded) before this process exits."""
+    global _exporter
+    if _exporter is None or _exporter_pid != os.getpid():
+        return
+    _export_queue.put(None)
+    _exporter.join(EXPORT_DRAIN_S)
+    _exporter = None
+
+
+def _start_exporter() -> None:
+    """Background OTLP poster for this process (workers start their own after fork)."""
+    global _exporter, _exporter_pid, _export_queue
+    if _exporter is not None and _exporter_pid == os.getpid():
+        return
+    _export_queue = queue.Queue()
+    _exporter_pid = os.getpid()
+    _exporter = threading.Thread(target=_export_loop, args=(_export_queue,), name='trace-export', daemon=True)
+    _exporter.start()
+    # atexit for the main process; multiprocessing finalizers for pool workers, which skip atexit
+    atexit.register(_drain)
+    multiprocessing.util.Finalize(None, _drain, exitpriority=10)
+
+
+def flush() -> None:
+    """Export buffered spans. Called automatically when a root span ends.
+
+    The file is appended to right away; OTLP posts are queued for the
+    background exporter.
+    """
+    global _export_warned
+    if not _enabled:
+        return
+    with _buffer_lock:
+        spans = list(_buffer)
+        _buffer.clear()
+    if not spans:
+        return
+    payload = json.dumps(_export_request(spans), separators=(',', ':'))
+    if _trace_file:
+        try:
+            # One O_APPEND write per batch so lines from concurrent workers do not interleave
+            fd = os.open(_trace_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, (payload + "\n").encode('utf-8'))
+            finally:
+                os.close(fd)
+        except Exception as e:
+            # Tracing must never break processing; warn once per process
+            if not _export_warned:
+                _export_warned = True
+                print(f"  [WARN] Trace export failed: {e}")
+    if _otlp_endpoint and not _otlp_failed:
+        with _buffer_lock:
+            _start_exporter()
+        _export_queue.put(payload)
+
+
+# Workers (and any process started with the variables set) trace automatically
+if os.environ.get(TRACE_FILE_ENV) or os.environ.get(OTLP_ENDPOINT_ENV):
+    configure(os.environ.get(TRACE_FILE_ENV), os.environ.get(OTLP_ENDPOINT_ENV))
@@ -0,0 +1,510 @@
+"""
+docprocess_workers.py
+
+Process-pool entry points for doc-process-v31.
+
+Phase 3 runs its per-file work in a ProcessPoolExecutor, and Phase 2 reads
+first-page excerpts the same way. Under the spawn start method (Windows, and
+optionally Linux) every worker has to import the module that defines its
+task, so the tasks live here rather than in the 3,700-line pipeline script:
+- Only fitz, PIL and the tool runner are imported (PIL lazily, for the
+  preprocessing fallback).
+- No secrets loading, no Google SDKs, no print side effects at import.
+- Tool paths (ocrmypdf, Ghostscript, Tesseract) are resolved once per worker by
+  init_worker() instead of once per file; the same initializer hands the
+  worker the pool's shared CPU budget for ocrmypdf --jobs.
+"""
+
+import io
+import os
+import shutil
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+import fitz
+
+from docprocess_compress import plan_compression
+from docprocess_cpubudget import cpu_budget, tool_env
+from docprocess_materialize import materialize
+from docprocess_metrics import attach_metrics, measure
+from docprocess_subprocess import run_managed, timeout_for
+from docprocess_tesseract import (OVERLAY, RASTER, ocr_output_mode, ocr_pages, overlay_ocr_pdf, overlay_text_layers,
+                                  resolve_tesseract)
+from docprocess_tracing import span
+
+
+_OCRMYPDF_WINDOWS_VENV = Path('C:\\DevWorkspace\\.venv\\Scripts\\ocrmypdf.exe')
+_GHOSTSCRIPT_NAMES = ('gswin64c', 'gswin32c', 'gs')
+
+# Wall-clock budget per page (plus DOCPROCESS_SUBPROCESS_BASE_TIMEOUT) for each tool call
+OCR_SECONDS_PER_PAGE = 60.0           # ocrmypdf at 600 DPI oversample
+DEGRADED_OCR_SECONDS_PER_PAGE = 30.0
+GS_SECONDS_PER_PAGE = 10.0
+# Degraded ocrmypdf profile, used once after a timeout or a killed run
+DEGRADED_OCR_OPTIONS = {'--oversample': '300', '--optimize': '1'}
+DEGRADED_OCR_EXTRA = ['--tesseract-timeout', '120', '--skip-big', '100']
+# Preprocessing fallback: pages rendered at 3x (216 DPI) for Tesseract
+PREPROCESS_ZOOM = 3.0
+PREPROCESS_DPI = int(72 * PREPROCESS_ZOOM)
+
+# Resolved once per worker process by init_worker()
+OCRMYPDF_CMD: Optional[str] = None
+GHOSTSCRIPT_CMD: Optional[str] = None
+TESSERACT_CMD: Optional[str] = None
+CORE_BUDGET = None  # docprocess_cpubudget.CoreBudget shared by the Phase 3 pool
+
+
+@dataclass
+class ProcessingResult:
+    """Result of processing a single file"""
+    file_name: str
+    status: str  # 'OK', 'FAILED', 'SKIPPED', 'WARNING'
+    error: Optional[str] = None
+    metadata: Optional[Dict] = None
+
+
+def resolve_ocrmypdf() -> str:
+    """Return the ocrmypdf executable (PATH first, then the Windows venv)."""
+    found = shutil.which('ocrmypdf')
+    if found:
+        return found
+    return str(_OCRMYPDF_WINDOWS_VENV)
+
+
+def resolve_ghostscript() -> Optional[str]:
+    """Return the Ghostscript executable for this platform, or None."""
+    for name in _GHOSTSCRIPT_NAMES:
+        found = shutil.which(name)
+        if found:
+            return found
+    return None
+
+
+def init_worker(core_budget=None) -> None:
+    """ProcessPoolExecutor initializer: cache tool paths (and the pool's CoreBudget) for this worker."""
+    global OCRMYPDF_CMD, GHOSTSCRIPT_CMD, TESSERACT_CMD, CORE_BUDGET
+    OCRMYPDF_CMD = resolve_ocrmypdf()
+    GHOSTSCRIPT_CMD = resolve_ghostscript()
+    TESSERACT_CMD = resolve_tesseract()
+    CORE_BUDGET = core_budget
+
+
+def run_subprocess(command, timeout=None, env=None):
+    """Run a tool through the managed runner: timeout, process-group kill, resource caps.
+
+    Returns the SubprocessResult (.ok, .timed_out, .message).
+    """
+    with span('subprocess', tool=Path(command[0]).name, argv=' '.join(str(c) for c in command)) as sp:
+        result = run_managed(command, timeout, env)
+        sp.set_attributes(exit_code=result.returncode, timed_out=result.timed_out,
+                          timeout_s=round(result.timeout_s, 1))
+        if not result.ok:
+            sp.set_attribute('error', result.message[:500])
+    return result
+
+
+def _degraded_ocr_command(cmd):
+    """Same ocrmypdf call with the cheaper profile (the last two arguments are input and output)."""
+    args = list(cmd[:-2])
+    for i, arg in enumerate(args[:-1]):
+        if arg in DEGRADED_OCR_OPTIONS:
+            args[i + 1] = DEGRADED_OCR_OPTIONS[arg]
+    return args + DEGRADED_OCR_EXTRA + list(cmd[-2:])
+
+
+@contextmanager
+def ocr_jobs(pages):
+    """Cores for one ocrmypdf call: a share of the pool's CoreBudget, or up to one per page standalone."""
+    if CORE_BUDGET is None:
+        yield max(1, min(pages, cpu_budget()))
+        return
+    with CORE_BUDGET.reserve(max(1, pages)) as granted:
+        yield granted
+
+
+@contextmanager
+def tool_core(budget=None):
+    """One core for a single-threaded tool call (Ghostscript): from budget, else the pool's CoreBudget."""
+    budget = budget or CORE_BUDGET
+    if budget is None:
+        yield 1
+        return
+    with budget.reserve(1) as granted:
+        yield granted
+
+
+def _with_jobs(cmd, jobs):
+    """Insert --jobs before the input and output arguments."""
+    return list(cmd[:-2]) + ['--jobs', str(jobs)] + list(cmd[-2:])
+
+
+def run_ocr(cmd, pages):
+    """Run ocrmypdf with --jobs from the core budget and a page-scaled timeout;
+    on a timeout or a kill, retry once degraded."""
+    with ocr_jobs(pages) as jobs:
+        result = run_subprocess(_with_jobs(cmd, jobs), timeout_for(pages, OCR_SECONDS_PER_PAGE), tool_env())
+        if result.timed_out or (result.returncode or 0) < 0:
+            print(f"  [WARN] ocrmypdf {result.message} - retrying with degraded profile "
+                  f"(oversample {DEGRADED_OCR_OPTIONS['--oversample']} DPI, per-page tesseract timeout)")
+            Path(cmd[-1]).unlink(missing_ok=True)
+            result = run_subprocess(_with_jobs(_degraded_ocr_command(cmd), jobs),
+                                    timeout_for(pages, DEGRADED_OCR_SECONDS_PER_PAGE), tool_env())
+    return result
+
+
+def _new_file(path: Path) -> str:
+    """path as a write target. An existing file there may be a hardlink or reflink of a stage
+    file (docprocess_materialize), so it is unlinked rather than written through."""
+    path.unlink(missing_ok=True)
+    return str(path)
+
+
+def process_clean_pdf(pdf_path, clean_dir, compress=True):
+    """Process a single PDF for Phase 3 (Clean). Runs in parallel worker process.
+
+    The output is built as <base>_o_temp.pdf and renamed to <base>_o.pdf only
+    once complete, so a crash never leaves a truncated _o.pdf behind. With
+    compress=False the Ghostscript pass is left to the caller (see _clean_pdf).
+    """
+    if OCRMYPDF_CMD is None:
+        # Called directly (sequential path) rather than through the pool initializer
+        init_worker()
+
+    base_name = pdf_path.stem[:-2]  # Remove _r
+    output_path = clean_dir / f"{base_name}_o.pdf"
+    work_path = clean_dir / f"{base_name}_o_temp.pdf"
+    # A crash after materialize() can leave _o_temp.pdf linked to _r.pdf: never write into it
+    work_path.unlink(missing_ok=True)
+
+    with measure(include_children=True) as m, \
+            span('clean', document=base_name, phase='clean', file=pdf_path.name) as sp:
+        m.add(bytes_in=pdf_path.stat().st_size)
+        result = _clean_pdf(pdf_path, clean_dir, base_name, work_path, compress)
+        try:
+            if result.status in ('OK', 'PARTIAL', 'COPIED') and work_path.exists():
+                os.replace(work_path, output_path)
+                result.file_name = output_path.name
+                m.add(bytes_out=output_path.stat().st_size, pages=_page_count(output_path))
+            elif work_path.exists():
+                work_path.unlink()
+        except OSError as e:
+            result = ProcessingResult(file_name=pdf_path.name, status='FAILED', error=f"Could not finalize output: {e}")
+        sp.set_attributes(status=result.status, bytes_in=m.bytes_in, bytes_out=m.bytes_out, pages=m.pages)
+    return attach_metrics(result, m)
+
+
+def extract_first_page_text(pdf_path):
+    """Return the first page's text for Phase 2 metadata extraction. Runs in parallel worker process."""
+    try:
+        with fitz.open(str(pdf_path)) as doc:
+            text = doc[0].get_text() if doc.page_count else ''
+        return ProcessingResult(file_name=Path(pdf_path).name, status='OK', metadata={'text': text})
+    except Exception as e:
+        return ProcessingResult(file_name=Path(pdf_path).name, status='FAILED', error=str(e))
+
+
+def _page_count(pdf_path) -> int:
+    try:
+        with fitz.open(str(pdf_path)) as doc:
+            return doc.page_count
+    except Exception:
+        return 0
+
+
+def compress_pdf(pdf_path, compressed_path, plan=None, budget=None):
+    """Ghostscript /ebook pass over pdf_path, in place, if the compression planner expects it to pay off.
+
+    The result is kept only if it is more than 10% smaller. compressed_path
+    is the scratch output; it never outlives the call. Ghostscript holds one
+    core of budget (default: the pool's CoreBudget) while it runs.
+    """
+    pdf_path = Path(pdf_path)
+    try:
+        plan = plan or plan_compression(pdf_path)
+        if not plan.worthwhile:
+            print(f"  -> Skipping Ghostscript: {plan.reason}")
+            return ProcessingResult(file_name=pdf_path.name, status='OK')
+        gs = GHOSTSCRIPT_CMD or resolve_ghostscript()
+        if not gs:
+            print(f"  -> Ghostscript not found, keeping original")
+            return ProcessingResult(file_name=pdf_path.name, status='OK')
+
+        original_size = pdf_path.stat().st_size
+        compress_cmd = [
+            gs, '-sDEVICE=pdfwrite', '-dCompatibilityLevel=1.4',
+            '-dPDFSETTINGS=/ebook', '-dNOPAUSE', '-dQUIET', '-dBATCH',
+            f'-sOutputFile={compressed_path}', str(pdf_path)
+        ]
+
+        with tool_core(budget):
+            run = run_subprocess(compress_cmd, timeout_for(plan.pages, GS_SECONDS_PER_PAGE))
+        if not (run.ok and compressed_path.exists()):
+            print(f"  -> Compression failed ({run.message[:200]}), keeping original")
+            return ProcessingResult(file_name=pdf_path.name, status='OK')
+
+        compressed_size = compressed_path.stat().st_size
+        reduction = ((original_size - compressed_size) / original_size) * 100
+
+        # Only use compressed version if it's significantly smaller (>10% reduction)
+        if reduction > 10:
+            print(f"  -> Compressed {original_size:,} -> {compressed_size:,} bytes ({reduction:.1f}% reduction, "
+                  f"predicted {plan.estimated_saving:.0%})")
+            compressed_path.replace(pdf_path)
+            return ProcessingResult(
+                file_name=pdf_path.name,
+                status='OK',
+                metadata={'compression': f"{original_size:,} -> {compressed_size:,} bytes ({reduction:.1f}% reduction)"}
+            )
+        print(f"  -> Compression only {reduction:.1f}% (predicted {plan.estimated_saving:.0%}), keeping original size")
+        return ProcessingResult(file_name=pdf_path.name, status='OK')
+
+    except Exception as e:
+        if pdf_path.exists():
+            return ProcessingResult(file_name=pdf_path.name, status='PARTIAL', error=f"Compression failed: {e}")
+        return ProcessingResult(file_name=pdf_path.name, status='FAILED', error=f"No output file created: {e}")
+    finally:
+        if compressed_path.exists():
+            try:
+                compressed_path.unlink()
+            except OSError:
+                pass
+
+
+def _preprocess_page(page, image_path):
+    """Render a page for the OCR fallback: grayscale, contrast, underlines removed; saved as PNG."""
+    from PIL import Image, ImageEnhance
+
+    # Render at high resolution for OCR
+    mat = fitz.Matrix(PREPROCESS_ZOOM, PREPROCESS_ZOOM)
+    pix = page.get_pixmap(matrix=mat, alpha=False)
+
+    # Convert to PIL Image
+    img_data = pix.tobytes("png")
+    img = Image.open(io.BytesIO(img_data))
+
+    # Enhance for OCR: grayscale + contrast + remove horizontal lines
+    img_gray = img.convert('L')
+    enhancer = ImageEnhance.Contrast(img_gray)
+    img_enhanced = enhancer.enhance(2.0)
+
+    # Remove horizontal lines (underlines)
+    width, height = img_enhanced.size
+    pixel_data = img_enhanced.load()
+
+    if pixel_data is not None:
+        for y in range(height):
+            line_length = 0
+            for x in range(width):
+                pixel_val = pixel_data[x, y]
+                if isinstance(pixel_val, (int, float)) and pixel_val < 128:
+                    line_length += 1
+                else:
+                    if line_length > width * 0.3:  # Long horizontal line
+                        for xx in range(x - line_length, x):
+                            if 0 <= xx < width:
+                                pixel_data[xx, y] = 255
+                    line_length = 0
+
+    img_enhanced.save(str(image_path), dpi=(PREPROCESS_DPI, PREPROCESS_DPI))
+
+
+_PAGE_KIND = {OVERLAY: 'original', RASTER: 'preprocessed'}
+
+
+@contextmanager
+def _output_pages(pdf_path, images, mode):
+    """Pages the OCR text goes onto: the original PDF (overlay) or the preprocessed images (raster)."""
+    if mode == OVERLAY:
+        doc = fitz.open(str(pdf_path))
+    else:
+        doc = fitz.open()
+        for img_path in images:
+            pix = fitz.Pixmap(str(img_path))
+            # Images rendered at PREPROCESS_ZOOM, convert to PDF points
+            page = doc.new_page(width=pix.width / PREPROCESS_ZOOM, height=pix.height / PREPROCESS_ZOOM)
+            pix = None
+            # Insert image to fill the page
+            page.insert_image(page.rect, filename=str(img_path))
+    try:
+        yield doc
+    finally:
+        doc.close()
+
+
+def _clean_pdf(pdf_path, clean_dir, base_name, output_path, compress=True):
+    """OCR + compress pdf_path into output_path (a temp path owned by the caller).
+
+    With compress=False the Ghostscript pass is left to the caller; the
+    result's metadata has compress=True when the planner expects it to pay off.
+    Every write to output_path goes through _new_file(), since the
+    materialize() fallback makes it a link of pdf_path.
+    """
+    temp_preprocessed = None
+
+    try:
+        # STEP 1: Try fast OCR first (without preprocessing)
+        print(f"[STEP 1] Attempting fast OCR (no preprocessing)...")
+
+        # Try basic OCR first with skip-text to ignore existing text
+        cmd = [OCRMYPDF_CMD, '--skip-text', '--output-type', 'pdfa',
+               '--oversample', '600', '--optimize', '3',
+               str(pdf_path), _new_file(output_path)]
+
+        pages = _page_count(pdf_path)
+        run = run_ocr(cmd, pages)
+        success = run.ok
+
+        if not success:
+            print(f"  [WARN] Fast OCR failed ({run.message[:200]}), will try preprocessing")
+        else:
+            # Verify OCR quality based on text extraction only
+            try:
+                doc = fitz.open(str(output_path))
+                page1_text = doc[0].get_text()
+                doc.close()
+
+                # Quality check: page 1 should have meaningful text
+                good_quality = len(page1_text) > 100
+
+                if good_quality:
+                    print(f"  -> Fast OCR successful ({len(page1_text)} chars on page 1)")
+                    success = True
+                else:
+                    print(f"  [WARN] Fast OCR produced little text ({len(page1_text)} chars), trying preprocessing")
+                    success = False
+                    output_path.unlink()  # Remove poor quality output
+            except Exception as e:
+                print(f"  [WARN] Could not verify OCR quality: {e}")
+                success = False
+
+        # STEP 2: If fast OCR failed, try PIL preprocessing
+        if not success:
+            print(f"[STEP 2] Preprocessing PDF (remove underlines, enhance contrast)...")
+            mode = ocr_output_mode()
+            temp_images = []
+
+            def preprocessed_pages():
+                # Lazily, so the native engine OCRs each page while the next one is prepared
+                with fitz.open(str(pdf_path)) as doc:
+                    for page_num in range(len(doc)):
+                        temp_img = clean_dir / f"{base_name}_temp_page_{page_num + 1}.png"
+                        _preprocess_page(doc[page_num], temp_img)
+                        temp_images.append(temp_img)
+                        yield page_num, temp_img
+
+            # STEP 3: OCR the preprocessed pages with Tesseract directly (no second rasterization)
+            tesseract = TESSERACT_CMD or resolve_tesseract()
+            if tesseract:
+                print(f"[STEP 3] Running Tesseract on preprocessed pages...")
+                with ocr_jobs(pages) as jobs:
+                    layers, errors = ocr_pages(tesseract, preprocessed_pages(), PREPROCESS_DPI, jobs)
+                if not errors:
+                    with _output_pages(pdf_path, temp_images, mode) as doc:
+                        overlaid = overlay_text_layers(doc, layers)
+                        doc.save(_new_file(output_path), garbage=3, deflate=True)
+                    print(f"  -> Text layer added to {overlaid} {_PAGE_KIND[mode]} pages ({jobs} Tesseract jobs"
+                          f"{f', {len(layers) - overlaid} pages already had text' if overlaid < len(layers) else ''})")
+                    success = True
+                else:
+                    page_num, error = min(errors.items())
+                    print(f"  [WARN] Tesseract failed on {len(errors)} page(s) (page {page_num + 1}: {error[:200]}), "
+                          f"falling back to ocrmypdf")
+            else:
+                print(f"  -> Tesseract not found, using ocrmypdf")
+                for _ in preprocessed_pages():
+                    pass
+
+            if not success:
+                temp_preprocessed = clean_dir / f"{base_name}_preprocessed.pdf"
+                with _output_pages(pdf_path, temp_images, RASTER) as new_doc:
+                    new_doc.save(str(temp_preprocessed))
+
+                print(f"  -> Preprocessed {len(temp_images)} pages")
+
+                print(f"[STEP 3] Running OCR on preprocessed file...")
+
+                # Overlay mode keeps only ocrmypdf's text layer, laid over the original pages
+                ocr_path = output_path if mode == RASTER else clean_dir / f"{base_name}_ocr_layer.pdf"
+                cmd = [OCRMYPDF_CMD, '--force-ocr', '--output-type', 'pdfa',
+                       '--oversample', '600',
+                       str(temp_preprocessed), _new_file(ocr_path)]
+
+                run = run_ocr(cmd, pages)
+                success = run.ok
+
+                if success and mode == OVERLAY:
+                    try:
+                        with fitz.open(str(pdf_path)) as doc:
+                            overlaid = overlay_ocr_pdf(doc, ocr_path)
+                            doc.save(_new_file(output_path), garbage=3, deflate=True)
+                        print(f"  -> Text layer added to {overlaid} original pages"
+                              f"{f', {pages - overlaid} pages already had text' if overlaid < pages else ''}")
+                    except Exception as e:
+                        print(f"  [ERROR] Could not overlay OCR text: {e}")
+                        output_path.unlink(missing_ok=True)
+                        success = False
+                    finally:
+                        ocr_path.unlink(missing_ok=True)
+                elif not success:
+                    print(f"  [ERROR] Preprocessed OCR failed: {run.message[:200]}")
+                    if mode == RASTER:
+                        # Fallback: copy preprocessed file
+                        shutil.copy2(str(temp_preprocessed), _new_file(output_path))
+                        success = True
+
+            # Clean up temp images and Tesseract layers
+            for temp_img in temp_images:
+                for temp_file in (temp_img, temp_img.with_suffix('.pdf')):
+                    if temp_file.exists():
+                        temp_file.unlink()
+
+        # STEP FINAL: Clean up temp preprocessed file
+        if temp_preprocessed and temp_preprocessed.exists():
+            try:
+                temp_preprocessed.unlink()
+            except Exception:
+                pass  # Ignore cleanup errors
+
+        # STEP COMPRESSION: Compress PDF to reduce file size (only when the planner expects a gain)
+        step_num = 2 if success else 4  # Adjust step number based on path taken
+        print(f"[STEP {step_num}] Compressing OCR'd PDF for online access...")
+        if success or output_path.exists():
+            if not compress:
+                # Caller runs the pass itself (off this worker) if the plan says it pays off
+                try:
+                    plan = plan_compression(output_path)
+                except Exception as e:
+                    print(f"  -> Could not plan compression ({e}), keeping original")
+                    return ProcessingResult(file_name=output_path.name, status='OK')
+                if plan.worthwhile:
+                    print(f"  -> Compression deferred ({plan.reason})")
+                    return ProcessingResult(file_name=output_path.name, status='OK', metadata={'compress': True})
+                print(f"  -> Skipping Ghostscript: {plan.reason}")
+                return ProcessingResult(file_name=output_path.name, status='OK')
+            return compress_pdf(output_path, clean_dir / f"{base_name}_compressed_temp.pdf")
+        else:
+            # OCR failed, try direct copy
+            try:
+                materialize(pdf_path, output_path)
+                return ProcessingResult(file_name=output_path.name, status='COPIED')
+            except Exception as e:
+                return ProcessingResult(file_name=pdf_path.name, status='FAILED', error=str(e))
+
+    except Exception as e:
+        return ProcessingResult(file_name=pdf_path.name, status='FAILED', error=str(e))
+    finally:
+        # Always cleanup ALL temp files
+        if temp_preprocessed and temp_preprocessed.exists():
+            try:
+                temp_preprocessed.unlink()
+            except Exception:
+                pass
+        # Also cleanup temp images
+        try:
+            for temp_img in clean_dir.glob(f"{base_name}_temp_page_*"):
+                if temp_img.exists():
+                    temp_img.unlink()
+        except Exception:
+            pass
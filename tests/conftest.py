@@ -0,0 +1,22 @@
+"""Shared fixtures: the pipeline script loaded as a module on the offline fake backends."""
+
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT), str(ROOT / 'benchmarks')]
+
+
+@pytest.fixture(scope='session')
+def pipeline():
+    """doc-process-v31.py imported with DOCPROCESS_BACKEND=fake and the document index disabled."""
+    os.environ['DOCPROCESS_BACKEND'] = 'fake'
+    os.environ['DOCPROCESS_INDEX_DB'] = 'off'
+    spec = importlib.util.spec_from_file_location('doc_process_v31', ROOT / 'doc-process-v31.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
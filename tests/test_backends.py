@@ -0,0 +1,26 @@
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+
+def test_fake_backend_flag_needs_no_google_sdks():
+    env = {k: v for k, v in os.environ.items() if k != 'DOCPROCESS_BACKEND'}
+    run = subprocess.run([sys.executable, str(ROOT / 'doc-process-v31.py'), '--backend', 'fake', '--help'],
+                         capture_output=True, text=True, env=env, timeout=120)
+    assert run.returncode == 0, run.stderr
+    assert '--backend' in run.stdout
+
+
+def test_fake_formatter_echoes_document_not_prompt(pipeline):
+    body = "[BEGIN PDF Page 1]\n\nORDER   GRANTING   MOTION\n\n[BEGIN PDF Page 2]\n\nSo ordered."
+    model = pipeline.genai.GenerativeModel(pipeline.MODEL_NAME)
+    text = model.generate_content(pipeline.FORMAT_PROMPT + "\n\n" + body).text
+
+    assert text.startswith("[BEGIN PDF Page 1]")
+    assert "ORDER GRANTING MOTION" in text
+    assert "So ordered." in text
+    for instruction in pipeline.FORMAT_PROMPT.splitlines():
+        if instruction.strip() and not instruction.startswith("[BEGIN PDF Page"):
+            assert instruction not in text
@@ -0,0 +1,42 @@
+import threading
+
+from docprocess_cpubudget import DEFAULT_OCR_WORKERS, CoreBudget, ocr_workers
+
+
+def test_grant_is_capped_at_fair_share():
+    budget = CoreBudget(8, slots=3)
+    first = budget.acquire(100)           # Idle pool: still only ceil(8 / 3), not every core
+    assert first == 3
+    small = budget.acquire(2)
+    assert small == 2
+    assert budget.acquire(100) == 3       # What is left, within the share
+    budget.release(3)
+    budget.release(small)
+    budget.release(first)
+    with budget.reserve(0) as granted:    # Always at least one core
+        assert granted == 1
+    assert CoreBudget(8, slots=1).acquire(100) == 8   # A lone file gets every core
+
+
+def test_concurrent_large_files_both_get_cores():
+    budget = CoreBudget(8, slots=2)
+    grants = []
+
+    def ocr_call():
+        grants.append(budget.acquire(50))
+
+    threads = [threading.Thread(target=ocr_call) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert not any(thread.is_alive() for thread in threads), "second acquirer blocked behind the first"
+    assert grants == [4, 4]
+
+
+def test_ocr_workers_default_is_capped(monkeypatch):
+    monkeypatch.delenv('DOCPROCESS_OCR_WORKERS', raising=False)
+    assert ocr_workers(64) == DEFAULT_OCR_WORKERS
+    assert ocr_workers(2) == 2
+    monkeypatch.setenv('DOCPROCESS_OCR_WORKERS', '12')
+    assert ocr_workers(64) == 12
@@ -0,0 +1,30 @@
+import fitz
+
+from corpus import make_document
+from docprocess_dedup import document_signature, find_duplicates
+
+
+def _rescan(source, target):
+    """Same pages, different bytes (as a second scan of the same paper would be)."""
+    with fitz.open(str(source)) as doc:
+        doc.set_metadata({'producer': 'second scanner'})
+        doc.save(str(target))
+
+
+def test_visual_only_match_is_reported_not_moved(pipeline, tmp_path):
+    root = tmp_path / 'case'
+    root.mkdir()
+    pipeline.ensure_directory_structure(root)
+    original = root / '01_doc-original'
+    make_document(original / "20240101_RR_Scan_d.pdf", 'scanned', 2, 0)
+    _rescan(original / "20240101_RR_Scan_d.pdf", original / "20240101_RR_Scan-copy_d.pdf")
+
+    (pair,) = find_duplicates([document_signature(p) for p in sorted(original.glob('*_d.pdf'))])
+    assert pair.kind == 'visual'
+
+    pipeline.detect_duplicates(root)
+
+    assert len(list(original.glob('*_d.pdf'))) == 2
+    assert not list((original / '_duplicate').iterdir())
+    (match,) = pipeline.report_data['directory']['visual_matches']
+    assert match['file'] == "20240101_RR_Scan-copy_d.pdf"
@@ -0,0 +1,116 @@
+import time
+
+import pytest
+
+from docprocess_backends import fake_genai
+from docprocess_gemini import IDLE_TIMEOUT_ENV, GeminiTruncatedError, generate_with_resume
+
+PROMPT = "Format the following document."
+PAGES = 6
+
+
+def _source(pages=PAGES, chars=900):
+    return "\n\n".join(f"[BEGIN PDF Page {n}]\n\n" + f"page {n} text " * (chars // 12) for n in range(1, pages + 1))
+
+
+def _assert_complete(text, pages=PAGES):
+    for n in range(1, pages + 1):
+        assert text.count(f"[BEGIN PDF Page {n}]") == 1, f"page {n}"
+        assert f"page {n} text" in text
+
+
+class _Model:
+    """The fake Gemini model, with the first call's stream changed by `first_call`."""
+
+    def __init__(self, first_call=None):
+        self.inner = fake_genai.GenerativeModel('fake')
+        self.first_call = first_call
+        self.prompts = []
+
+    def generate_content(self, prompt, generation_config=None, stream=False, **kwargs):
+        self.prompts.append(prompt)
+        response = self.inner.generate_content(prompt, generation_config=generation_config, stream=stream)
+        if len(self.prompts) == 1 and self.first_call:
+            return self.first_call(response)
+        return response
+
+
+def _config(max_output_tokens=None):
+    return fake_genai.types.GenerationConfig(max_output_tokens=max_output_tokens)
+
+
+def test_stall_then_resume_from_last_page_marker(tmp_path, monkeypatch):
+    monkeypatch.setenv(IDLE_TIMEOUT_ENV, '0.2')
+
+    def stall_after_first_piece(chunks):
+        yield next(chunks)       # ~2 pages, the third cut mid-way
+        time.sleep(2)
+
+    model = _Model(stall_after_first_piece)
+    partial = tmp_path / "Doc_v31.txt.partial"
+    text, results = generate_with_resume(model, PROMPT, _source(), _config(), partial_path=partial)
+
+    _assert_complete(text)
+    assert results[0].error and 'stalled' in results[0].error
+    # Only the pages from the incomplete one on are sent again
+    assert "[BEGIN PDF Page 1]" not in model.prompts[1] and "[BEGIN PDF Page 3]" in model.prompts[1]
+    assert not partial.exists()
+
+
+def test_partial_file_from_a_crashed_run_is_resumed(tmp_path):
+    source = _source()
+    cut = source.index("[BEGIN PDF Page 4]") + 100     # Pages 1-3 complete, page 4 partly written
+    partial = tmp_path / "Doc_v31.txt.partial"
+    partial.write_text(source[:cut], encoding='utf-8')
+    model = _Model()
+
+    text, _ = generate_with_resume(model, PROMPT, source, _config(), partial_path=partial)
+
+    _assert_complete(text)
+    assert "[BEGIN PDF Page 3]" not in model.prompts[0] and "[BEGIN PDF Page 4]" in model.prompts[0]
+
+
+def test_max_tokens_output_is_continued(tmp_path):
+    model = _Model()
+    # ~2.5 pages of output per call
+    text, results = generate_with_resume(model, PROMPT, _source(), _config(max_output_tokens=600),
+                                         max_resumes=5)
+
+    _assert_complete(text)
+    assert results[0].finish_reason == 'MAX_TOKENS'
+    assert results[-1].finish_reason == 'STOP'
+    assert len(results) > 1
+
+
+def test_stop_with_missing_tail_pages_is_continued():
+    def drop_last_two_pages(response):
+        cut = response.text.index("[BEGIN PDF Page 5]")
+        response.text = response.text[:cut]
+        return iter([response])
+
+    model = _Model(lambda chunks: drop_last_two_pages(_join(chunks)))
+    text, results = generate_with_resume(model, PROMPT, _source(), _config())
+
+    _assert_complete(text)
+    assert [r.finish_reason for r in results] == ['STOP', 'STOP']
+    assert model.prompts[1].count("[BEGIN PDF Page") == 2        # Pages 5 and 6 only
+
+
+def test_continuations_are_limited_by_max_resumes():
+    model = _Model()
+    with pytest.raises(GeminiTruncatedError, match="after 1 continuations"):
+        generate_with_resume(model, PROMPT, _source(), _config(max_output_tokens=300), max_resumes=1)
+    assert len(model.prompts) == 2
+
+
+def test_max_tokens_before_one_complete_page_fails():
+    with pytest.raises(GeminiTruncatedError):
+        generate_with_resume(_Model(), PROMPT, _source(), _config(max_output_tokens=50))
+
+
+def _join(chunks):
+    """One non-streamed-looking chunk with all the text and the last chunk's finish reason."""
+    chunks = list(chunks)
+    last = chunks[-1]
+    last.text = "".join(c.text for c in chunks)
+    return last
@@ -0,0 +1,70 @@
+import os
+
+import docprocess_journal
+from docprocess_journal import DONE, FAILED, STARTED, JobJournal
+
+
+def _files(tmp_path):
+    source = tmp_path / "Doc_r.pdf"
+    output = tmp_path / "Doc_o.pdf"
+    source.write_bytes(b"%PDF-1.7 first scan")
+    return source, output
+
+
+def test_should_skip_without_a_record_trusts_an_existing_output(tmp_path):
+    journal = JobJournal(tmp_path / 'y_logs')
+    source, output = _files(tmp_path)
+    assert not journal.should_skip('Doc', 'clean', output, input_path=source)   # No output yet
+    output.write_bytes(b"from before the journal")
+    assert journal.should_skip('Doc', 'clean', output, input_path=source)
+
+
+def test_started_or_failed_output_is_redone(tmp_path):
+    journal = JobJournal(tmp_path / 'y_logs')
+    source, output = _files(tmp_path)
+    output.write_bytes(b"half written by a run that crashed")
+    journal.record('Doc', 'clean', STARTED, input_path=source)
+    assert not journal.should_skip('Doc', 'clean', output, input_path=source)
+    journal.record('Doc', 'clean', FAILED, input_path=source, error='boom')
+    assert not journal.should_skip('Doc', 'clean', output, input_path=source)
+
+
+def test_changed_input_is_redone(tmp_path):
+    journal = JobJournal(tmp_path / 'y_logs')
+    source, output = _files(tmp_path)
+    output.write_bytes(b"ocr output")
+    journal.record('Doc', 'clean', DONE, input_path=source)
+    assert journal.should_skip('Doc', 'clean', output, input_path=source)
+
+    source.write_bytes(b"%PDF-1.7 a rescan with different bytes")
+    assert not journal.should_skip('Doc', 'clean', output, input_path=source)
+    # A fresh process reads the same decision back from disk
+    assert not JobJournal(tmp_path / 'y_logs').should_skip('Doc', 'clean', output, input_path=source)
+
+
+def test_input_hash_cache_is_keyed_on_size_and_mtime(tmp_path, monkeypatch):
+    source, _ = _files(tmp_path)
+    JobJournal(tmp_path / 'y_logs').record('Doc', 'clean', DONE, input_path=source)
+
+    hashed = []
+    real_sha256 = docprocess_journal.file_sha256
+    monkeypatch.setattr(docprocess_journal, 'file_sha256', lambda path: hashed.append(path) or real_sha256(path))
+    journal = JobJournal(tmp_path / 'y_logs')     # Cache restored from the journal's input_stat
+    first = journal.input_hash(source)
+    assert hashed == []
+
+    stat = source.stat()
+    source.write_bytes(b"%PDF-1.7 a rescan")          # Different content, new mtime
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert journal.input_hash(source) != first
+    assert len(hashed) == 1
+
+
+def test_line_cut_by_a_crash_is_ignored(tmp_path):
+    journal = JobJournal(tmp_path / 'y_logs')
+    source, output = _files(tmp_path)
+    output.write_bytes(b"ocr output")
+    journal.record('Doc', 'clean', DONE, input_path=source)
+    with open(journal.path, 'a', encoding='utf-8') as f:
+        f.write('{"ts": 1, "file": "Doc", "step": "clean", "sta')
+    assert JobJournal(tmp_path / 'y_logs').should_skip('Doc', 'clean', output, input_path=source)
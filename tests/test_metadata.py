@@ -0,0 +1,25 @@
+from docprocess_metadata import extract_metadata
+
+
+def test_cited_prior_order_date_stays_below_threshold():
+    for text in ("MOTION FOR RELIEF FROM STAY\n"
+                 "Pursuant to the Court's order entered March 3, 2019, Plaintiff moves for relief from the stay\n",
+                 # Wrapped so the cue opens the line, but the sentence runs on
+                 "In the Court's order\n"
+                 "entered March 3, 2019, the Court granted the motion to dismiss in part and denied it in part.\n"):
+        meta = extract_metadata(text)
+        assert meta.date == '20190303'
+        assert meta.date_confidence < 0.8
+
+
+def test_filing_stamp_and_signature_formula_pass_threshold():
+    assert extract_metadata("E-Filed 01/05/2024 10:32 AM\nMOTION TO COMPEL").date_confidence >= 0.8
+    signed = "DONE AND ORDERED in Chambers at Miami, Florida, this 5th day of January, 2024."
+    meta = extract_metadata(signed)
+    assert meta.date == '20240105'
+    assert meta.date_confidence >= 0.8
+
+
+def test_two_cued_mentions_agree():
+    text = "Signed on March 3, 2019 by the clerk and filed on March 3, 2019 with the court"
+    assert extract_metadata(text).date_confidence >= 0.8
@@ -0,0 +1,37 @@
+from corpus import make_document
+
+
+def test_pipeline_upload_writes_phase6_reports(pipeline, tmp_path, monkeypatch):
+    monkeypatch.setenv('DOCPROCESS_FAKE_GCS_ROOT', str(tmp_path / 'gcs'))
+    root = tmp_path / 'case'
+    root.mkdir()
+    pipeline.ensure_directory_structure(root)
+    for i in range(2):
+        make_document(root / '03_doc-clean' / f"20240101_RR_Doc-{i}_o.pdf", 'digital', 2, i)
+
+    pipeline.run_pipeline(root, ['convert', 'format', 'gcs_upload'])
+
+    logs = root / 'y_logs'
+    assert (logs / 'DIRECTORY_STRUCTURE_MANIFEST.txt').exists()
+    catalog = (logs / 'DOCUMENT_CATALOG.txt').read_text(encoding='utf-8')
+    assert 'Total Documents: 2' in catalog
+    (report,) = logs.glob('HEADER_VERIFICATION_*.txt')
+    text = report.read_text(encoding='utf-8')
+    assert text.count('Document: ') == 2
+    assert '[MISMATCH]' not in text and '[MISSING]' not in text
+
+
+def test_phase6_header_verification(pipeline, tmp_path, monkeypatch):
+    monkeypatch.setenv('DOCPROCESS_FAKE_GCS_ROOT', str(tmp_path / 'gcs'))
+    root = tmp_path / 'case'
+    root.mkdir()
+    pipeline.ensure_directory_structure(root)
+    make_document(root / '03_doc-clean' / "20240101_RR_Doc_o.pdf", 'digital', 2, 0)
+    pipeline.run_pipeline(root, ['convert', 'format'])
+
+    pipeline.phase6_gcs_upload(root)
+
+    (report,) = (root / 'y_logs').glob('HEADER_VERIFICATION_*.txt')
+    text = report.read_text(encoding='utf-8')
+    assert '[OK] Convert URL matches' in text and '[OK] Format URL matches' in text
+    assert '[MISMATCH]' not in text
@@ -0,0 +1,60 @@
+import os
+import sys
+
+import docprocess_workers
+from corpus import make_document
+
+# Writes the output in place (open 'wb' on the given path), as ocrmypdf does
+_STUB_OCRMYPDF = """#!{python}
+import shutil, sys
+with open(sys.argv[-2], 'rb') as src, open(sys.argv[-1], 'wb') as dst:
+    shutil.copyfileobj(src, dst)
+"""
+
+
+def _stub_ocrmypdf(tmp_path, monkeypatch):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    stub = bin_dir / 'ocrmypdf'
+    stub.write_text(_STUB_OCRMYPDF.format(python=sys.executable))
+    stub.chmod(0o755)
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    return stub
+
+
+def test_repair_does_not_write_through_linked_clean_pdf(pipeline, tmp_path, monkeypatch):
+    _stub_ocrmypdf(tmp_path, monkeypatch)
+
+    root = tmp_path / 'case'
+    root.mkdir()
+    pipeline.ensure_directory_structure(root)
+    renamed = root / '02_doc-renamed' / "20240101_RR_Doc_r.pdf"
+    clean = root / '03_doc-clean' / "20240101_RR_Doc_o.pdf"
+    make_document(renamed, 'digital', 2, 0)
+    os.link(renamed, clean)
+    before = renamed.read_bytes()
+
+    pipeline.reprocess_pdf_enhanced(root, "20240101_RR_Doc")
+
+    assert renamed.read_bytes() == before
+    assert not os.path.samefile(renamed, clean)
+    assert clean.read_bytes() != before   # The repaired file (metadata cleared) replaced the link
+    assert [p.name for p in clean.parent.glob('*.pdf')] == [clean.name]
+
+
+def test_clean_does_not_write_through_stale_linked_temp(tmp_path, monkeypatch):
+    monkeypatch.setattr(docprocess_workers, 'OCRMYPDF_CMD', str(_stub_ocrmypdf(tmp_path, monkeypatch)))
+    renamed_dir, clean_dir = tmp_path / '02_doc-renamed', tmp_path / '03_doc-clean'
+    renamed_dir.mkdir()
+    clean_dir.mkdir()
+    renamed = renamed_dir / "20240101_RR_Doc_r.pdf"
+    make_document(renamed, 'digital', 2, 0)
+    # Left behind by a crash between materialize() and the rename onto _o.pdf
+    os.link(renamed, clean_dir / "20240101_RR_Doc_o_temp.pdf")
+    before = renamed.read_bytes()
+
+    result = docprocess_workers.process_clean_pdf(renamed, clean_dir, compress=False)
+
+    assert result.status == 'OK'
+    assert renamed.read_bytes() == before
+    assert not os.path.samefile(renamed, clean_dir / "20240101_RR_Doc_o.pdf")
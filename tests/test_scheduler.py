@@ -0,0 +1,44 @@
+from docprocess_scheduler import PipelineScheduler, Stage
+from docprocess_workers import ProcessingResult
+
+
+def _work(item):
+    return ProcessingResult(file_name=item, status='OK')
+
+
+def _is_done(item):
+    if item == 'unreadable':
+        raise OSError("Permission denied")
+    return False
+
+
+def test_hook_error_fails_one_item_and_the_run_continues():
+    recorded = []
+
+    def on_result(item, stage, result):
+        recorded.append((item, stage, result.status))
+        if result.status == 'FAILED':
+            raise OSError("journal hash failed too")
+
+    stages = [Stage(name='clean', func=_work, workers=2),
+              Stage(name='convert', func=_work, workers=2, is_done=_is_done)]
+    results = PipelineScheduler(stages, on_result=on_result).run(['a', 'unreadable', 'b'])
+
+    assert [(s, r.status) for s, r in results['a']] == [('clean', 'OK'), ('convert', 'OK')]
+    assert [(s, r.status) for s, r in results['b']] == [('clean', 'OK'), ('convert', 'OK')]
+    (clean, convert) = results['unreadable']
+    assert clean[1].status == 'OK'
+    assert convert[0] == 'convert' and convert[1].status == 'FAILED'
+    assert 'Permission denied' in convert[1].error
+    assert ('unreadable', 'convert', 'FAILED') in recorded
+
+
+def test_make_args_error_on_first_stage():
+    def make_args(item):
+        if item == 'bad':
+            raise ValueError("no header")
+        return (item,)
+
+    results = PipelineScheduler([Stage(name='format', func=_work, make_args=make_args)]).run(['bad', 'good'])
+    assert results['bad'][0][1].status == 'FAILED'
+    assert results['good'][0][1].status == 'OK'
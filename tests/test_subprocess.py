@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+from docprocess_subprocess import MEMORY_MB_ENV, memory_limit_mb, run_managed
+
+
+def test_no_address_space_cap_by_default(monkeypatch):
+    monkeypatch.delenv(MEMORY_MB_ENV, raising=False)
+    assert memory_limit_mb() == 0
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux') or not os.path.exists('/proc/self/limits'),
+                    reason="prlimit caps are Linux-only")
+def test_opt_in_cap_reaches_the_tool(monkeypatch):
+    monkeypatch.setenv(MEMORY_MB_ENV, '4096')
+    # The cap lands just after the start, so read the limits after a moment
+    result = run_managed(['sh', '-c', 'sleep 0.5; cat /proc/$$/limits'], timeout=30)
+    assert result.ok
+    (line,) = [l for l in result.stdout.splitlines() if l.startswith('Max address space')]
+    assert str(4096 * 1024 * 1024) in line
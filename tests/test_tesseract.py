@@ -0,0 +1,63 @@
+import fitz
+
+from docprocess_tesseract import overlay_ocr_pdf, overlay_text_layers
+
+TEXT_LINE = "The Court has reviewed the motion and the record in this case."
+SCAN_LINE = "Scanned exhibit page recognized by OCR for the text layer."
+
+
+def _mixed_pdf(path):
+    """Page 1 has a text layer, page 2 is an image only."""
+    doc = fitz.open()
+    page = doc.new_page()
+    for i in range(3):
+        page.insert_text((72, 72 + 20 * i), TEXT_LINE)
+    scan = fitz.open()
+    source = scan.new_page()
+    source.insert_text((72, 72), SCAN_LINE)
+    pix = source.get_pixmap(dpi=72)
+    doc.new_page().insert_image(doc[1].rect, pixmap=pix)
+    doc.save(str(path))
+
+
+def _ocr_copy(path, with_images=False):
+    """What OCR of the rendered pages yields: every page's text as an invisible layer."""
+    doc = fitz.open()
+    for line in (TEXT_LINE, SCAN_LINE):
+        page = doc.new_page()
+        if with_images:
+            page.insert_image(page.rect, pixmap=fitz.Pixmap(fitz.csGRAY, fitz.IRect(0, 0, 8, 8), False))
+        for i in range(3 if line == TEXT_LINE else 1):
+            page.insert_text((72, 72 + 20 * i), line, render_mode=3)
+    doc.save(str(path))
+
+
+def _assert_no_duplicates(doc):
+    assert doc[0].get_text().count(TEXT_LINE) == 3
+    assert doc[1].get_text().count(SCAN_LINE) == 1
+
+
+def test_text_layers_skip_pages_with_text(tmp_path):
+    _mixed_pdf(tmp_path / 'mixed.pdf')
+    _ocr_copy(tmp_path / 'ocr.pdf')
+    layers = {}
+    with fitz.open(str(tmp_path / 'ocr.pdf')) as ocr:
+        for index in range(ocr.page_count):
+            single = fitz.open()
+            single.insert_pdf(ocr, from_page=index, to_page=index)
+            layers[index] = tmp_path / f"page{index}.pdf"
+            single.save(str(layers[index]))
+
+    with fitz.open(str(tmp_path / 'mixed.pdf')) as doc:
+        assert overlay_text_layers(doc, layers) == 1
+        _assert_no_duplicates(doc)
+
+
+def test_ocr_pdf_overlay_skips_pages_with_text(tmp_path):
+    _mixed_pdf(tmp_path / 'mixed.pdf')
+    _ocr_copy(tmp_path / 'ocr.pdf', with_images=True)
+
+    with fitz.open(str(tmp_path / 'mixed.pdf')) as doc:
+        assert overlay_ocr_pdf(doc, tmp_path / 'ocr.pdf') == 1
+        _assert_no_duplicates(doc)
+        assert len(doc[1].get_images()) == 1   # Only the scan's own image, none from the OCR copy
@@ -0,0 +1,58 @@
+import http.server
+import threading
+import time
+
+import pytest
+
+import docprocess_tracing as tracing
+
+
+class _SlowFailingCollector(http.server.BaseHTTPRequestHandler):
+    requests = 0
+
+    def do_POST(self):
+        type(self).requests += 1
+        self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(1.0)
+        self.send_response(503)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def collector(monkeypatch):
+    server = http.server.HTTPServer(('127.0.0.1', 0), _SlowFailingCollector)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.delenv(tracing.RUN_ID_ENV, raising=False)
+    monkeypatch.setattr(tracing, '_otlp_failed', False)
+    yield f"http://127.0.0.1:{server.server_port}/v1/traces"
+    tracing._drain()
+    tracing.configure()
+    server.shutdown()
+
+
+def test_otlp_export_is_off_the_critical_path(collector):
+    tracing.configure(otlp_endpoint=collector)
+    started = time.monotonic()
+    for i in range(3):
+        with tracing.span('clean', document=f"doc-{i}"):
+            pass
+    assert time.monotonic() - started < 0.5      # The collector takes 1s per post
+    tracing._drain()
+    assert _SlowFailingCollector.requests == 1   # Gave up after the first failure
+    with tracing.span('clean', document='doc-3'):
+        pass
+    assert _SlowFailingCollector.requests == 1
+
+
+def test_document_trace_id_differs_between_runs(monkeypatch, tmp_path):
+    monkeypatch.delenv(tracing.RUN_ID_ENV, raising=False)
+    tracing.configure(trace_file=tmp_path / 'a.jsonl')
+    first = tracing.document_trace_id('20240101_RR_Doc')
+    assert first == tracing.document_trace_id('20240101_RR_Doc')   # Stable within a run
+    monkeypatch.delenv(tracing.RUN_ID_ENV)
+    tracing.configure(trace_file=tmp_path / 'b.jsonl')
+    assert tracing.document_trace_id('20240101_RR_Doc') != first
+    tracing.configure()